@@ -7,7 +7,8 @@ This package contains the modular components of the Werewolf Game client GUI.
 # Import main components to make them accessible from GUI package
 from .main_window import WerewolfClient
 from .network_worker import NetworkWorker
-from .panels import create_connection_panel, create_game_info_panel, create_chat_panel
+from .replay_player import ReplayPlayer
+from .panels import create_connection_panel, create_replay_panel, create_game_info_panel, create_chat_panel
 from .dialogs import (show_vote_dialog, show_night_vote_dialog, show_night_action_dialog,
                      show_witch_dialog, witch_action, witch_select_target, 
                      show_seer_dialog, show_hunter_dialog)
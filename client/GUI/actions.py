@@ -32,9 +32,14 @@ def hunter_shoot_player(self, player_name):
     self.network_worker.send_message(MessageType.HUNTER_SHOOT.value, player_name)
     self.add_chat_message("HUNTER", f"You shot {player_name}", "#ff9f43")
 
-def whisper_to_player(self, player_name):
-    # Feature to implement later
-    self.add_chat_message("SYSTEM", f"Private messages are not implemented yet", "#ff6b6b")
+def whisper_to_player(self, player_name, message=None):
+    player_name = player_name.split(" (")[0]  # Drop annotations such as "(mort)"
+    if message is None:
+        message, ok = QInputDialog.getText(self, "Private message", f"Message to {player_name}:")
+        if not ok or not message.strip():
+            return
+    self.network_worker.send_message(MessageType.WHISPER.value, f"{player_name}|{message}")
+    self.add_chat_message("WHISPER", f"To {player_name}: {message}", "#c56cf0")
 
 def show_player_context_menu(self, position):
         menu = QMenu()
@@ -67,7 +72,7 @@ def show_player_context_menu(self, position):
                 shoot_action = menu.addAction(f"🔫 Shoot {player_name}")
                 shoot_action.triggered.connect(lambda: self.hunter_shoot_player(player_name))
             
-        # Private message action (feature to implement later)
+        # Private message action
         whisper_action = menu.addAction(f"💬 Private message to {player_name}")
         whisper_action.triggered.connect(lambda: self.whisper_to_player(player_name))
         
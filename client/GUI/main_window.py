@@ -1,23 +1,36 @@
+import json
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton,
                              QLineEdit, QTextEdit, QListWidget, QMessageBox,
-                             QSplitter, QHBoxLayout, QScrollArea)
+                             QSplitter, QHBoxLayout, QScrollArea, QFileDialog)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QColor
 from .network_worker import NetworkWorker
-from .utils import add_chat_message, add_to_log, add_to_command_history
+from .replay_player import ReplayPlayer
+from .utils import add_chat_message, add_to_log, add_to_command_history, filter_log
 from .dialogs import show_witch_dialog, show_seer_dialog, show_night_vote_dialog, show_hunter_dialog
 from common.protocol import MessageType
 
 
 class WerewolfClient(QMainWindow):
+    # Helpers from utils.py used as methods (self.add_chat_message, ...)
+    add_chat_message = add_chat_message
+    add_to_log = add_to_log
+    add_to_command_history = add_to_command_history
+    filter_log = filter_log
+
     def __init__(self):
         super().__init__()
         self.network_worker = None
         self.network_thread = None
         self.username = ""
+        self.spectating = False
         self.player_role = ""
         self.game_state = ""
         self.players_list = []
+        # Room directory: room id -> summary
+        self.rooms = {}
+        self.replay_player = None
+        self.replaying = False
         self.init_ui()
         self.setup_network()
 
@@ -29,8 +42,9 @@ class WerewolfClient(QMainWindow):
         main_layout = QVBoxLayout(central_widget)
         
         # Utilisation des fonctions importées de panels.py
-        from .panels import create_connection_panel, create_game_info_panel, create_chat_panel
+        from .panels import create_connection_panel, create_replay_panel, create_game_info_panel, create_chat_panel
         create_connection_panel(self, main_layout)
+        create_replay_panel(self, main_layout)
         
         # Main splitter allowing the user to adjust panel sizes
         main_splitter = QSplitter(Qt.Horizontal)
@@ -71,8 +85,12 @@ class WerewolfClient(QMainWindow):
         if not username:
             QMessageBox.warning(self, "Error", "Please enter a username!")
             return
+        if self.replaying:
+            QMessageBox.warning(self, "Error", "Close the replay before connecting!")
+            return
         self.username = username
-        if self.network_worker.connect_to_server(username):
+        self.spectating = self.spectate_checkbox.isChecked()
+        if self.network_worker.connect_to_server(username, self.spectating):
             self.network_thread.start()
             self.connect_btn.setText("Connecting...")
             self.connect_btn.setEnabled(False)
@@ -83,9 +101,16 @@ class WerewolfClient(QMainWindow):
         self.status_label.setText("Connected")
         self.status_label.setStyleSheet("color: #2ed573;")
         self.connect_btn.setText("Connected")
-        self.set_game_controls_enabled(True)
+        self.open_replay_btn.setEnabled(False)
         from .utils import add_chat_message
+        if self.spectating:
+            # Spectators only watch, keep the game controls disabled
+            self.status_label.setText("Spectating")
+            add_chat_message(self, "SYSTEM", "Connected as a spectator.", "#2ed573")
+            return
+        self.set_game_controls_enabled(True)
         add_chat_message(self, "SYSTEM", "Connected to server successfully!", "#2ed573")
+        self.watch_rooms()
         
         # Add the local player to the list
         if self.username and self.username not in [self.players_list_widget.item(i).text() for i in range(self.players_list_widget.count())]:
@@ -96,6 +121,7 @@ class WerewolfClient(QMainWindow):
         self.status_label.setStyleSheet("color: #ff6b6b;")
         self.connect_btn.setText("Connect")
         self.connect_btn.setEnabled(True)
+        self.open_replay_btn.setEnabled(True)
         self.set_game_controls_enabled(False)
         self.add_chat_message("SYSTEM", "Lost connection to the server!", "#ff6b6b")
 
@@ -103,18 +129,26 @@ class WerewolfClient(QMainWindow):
         color_map = {
             "MSG": "#54a0ff",
             "VOTE": "#ffa502",
+            "VOTE_TALLY": "#ffa502",
             "ROLE": "#ff6348",
             "STATE": "#2ed573",
             "JOIN": "#3742fa",
             "START": "#2ed573",
             "KILL": "#ff3838",
             "NIGHT_MSG": "#ff6b9d",
+            "WHISPER": "#c56cf0",
             "SEER_RESULT": "#9c88ff",
             "WITCH_ACTION": "#ff6348",
             "SEER_ACTION": "#9c88ff",
             "WEREWOLF_ACTION": "#ff6b9d",
             "HUNTER_SHOOT": "#ff9f43",
-            "ROLE_DISTRIBUTION": "#3742fa"
+            "ROLE_DISTRIBUTION": "#3742fa",
+            "SECRET": "#a4b0be",
+            "LEADERBOARD": "#ffd32a",
+            "ROOM": "#3742fa",
+            "ROOMS": "#3742fa",
+            "ROOM_DELTA": "#3742fa",
+            "TOURNAMENT": "#ffd32a"
         }
         color = color_map.get(msg_type, "#ffffff")
 
@@ -138,17 +172,21 @@ class WerewolfClient(QMainWindow):
 
         elif msg_type == "STATE":
             self.game_state = payload
+            if payload in ("day", "night"):
+                self.vote_tally_label.setText("-")
             
             # Traitement spécial pour certains états
             if payload == "villagers_win":
                 self.state_label.setText("Villagers Victory")
                 self.add_chat_message("VICTORY", "🎉 Villagers have won!", "#2ed573")
-                QMessageBox.information(self, "Game Over", "Villagers have won! The werewolves were eliminated.")
+                if not self.replaying:
+                    QMessageBox.information(self, "Game Over", "Villagers have won! The werewolves were eliminated.")
                 
             elif payload == "werewolves_win":
                 self.state_label.setText("Werewolves Victory")
                 self.add_chat_message("VICTORY", "🐺 Werewolves have won!", "#ff3838")
-                QMessageBox.information(self, "Game Over", "Werewolves have won! They devoured all the villagers.")
+                if not self.replaying:
+                    QMessageBox.information(self, "Game Over", "Werewolves have won! They devoured all the villagers.")
                 
             elif payload == "day":
                 self.state_label.setText("Day")
@@ -170,6 +208,72 @@ class WerewolfClient(QMainWindow):
             # Popups are triggered by specific server messages
             self.update_buttons_visibility()
 
+        elif msg_type == "VOTE_TALLY":
+            # Live tally: {"counts": {target: votes}, "voted": [names]}
+            try:
+                tally = json.loads(payload)
+            except ValueError:
+                return
+            counts = sorted(tally.get("counts", {}).items(), key=lambda item: -item[1])
+            text = ", ".join(f"{name}: {count}" for name, count in counts) or "-"
+            text += f" ({len(tally.get('voted', []))} voted)"
+            self.vote_tally_label.setText(text)
+
+        elif msg_type == "ROOM":
+            # Moved to another room: its JOIN messages follow
+            self.players_list_widget.clear()
+            self.player_role = ""
+            self.role_label.setText("Unknown")
+            self.role_desc_label.setText("-")
+            self.vote_tally_label.setText("-")
+            self.add_chat_message("ROOM", f"🚪 You are now in room {payload}", color)
+
+        elif msg_type == "ROOM_DELTA":
+            # {"added": [room, ...], "updated": [room, ...], "removed": [id, ...]}
+            try:
+                delta = json.loads(payload)
+            except ValueError:
+                return
+            for room in delta.get("added", []) + delta.get("updated", []):
+                self.rooms[room["id"]] = room
+            for room_id in delta.get("removed", []):
+                self.rooms.pop(room_id, None)
+            self.render_rooms()
+
+        elif msg_type == "ROOMS":
+            try:
+                listing = json.loads(payload)
+            except ValueError:
+                return
+            lines = [f"{room['id']} - {room['players']}/{room['capacity']} - {room['phase']}"
+                     for room in listing.get("rooms", [])]
+            lines.append(f"Page {listing.get('page', 0) + 1}, {listing.get('total', 0)} rooms")
+            self.add_chat_message("ROOMS", "<br>".join(lines), color)
+
+        elif msg_type == "TOURNAMENT":
+            # {"id", "status", "round", "rounds", "players", "standings": [[name, points, wins, games], ...]}
+            try:
+                info = json.loads(payload)
+            except ValueError:
+                return
+            lines = [f"Tournament {info.get('id')} - {info.get('status')} - round {info.get('round')}/{info.get('rounds')}"
+                     f" - {info.get('players')} players"]
+            lines += [f"{rank}. {name} - {points} pts ({wins}/{games} won)"
+                      for rank, (name, points, wins, games) in enumerate(info.get("standings", []), 1)]
+            self.add_chat_message("TOURNAMENT", "<br>".join(lines), color)
+
+        elif msg_type == "LEADERBOARD":
+            # {"top": [[name, rating, games], ...], "you": [rating, games]}
+            try:
+                board = json.loads(payload)
+            except ValueError:
+                return
+            lines = [f"{rank}. {name} - {rating} ({games} games)"
+                     for rank, (name, rating, games) in enumerate(board.get("top", []), 1)]
+            rating, games = board.get("you", [0, 0])
+            lines.append(f"Your rating: {rating} ({games} games)")
+            self.add_chat_message("LEADERBOARD", "<br>".join(lines), color)
+
         elif msg_type == "WITCH_ACTION":
             # Utilisation de la fonction importée
             from .dialogs import show_witch_dialog
@@ -211,30 +315,16 @@ class WerewolfClient(QMainWindow):
             # Afficher la répartition des rôles
             self.add_chat_message("INFO", f"📊 Role distribution for this game: {payload}", "#3742fa")
             # Show a popup highlighting this information
-            QMessageBox.information(self, "Role distribution",
-                                    f"Here is the role distribution for this game:\n\n{payload}")
+            if not self.replaying:
+                QMessageBox.information(self, "Role distribution",
+                                        f"Here is the role distribution for this game:\n\n{payload}")
                 
         elif msg_type == "KILL":
             # Mark the player as dead in the list
             self.add_chat_message("DEATH", f"☠️ {payload} was eliminated!", "#ff3838")
             
-            # Update the player's status in the list (italic or strikethrough)
-            for i in range(self.players_list_widget.count()):
-                if self.players_list_widget.item(i).text() == payload or self.players_list_widget.item(i).text().startswith(payload + " "):
-                    item = self.players_list_widget.item(i)
-                    # Add a clear indicator to the text
-                    current_text = item.text()
-                    if " (mort)" not in current_text:
-                        item.setText(f"{payload} (mort)")
-                    
-                    # Also apply a visual style
-                    font = item.font()
-                    font.setStrikeOut(True)
-                    font.setItalic(True)
-                    item.setFont(font)
-                    item.setForeground(QColor("#ff3838"))
-                    break
-                    
+            self.mark_player_dead(payload)
+
             # Check if it is us who died
             if payload == self.username:
                 if self.player_role == "chasseur":
@@ -248,14 +338,144 @@ class WerewolfClient(QMainWindow):
             # Handle chat messages
             self.add_chat_message("MSG", payload, color)
             
+        elif msg_type == "WHISPER":
+            # Format: sender|message
+            sender, _, message = payload.partition("|")
+            self.add_chat_message("WHISPER", f"From {sender}: {message}", color)
+
         elif msg_type == "NIGHT_MSG":
             # Werewolf messages during the night
-            if self.player_role == "werewolf":
+            if self.player_role == "werewolf" or self.replaying:
                 self.add_chat_message("LOUPS", f"🐺 {payload}", "#ff6b9d")
             
         else:
             self.add_chat_message(msg_type, payload, color)
 
+    def watch_rooms(self):
+        # (Re)subscribe to the room directory, the server sends the full list first
+        if not self.network_worker or not self.network_worker.running:
+            return
+        self.rooms = {}
+        query = {"open": True} if self.rooms_open_checkbox.isChecked() else {}
+        self.network_worker.send_message(MessageType.ROOMS_WATCH.value, json.dumps(query))
+
+    def render_rooms(self):
+        from PyQt5.QtWidgets import QListWidgetItem
+        self.rooms_list_widget.clear()
+        for room_id in sorted(self.rooms):
+            room = self.rooms[room_id]
+            item = QListWidgetItem(f"{room_id}  {room['players']}/{room['capacity']}  {room['phase']}"
+                                   f"  ({room['settings'].get('night_mode', '')})")
+            item.setData(Qt.UserRole, room_id)
+            self.rooms_list_widget.addItem(item)
+
+    def join_room(self, room_id):
+        if room_id and self.network_worker:
+            self.network_worker.send_message(MessageType.JOIN_ROOM.value, room_id)
+
+    def create_room(self, capacity=""):
+        if self.network_worker:
+            self.network_worker.send_message(MessageType.CREATE_ROOM.value, capacity)
+
+    def mark_player_dead(self, name):
+        # Update the player's status in the list (italic or strikethrough)
+        for i in range(self.players_list_widget.count()):
+            if self.players_list_widget.item(i).text() == name or self.players_list_widget.item(i).text().startswith(name + " "):
+                item = self.players_list_widget.item(i)
+                # Add a clear indicator to the text
+                current_text = item.text()
+                if " (mort)" not in current_text:
+                    item.setText(f"{name} (mort)")
+
+                # Also apply a visual style
+                font = item.font()
+                font.setStrikeOut(True)
+                font.setItalic(True)
+                item.setFont(font)
+                item.setForeground(QColor("#ff3838"))
+                break
+
+    def open_replay(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open replay", "replays", "Replays (*.replay)")
+        if not path:
+            return
+        self.close_replay()
+        try:
+            self.replay_player = ReplayPlayer(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Unable to open replay: {e}")
+            return
+        self.replaying = True
+        self.username = ""
+        self.replay_player.message_received.connect(self.handle_server_message)
+        self.replay_player.checkpoint_loaded.connect(self.load_replay_checkpoint)
+        self.replay_player.position_changed.connect(self.update_replay_position)
+        self.replay_player.playing_changed.connect(
+            lambda playing: self.replay_play_btn.setText("⏸ Pause" if playing else "▶ Play"))
+        self.replay_player.set_speed(float(self.replay_speed_combo.currentText()[:-1]))
+        self.replay_slider.setRange(0, self.replay_player.event_count)
+        self.replay_controls.setVisible(True)
+        self.connect_btn.setEnabled(False)
+        self.status_label.setText("Replay")
+        self.replay_player.seek(0)
+
+    def close_replay(self):
+        if not self.replay_player:
+            return
+        self.replay_player.close()
+        self.replay_player = None
+        self.replaying = False
+        self.replay_controls.setVisible(False)
+        self.connect_btn.setEnabled(True)
+        self.status_label.setText("Not connected")
+
+    def toggle_replay(self):
+        if not self.replay_player:
+            return
+        if self.replay_player.is_playing():
+            self.replay_player.pause()
+        else:
+            self.replay_player.play()
+
+    def seek_replay(self, index):
+        if self.replay_player and index != self.replay_player.position:
+            self.replay_player.seek(index)
+
+    def replay_slider_changed(self, value):
+        # While dragging, seek only once the slider is released
+        if not self.replay_slider.isSliderDown():
+            self.seek_replay(value)
+
+    def update_replay_position(self, position):
+        player = self.replay_player
+        elapsed = player.replay.event(position - 1)[0] if position else 0.0
+        duration = player.duration
+        self.replay_time_label.setText(f"{int(elapsed) // 60}:{int(elapsed) % 60:02d} / "
+                                       f"{int(duration) // 60}:{int(duration) % 60:02d}")
+        if not self.replay_slider.isSliderDown():
+            self.replay_slider.blockSignals(True)
+            self.replay_slider.setValue(position)
+            self.replay_slider.blockSignals(False)
+
+    def load_replay_checkpoint(self, checkpoint):
+        # Start from the state of the game at the beginning of the phase
+        self.chat_display.clear()
+        self.log_display.clear()
+        self.players_list_widget.clear()
+        for player in checkpoint.get("players", []):
+            role = f" ({player['role']})" if player.get("role") else ""
+            self.players_list_widget.addItem(f"{player['name']}{role}")
+            if not player.get("alive", True):
+                self.mark_player_dead(player["name"])
+        self.game_state = checkpoint.get("phase", "")
+        phase = self.game_state.capitalize()
+        if checkpoint.get("day"):
+            phase += f" {checkpoint['day']}"
+        self.state_label.setText(phase)
+        self.role_label.setText("Replay")
+        self.role_desc_label.setText("You are watching a recorded game, every role is revealed.")
+        self.vote_tally_label.setText("-")
+
     def update_buttons_visibility(self):
         is_alive = True  # Could be improved later
         self.vote_btn.setVisible(self.game_state == "day" and is_alive)
@@ -288,6 +508,9 @@ class WerewolfClient(QMainWindow):
         elif command == "/start":
             self.network_worker.send_message(MessageType.START.value, "")
             self.add_chat_message("COMMANDE", "Starting game", "#2ed573")
+        elif command == "/rematch" or command == "/rematch deal":
+            self.network_worker.send_message(MessageType.REMATCH.value, command[len("/rematch"):].strip())
+            self.add_chat_message("COMMANDE", "Asking for a rematch", "#2ed573")
         elif command == "/restart":
             self.network_worker.send_message(MessageType.RESTART.value, "")
             self.add_chat_message("COMMANDE", "Restarting game", "#2ed573")
@@ -319,9 +542,27 @@ class WerewolfClient(QMainWindow):
                 target = parts[1]
                 msg = parts[2]
                 from .actions import whisper_to_player
-                whisper_to_player(self, target)
+                whisper_to_player(self, target, msg)
             else:
                 self.add_chat_message("ERREUR", "Format incorrect. Utilisez /whisper <joueur> <message>", "#ff6b6b")
+        elif command == "/queue" or command.startswith("/queue "):
+            size = command[len("/queue"):].strip()
+            self.network_worker.send_message(MessageType.QUEUE.value, size)
+        elif command == "/unqueue":
+            self.network_worker.send_message(MessageType.QUEUE.value, "cancel")
+        elif command == "/rooms" or command.startswith("/rooms "):
+            # /rooms [page]
+            page = command[len("/rooms"):].strip()
+            query = {"page": int(page) - 1 if page.isdigit() and int(page) > 0 else 0}
+            self.network_worker.send_message(MessageType.ROOMS.value, json.dumps(query))
+        elif command.startswith("/join_room "):
+            self.join_room(command.split(" ", 1)[1])
+        elif command == "/create_room" or command.startswith("/create_room "):
+            self.create_room(command[len("/create_room"):].strip())
+        elif command in ("/tournament", "/tournament register", "/tournament leave"):
+            self.network_worker.send_message(MessageType.TOURNAMENT.value, command[len("/tournament"):].strip())
+        elif command == "/leaderboard":
+            self.network_worker.send_message(MessageType.LEADERBOARD.value, "")
         elif command == "/help":
             from .utils import show_help
             show_help(self)
@@ -339,8 +580,13 @@ class WerewolfClient(QMainWindow):
         if reply == QMessageBox.Yes and self.network_worker:
             self.network_worker.send_message(MessageType.RESTART.value, "")
 
+    def rematch_game(self):
+        if self.network_worker:
+            self.network_worker.send_message(MessageType.REMATCH.value, "deal")
+
     def set_game_controls_enabled(self, enabled):
             self.start_btn.setEnabled(enabled)
+            self.rematch_btn.setEnabled(enabled)
             self.vote_btn.setEnabled(enabled)
             self.night_vote_btn.setEnabled(enabled)
             self.restart_btn.setEnabled(enabled)
@@ -353,6 +599,7 @@ class WerewolfClient(QMainWindow):
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
                                       
         if reply == QMessageBox.Yes:
+            self.close_replay()
             if self.network_worker:
                 self.network_worker.disconnect()
             if self.network_thread and self.network_thread.isRunning():
@@ -23,11 +23,12 @@ class NetworkWorker(QObject):
     # Server configuration
     SERVER_PORT = 3001
     
-    def connect_to_server(self, username):
+    def connect_to_server(self, username, spectate=False):
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.sock.connect(("localhost", self.SERVER_PORT))
-            join_msg = encode_message(MessageType.JOIN.value, username)
+            join_type = MessageType.SPECTATE if spectate else MessageType.JOIN
+            join_msg = encode_message(join_type.value, username)
             self.sock.sendall(join_msg.encode())
             self.running = True
             self.connected.emit()
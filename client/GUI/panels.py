@@ -9,6 +9,9 @@ def create_connection_panel(self, parent_layout):
     self.username_input = QLineEdit()
     self.username_input.setPlaceholderText("Enter your name...")
     conn_layout.addWidget(self.username_input)
+    self.spectate_checkbox = QCheckBox("Spectate")
+    self.spectate_checkbox.setToolTip("Watch the game without playing")
+    conn_layout.addWidget(self.spectate_checkbox)
     self.connect_btn = QPushButton("Connect")
     self.connect_btn.clicked.connect(self.connect_to_server)
     conn_layout.addWidget(self.connect_btn)
@@ -18,6 +21,41 @@ def create_connection_panel(self, parent_layout):
     parent_layout.addWidget(conn_frame)
 
 
+def create_replay_panel(self, parent_layout):
+    replay_frame = QFrame()
+    replay_layout = QHBoxLayout(replay_frame)
+    self.open_replay_btn = QPushButton("📼 Open Replay")
+    self.open_replay_btn.setToolTip("Watch a recorded game")
+    self.open_replay_btn.clicked.connect(self.open_replay)
+    replay_layout.addWidget(self.open_replay_btn)
+
+    # Playback controls, hidden until a replay is opened
+    self.replay_controls = QWidget()
+    controls_layout = QHBoxLayout(self.replay_controls)
+    controls_layout.setContentsMargins(0, 0, 0, 0)
+    self.replay_play_btn = QPushButton("▶ Play")
+    self.replay_play_btn.clicked.connect(self.toggle_replay)
+    controls_layout.addWidget(self.replay_play_btn)
+    self.replay_slider = QSlider(Qt.Horizontal)
+    self.replay_slider.valueChanged.connect(self.replay_slider_changed)
+    self.replay_slider.sliderReleased.connect(lambda: self.seek_replay(self.replay_slider.value()))
+    controls_layout.addWidget(self.replay_slider, 1)
+    self.replay_time_label = QLabel("0:00 / 0:00")
+    controls_layout.addWidget(self.replay_time_label)
+    self.replay_speed_combo = QComboBox()
+    self.replay_speed_combo.addItems(["0.5x", "1x", "2x", "4x", "8x", "16x"])
+    self.replay_speed_combo.setCurrentText("1x")
+    self.replay_speed_combo.currentTextChanged.connect(
+        lambda text: self.replay_player and self.replay_player.set_speed(float(text[:-1])))
+    controls_layout.addWidget(self.replay_speed_combo)
+    close_btn = QPushButton("Close")
+    close_btn.clicked.connect(self.close_replay)
+    controls_layout.addWidget(close_btn)
+    self.replay_controls.setVisible(False)
+    replay_layout.addWidget(self.replay_controls, 1)
+    parent_layout.addWidget(replay_frame)
+
+
 def create_game_info_panel(self, parent_layout):
     # Informations du jeu - cadre avec un titre stylisé
     info_group = QGroupBox("📋 Information")
@@ -34,6 +72,12 @@ def create_game_info_panel(self, parent_layout):
     self.state_label = QLabel("Waiting")
     self.state_label.setStyleSheet("font-weight: bold; color: #3742fa; font-size: 14px;")
     status_layout.addWidget(self.state_label, 1, 1)
+
+    status_layout.addWidget(QLabel("Votes:"), 2, 0)
+    self.vote_tally_label = QLabel("-")
+    self.vote_tally_label.setWordWrap(True)
+    self.vote_tally_label.setStyleSheet("color: #ffa502;")
+    status_layout.addWidget(self.vote_tally_label, 2, 1)
     info_layout.addLayout(status_layout)
     
     # Description du rôle avec plus de détails selon le rôle
@@ -64,8 +108,14 @@ def create_game_info_panel(self, parent_layout):
     self.restart_btn.clicked.connect(self.restart_game)
     self.restart_btn.setStyleSheet("background-color: #ff7f50; font-weight: bold;")
     
+    self.rematch_btn = QPushButton("Rematch")
+    self.rematch_btn.setToolTip("Play again with the same players once the game is over")
+    self.rematch_btn.clicked.connect(self.rematch_game)
+    self.rematch_btn.setStyleSheet("background-color: #54a0ff; font-weight: bold;")
+
     # Add the buttons to the layout
     action_layout.addWidget(self.start_btn)
+    action_layout.addWidget(self.rematch_btn)
     action_layout.addWidget(self.restart_btn)
     info_layout.addWidget(action_box)
 
@@ -211,6 +261,42 @@ def create_chat_panel(self, parent_layout):
     
     # Ajout de l'onglet journal
     chat_tabs.addTab(log_widget, "Log")
+
+    # Room directory tab, kept up to date by ROOM_DELTA messages
+    rooms_widget = QWidget()
+    rooms_layout = QVBoxLayout(rooms_widget)
+
+    rooms_title = QLabel("🏠 Rooms")
+    rooms_title.setStyleSheet("font-size: 14px; font-weight: bold;")
+    rooms_layout.addWidget(rooms_title)
+
+    self.rooms_open_checkbox = QCheckBox("Only rooms with free seats")
+    self.rooms_open_checkbox.setChecked(True)
+    self.rooms_open_checkbox.toggled.connect(lambda: self.watch_rooms())
+    rooms_layout.addWidget(self.rooms_open_checkbox)
+
+    self.rooms_list_widget = QListWidget()
+    self.rooms_list_widget.setStyleSheet("background-color: #2f3542; color: #f1f2f6; border-radius: 5px;")
+    self.rooms_list_widget.itemDoubleClicked.connect(lambda item: self.join_room(item.data(Qt.UserRole)))
+    rooms_layout.addWidget(self.rooms_list_widget)
+
+    rooms_btn_layout = QHBoxLayout()
+    refresh_rooms_btn = QPushButton("Refresh")
+    refresh_rooms_btn.clicked.connect(lambda: self.watch_rooms())
+    rooms_btn_layout.addWidget(refresh_rooms_btn)
+    join_room_btn = QPushButton("Join")
+    join_room_btn.clicked.connect(lambda: self.rooms_list_widget.currentItem() and
+                                  self.join_room(self.rooms_list_widget.currentItem().data(Qt.UserRole)))
+    rooms_btn_layout.addWidget(join_room_btn)
+    create_room_btn = QPushButton("Create room")
+    create_room_btn.clicked.connect(lambda: self.create_room())
+    rooms_btn_layout.addWidget(create_room_btn)
+    lobby_btn = QPushButton("Back to lobby")
+    lobby_btn.clicked.connect(lambda: self.join_room("main"))
+    rooms_btn_layout.addWidget(lobby_btn)
+    rooms_layout.addLayout(rooms_btn_layout)
+
+    chat_tabs.addTab(rooms_widget, "Rooms")
     
     # Game rules tab for quick reference
     rules_widget = QWidget()
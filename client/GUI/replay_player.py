@@ -0,0 +1,97 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+import time
+import sys
+import os
+
+# Add parent directory to path to allow imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from common.replay import ReplayFile
+
+
+class ReplayPlayer(QObject):
+    """
+    Plays a recorded game back through the same signal the network worker uses.
+    Events are read lazily from the memory-mapped file, seeking loads the
+    checkpoint of the phase containing the target and replays from there.
+    """
+    message_received = pyqtSignal(str, str)
+    checkpoint_loaded = pyqtSignal(dict)
+    position_changed = pyqtSignal(int)
+    playing_changed = pyqtSignal(bool)
+
+    TICK_MS = 30
+    # Cap per tick so fast playback never freezes the window
+    MAX_EVENTS_PER_TICK = 200
+
+    def __init__(self, path):
+        super().__init__()
+        self.replay = ReplayFile(path)
+        self.position = 0
+        self.clock = 0.0
+        self.speed = 1.0
+        self.last_tick = 0.0
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+
+    @property
+    def event_count(self):
+        return self.replay.event_count
+
+    @property
+    def duration(self):
+        if not self.replay.event_count:
+            return 0.0
+        return self.replay.event(self.replay.event_count - 1)[0]
+
+    def is_playing(self):
+        return self.timer.isActive()
+
+    def play(self):
+        if self.position >= self.replay.event_count:
+            self.seek(0)
+        self.last_tick = time.monotonic()
+        self.timer.start(self.TICK_MS)
+        self.playing_changed.emit(True)
+
+    def pause(self):
+        self.timer.stop()
+        self.playing_changed.emit(False)
+
+    def set_speed(self, speed):
+        self.speed = speed
+
+    def tick(self):
+        now = time.monotonic()
+        self.clock += (now - self.last_tick) * self.speed
+        self.last_tick = now
+        sent = 0
+        while self.position < self.replay.event_count and sent < self.MAX_EVENTS_PER_TICK:
+            t, msg_type, payload, _ = self.replay.event(self.position)
+            if t > self.clock:
+                break
+            self.message_received.emit(msg_type, payload)
+            self.position += 1
+            sent += 1
+        if sent:
+            self.position_changed.emit(self.position)
+        if self.position >= self.replay.event_count:
+            self.pause()
+
+    def seek(self, index):
+        """Jump to event `index`: load the nearest phase checkpoint, then replay up to it."""
+        index = max(0, min(index, self.replay.event_count))
+        phase = self.replay.phase_of_event(index) if self.replay.phase_count else None
+        first = 0
+        if phase is not None:
+            first = self.replay.phase(phase)[2]
+            self.checkpoint_loaded.emit(self.replay.checkpoint(phase))
+        for _, msg_type, payload, _ in self.replay.events(first, index):
+            self.message_received.emit(msg_type, payload)
+        self.position = index
+        self.clock = self.replay.event(index - 1)[0] if index else 0.0
+        self.position_changed.emit(self.position)
+
+    def close(self):
+        self.timer.stop()
+        self.replay.close()
@@ -31,7 +31,8 @@ def show_help(self):
         "/vote <player> - Vote against a player (day)\n"
         "/nvote <player> - Vote against a player (night, werewolf)\n"
         "/start - Start the game\n"
-        "/restart - Restart the game\n\n"
+        "/restart - Restart the game\n"
+        "/rematch [deal] - Play again with the same players (deal: start right away)\n\n"
 
         "Role commands:\n"
         "/seer <player> - Inspect a player (seer)\n"
@@ -43,6 +44,13 @@ def show_help(self):
         "Other commands:\n"
         "/nmsg <message> - Send a night message\n"
         "/whisper <player> <message> - Send a private message to a player\n"
+        "/leaderboard - Show the best rated players\n"
+        "/queue [6|8|10|12] - Wait for a match (any room size by default)\n"
+        "/unqueue - Leave the matchmaking queue\n"
+        "/rooms [page] - List the rooms\n"
+        "/join_room <room> - Move to a room (main is the lobby)\n"
+        "/create_room [capacity] - Open a new room\n"
+        "/tournament [register|leave] - Tournament standings, or (un)register\n"
         "/help - Show this help"
     )
     QMessageBox.information(self, "Help", help_text)
@@ -1,21 +1,113 @@
+import select
+import threading
 from enum import Enum
 
 class MessageType(Enum):
     JOIN = "JOIN"
+    SPECTATE = "SPECTATE"
     MSG = "MSG"
     STATE = "STATE"
     ROLE = "ROLE"
     START = "START"
     VOTE = "VOTE"
+    VOTE_TALLY = "VOTE_TALLY"
     KILL = "KILL"
     RESTART = "RESTART"
+    REMATCH = "REMATCH"
     NIGHT_VOTE = "NIGHT_VOTE"
     NIGHT_MSG = "NIGHT_MSG"
+    WHISPER = "WHISPER"
     WITCH_ACTION = "WITCH_ACTION"
     SEER_ACTION = "SEER_ACTION"
     SEER_RESULT = "SEER_RESULT"
     HUNTER_SHOOT = "HUNTER_SHOOT"
     ROLE_DISTRIBUTION = "ROLE_DISTRIBUTION"
+    LEADERBOARD = "LEADERBOARD"
+    ROOM = "ROOM"
+    QUEUE = "QUEUE"
+    ROOMS = "ROOMS"
+    ROOMS_WATCH = "ROOMS_WATCH"
+    ROOM_DELTA = "ROOM_DELTA"
+    CREATE_ROOM = "CREATE_ROOM"
+    JOIN_ROOM = "JOIN_ROOM"
+    TOURNAMENT = "TOURNAMENT"
+
+# Longest frame (message type, separator and payload) accepted from a peer, in bytes
+MAX_FRAME_SIZE = 4096
+
+
+class FrameTooLarge(Exception):
+    """Raised when a peer sends a frame longer than the allowed maximum."""
+
+
+class FrameReader:
+    """
+    Split a socket byte stream into newline-terminated frames.
+    The internal buffer never grows past `max_frame_size` plus one receive chunk,
+    so a peer streaming data without a newline cannot make us allocate more.
+
+    A reader can be parked (see `park`): it then stops receiving and handing
+    out frames, so its buffer holds everything read from the peer and not
+    handled yet.
+    """
+
+    def __init__(self, conn, max_frame_size=MAX_FRAME_SIZE, chunk_size=1024, poll_interval=0.2):
+        self.conn = conn
+        self.max_frame_size = max_frame_size
+        self.chunk_size = chunk_size
+        # Longest wait for data before checking whether the reader was parked
+        self.poll_interval = poll_interval
+        self.buffer = bytearray()
+        self.cond = threading.Condition()
+        self.parked = False
+        # True from the moment a frame is handed out until the next read_frame call
+        self.busy = False
+
+    def read_frame(self):
+        """
+        Return the next frame as a string (without the newline), or None when
+        the peer closed the connection. Raise FrameTooLarge on oversize frames.
+        Calling it again means the previous frame has been handled.
+        """
+        with self.cond:
+            self.busy = False
+            self.cond.notify_all()
+        while True:
+            with self.cond:
+                while self.parked:
+                    self.cond.wait()
+                index = self.buffer.find(b"\n")
+                if index != -1:
+                    if index > self.max_frame_size:
+                        raise FrameTooLarge(index)
+                    frame = bytes(self.buffer[:index])
+                    del self.buffer[:index + 1]
+                    self.busy = True
+                    return frame.decode(errors="replace")
+                if len(self.buffer) > self.max_frame_size:
+                    raise FrameTooLarge(len(self.buffer))
+                readable, _, _ = select.select([self.conn], [], [], self.poll_interval)
+                if not readable:
+                    continue
+                data = self.conn.recv(self.chunk_size)
+                if not data:
+                    return None
+                self.buffer += data
+
+    def park(self, timeout=None):
+        """
+        Stop receiving and handing out frames. Return True once the frame
+        being handled, if any, is done, or False if it is not within `timeout`.
+        """
+        with self.cond:
+            self.parked = True
+            return self.cond.wait_for(lambda: not self.busy, timeout)
+
+    def unpark(self):
+        with self.cond:
+            self.parked = False
+            self.cond.notify_all()
+
 
 def encode_message(msg_type, payload):
     return f"{msg_type}|{payload}\n"
@@ -0,0 +1,213 @@
+"""Replay file format, shared by the server (writer) and the client (reader).
+
+Layout, all integers little-endian:
+
+    header     "<4sHHIIQQQd"  magic b"WWRP", version, flags, phase count,
+                              event count, phase index offset, event records
+                              offset, string heap offset, game start time
+    phase index  PHASE_ENTRY per phase, in game order
+    event records  EVENT_RECORD per event, fixed size
+    string heap  UTF-8 frames ("TYPE|payload") and JSON checkpoints
+
+Phases alternate setup, night 1, day 1, night 2, ... so the entry of
+"night 3" sits at a known position and can be read in O(1). Each phase
+entry points at its first event and at a checkpoint (players, roles and
+who is alive when the phase starts) so a viewer can seek without replaying
+the whole game. Event records have a fixed size, so event i is at
+records_offset + i * EVENT_RECORD.size, and the reader maps the file with
+mmap instead of loading it. The writer (ReplaySpool) spools records and
+strings to disk as the game goes, so it doesn't hold the game in memory either.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import struct
+
+MAGIC = b"WWRP"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHIIQQQd")
+# kind, day, first event, event count, checkpoint offset, checkpoint length
+PHASE_ENTRY = struct.Struct("<BxHIIII")
+# time since start, frame offset, frame length, flags
+EVENT_RECORD = struct.Struct("<dIIB3x")
+
+SETUP = 0
+NIGHT = 1
+DAY = 2
+END = 3
+PHASE_KINDS = {"setup": SETUP, "night": NIGHT, "day": DAY, "end": END}
+PHASE_NAMES = {v: k for k, v in PHASE_KINDS.items()}
+
+# Event flags
+SECRET = 1  # Not visible to players at the time (roles, night actions, wolf chat)
+
+
+def phase_position(kind, day):
+    """Index of a phase in the phase table, from its kind and day number."""
+    if kind == SETUP:
+        return 0
+    if kind == NIGHT:
+        return 2 * day - 1
+    return 2 * day
+
+
+class ReplaySpool:
+    """
+    Builds a replay file one phase at a time: event records and strings are
+    appended to two spool files next to `path` as phases end, and only the
+    phase index stays in memory until finish() assembles the file.
+    `phases`, `event_count` and `strings_size` go on with a spool saved by state().
+    """
+
+    def __init__(self, path, start_time, phases=(), event_count=0, strings_size=0):
+        self.path = path
+        self.start_time = start_time
+        # (kind, day, first event, checkpoint offset, checkpoint length)
+        self.phases = [tuple(phase) for phase in phases]
+        self.event_count = event_count
+        self.strings_size = strings_size
+        self.records = open(path + ".records", "ab")
+        self.strings = open(path + ".strings", "ab")
+        # Drop whatever was written after the saved state
+        self.records.truncate(event_count * EVENT_RECORD.size)
+        self.strings.truncate(strings_size)
+
+    def _intern(self, text):
+        data = text.encode()
+        offset = self.strings_size
+        self.strings.write(data)
+        self.strings_size += len(data)
+        return offset, len(data)
+
+    def add_events(self, events):
+        """Append (seconds since start, frame, flags) events."""
+        for t, frame, flags in events:
+            offset, length = self._intern(frame)
+            self.records.write(EVENT_RECORD.pack(t, offset, length, flags))
+        self.event_count += len(events)
+        self.records.flush()
+        self.strings.flush()
+
+    def add_phase(self, kind, day, checkpoint):
+        """Start a phase at the next event."""
+        offset, length = self._intern(json.dumps(checkpoint, separators=(",", ":")))
+        self.phases.append((kind, day, self.event_count, offset, length))
+
+    def state(self):
+        """Plain copy of what is needed to go on with this spool."""
+        return {"phases": list(self.phases), "events": self.event_count, "strings": self.strings_size}
+
+    def finish(self):
+        """Write the replay file and remove the spool files."""
+        self.records.close()
+        self.strings.close()
+        index = bytearray()
+        for i, (kind, day, first, offset, length) in enumerate(self.phases):
+            end = self.phases[i + 1][2] if i + 1 < len(self.phases) else self.event_count
+            index += PHASE_ENTRY.pack(kind, day, first, end - first, offset, length)
+
+        index_offset = HEADER.size
+        records_offset = index_offset + len(index)
+        strings_offset = records_offset + self.event_count * EVENT_RECORD.size
+        header = HEADER.pack(MAGIC, VERSION, 0, len(self.phases), self.event_count,
+                             index_offset, records_offset, strings_offset, self.start_time)
+        with open(self.path, "wb") as f:
+            f.write(header)
+            f.write(index)
+            for part in (self.records.name, self.strings.name):
+                with open(part, "rb") as src:
+                    shutil.copyfileobj(src, f)
+        os.remove(self.records.name)
+        os.remove(self.strings.name)
+
+
+def write_replay(path, start_time, events, phases):
+    """
+    Write a replay file in one go.
+    `events` is a list of (seconds since start, frame, flags).
+    `phases` is a list of (kind, day, first event index, checkpoint dict).
+    """
+    spool = ReplaySpool(path, start_time)
+    for kind, day, first, checkpoint in phases:
+        spool.add_events(events[spool.event_count:first])
+        spool.add_phase(kind, day, checkpoint)
+    spool.add_events(events[spool.event_count:])
+    spool.finish()
+
+
+class ReplayFile:
+    """Read-only, memory-mapped view of a replay file. Events are decoded lazily."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.phase_count, self.event_count, self.index_offset,
+         self.records_offset, self.strings_offset, self.start_time) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a werewolf replay file")
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def _string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.map[start:start + length].decode()
+
+    def phase(self, position):
+        """Return (kind, day, first event, event count) of a phase table entry."""
+        kind, day, first, count, _, _ = PHASE_ENTRY.unpack_from(
+            self.map, self.index_offset + position * PHASE_ENTRY.size)
+        return kind, day, first, count
+
+    def phases(self):
+        for position in range(self.phase_count):
+            yield self.phase(position)
+
+    def find_phase(self, kind, day=0):
+        """Table position of e.g. (NIGHT, 3) in O(1), or None if the game never got there."""
+        position = phase_position(kind, day)
+        if position < self.phase_count:
+            entry = self.phase(position)
+            if entry[0] == kind and entry[1] == day:
+                return position
+        # END can follow either a night or a day
+        if kind == END and self.phase_count:
+            last = self.phase_count - 1
+            if self.phase(last)[0] == END:
+                return last
+        return None
+
+    def checkpoint(self, position):
+        """State of the game when a phase starts: {"players": [...], "phase": ..., "day": ...}."""
+        _, _, _, _, offset, length = PHASE_ENTRY.unpack_from(
+            self.map, self.index_offset + position * PHASE_ENTRY.size)
+        return json.loads(self._string(offset, length))
+
+    def phase_of_event(self, index):
+        """Table position of the phase containing event `index` (binary search)."""
+        low, high = 0, self.phase_count - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.phase(mid)[2] <= index:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    def event(self, index):
+        """Return (seconds since start, msg_type, payload, flags) of event `index`."""
+        t, offset, length, flags = EVENT_RECORD.unpack_from(
+            self.map, self.records_offset + index * EVENT_RECORD.size)
+        msg_type, _, payload = self._string(offset, length).partition("|")
+        return t, msg_type, payload, flags
+
+    def events(self, start=0, stop=None):
+        """Lazily iterate over events [start, stop)."""
+        stop = self.event_count if stop is None else min(stop, self.event_count)
+        for index in range(start, stop):
+            yield self.event(index)
@@ -0,0 +1,297 @@
+"""Server-side bot players.
+
+A BotSeat stands in the room like a connection: the game sends it the same
+frames as to a client (ROLE, SEER_ACTION, WEREWOLF_ACTION, WITCH_ACTION,
+HUNTER_SHOOT, STATE|day, ...) and it answers through the same handlers.
+Bots fill a room short of MIN_PLAYERS when the game starts, and take over
+the seat of a player who disconnects mid-game.
+
+Deciding is done by `decide` in a process pool, from a plain copy of what
+the bot knows, so bot thinking never holds up a room or the other rooms.
+"""
+
+import itertools
+import multiprocessing
+import random
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from common.protocol import decode_message, encode_message
+from server.state import state, bind_room, current_room, in_room
+from server import rooms
+from server.snapshot import rebind_seat, resend_seat
+from utils.network import broadcast
+
+# Prompt frame -> decision kind
+PROMPTS = {
+    "SEER_ACTION": "seer",
+    "WEREWOLF_ACTION": "werewolf",
+    "WITCH_ACTION": "witch",
+    "HUNTER_SHOOT": "hunter",
+}
+
+_bot_numbers = itertools.count(1)
+
+
+# Decisions, run in the worker processes
+
+def decide(kind, view):
+    """
+    Pick the payload a bot answers a prompt with, or None to pass.
+    `view` only holds plain values: it comes from another process.
+    """
+    rng = random.Random(view["seed"])
+    me = view["name"]
+    others = [name for name in view["living"] if name != me]
+    wolves = set(view["wolves"])
+    known = view["known"]
+    votes = Counter(target for voter, target in view["votes"].items() if voter != me and target in others)
+
+    if kind == "seer":
+        unknown = [name for name in others if name not in known]
+        return rng.choice(unknown or others) if others else None
+
+    if kind == "witch":
+        victim = view["victim"]
+        if victim == me or (victim and rng.random() < 0.6):
+            return "witch_save"
+        return "witch_none"
+
+    if kind == "werewolf":
+        prey = [name for name in others if name not in wolves]
+        # Follow the pack when another wolf already chose
+        pack = [target for target, _ in votes.most_common() if target in prey]
+        if pack:
+            return pack[0]
+        return rng.choice(prey) if prey else None
+
+    # Day vote and hunter shot: go for a werewolf if we know one
+    if view["role"] == "werewolf":
+        others = [name for name in others if name not in wolves]
+    nominees = view["nominees"]
+    if nominees:
+        # Final vote of a large room: only the nominees can be voted for
+        others = [name for name in others if name in nominees] or [name for name in nominees if name != me] or nominees
+    suspects = [] if view["role"] == "werewolf" else [name for name in others if known.get(name) == "werewolf"]
+    if suspects:
+        return rng.choice(suspects)
+    if votes and rng.random() < 0.6:
+        leading = [target for target, _ in votes.most_common() if target in others]
+        if leading:
+            return leading[0]
+    return rng.choice(others) if others else None
+
+
+# Bot seats
+
+class BotSeat:
+    """A server-side player, seated in a room like a connection."""
+
+    bot = True
+
+    def __init__(self, name):
+        self.name = name
+        # Plays the seat of a player who left, until they come back
+        self.stands_in = False
+        # What the seer learnt: name -> role
+        self.known = {}
+        # Moves being decided or waiting to be played, keeps the room awake
+        self.moves = set()
+
+    def sendall(self, data):
+        for line in data.decode().splitlines():
+            if line:
+                self.on_frame(*decode_message(line))
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return f"<BotSeat {self.name}>"
+
+    def on_frame(self, msg_type, payload):
+        """React to a frame sent by the game, from the room's thread."""
+        if msg_type == "SEER_RESULT":
+            name, _, role = payload.rpartition(":")
+            self.known[name] = role
+        elif msg_type in PROMPTS:
+            self.think(PROMPTS[msg_type], payload)
+        elif msg_type == "STATE" and (payload == "day" or payload.startswith("Final vote between:")) \
+                and state.players.get(self, {}).get("alive"):
+            # Day vote, or nomination then final vote in large rooms
+            self.think("vote", payload)
+
+    def think(self, kind, payload):
+        if state.bots:
+            state.bots.think(self, kind, self.view(kind, payload), (state.day, state.game_state))
+
+    def view(self, kind, payload):
+        """Plain copy of what this bot knows, for `decide`."""
+        me = state.players.get(self, {})
+        players = list(state.players.values())
+        return {
+            "name": self.name,
+            "role": me.get("role"),
+            "living": [p["name"] for p in players if p["alive"]],
+            "wolves": [p["name"] for p in players if p["role"] == "werewolf"] if me.get("role") == "werewolf" else [],
+            "known": dict(self.known),
+            "votes": {state.usernames.get(c): target for c, target in list(state.votes.items())},
+            "victim": payload if kind == "witch" else "",
+            "nominees": sorted(set(state.nominees.values())) if kind == "vote" and state.vote_stage == "final" else [],
+            "seed": f"{state.seed}:{state.day}:{state.game_state}:{self.name}:{kind}",
+        }
+
+    def act(self, kind, choice, phase):
+        """Answer a prompt through the handlers, unless the game moved on meanwhile."""
+        from server import handler
+        room = rooms.active_room_of(self)
+        bind_room(room)
+        if self not in room.players:
+            return
+        if kind == "hunter":
+            if room.game_state in ("waiting", "end"):
+                return
+        elif (room.day, room.game_state) != phase or not room.players[self]["alive"]:
+            return
+        if kind != "witch" and not any(p["name"] == choice and p["alive"] for p in room.players.values()) \
+                or kind == "vote" and room.vote_stage == "final" and choice not in room.nominees.values():
+            # The target died meanwhile (a hunter shot), or the final vote of a
+            # large room opened between other nominees: think again
+            self.think(kind, "")
+            return
+        print(f"[BOT] {self.name} ({kind}): {choice}")
+        if kind == "seer":
+            handler.handle_seer_action(self, choice)
+        elif kind in ("werewolf", "witch"):
+            handler.handle_night_vote(self, choice)
+        elif kind == "hunter":
+            handler.handle_hunter_shoot(self, choice)
+        else:
+            handler.handle_vote(self, None, choice)
+
+
+class BotBrains:
+    """Process pool shared by every bot of the server."""
+
+    def __init__(self, workers, delay):
+        # Forking a process running dozens of threads could copy a held lock
+        # into the workers: start them from a fresh interpreter
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        # Seconds between a decision and the bot acting on it
+        self.delay = delay
+
+    def think(self, bot, kind, view, phase):
+        move = object()
+        bot.moves.add(move)
+        future = self.pool.submit(decide, kind, view)
+        future.add_done_callback(lambda f: self._decided(bot, move, kind, phase, f))
+
+    def _decided(self, bot, move, kind, phase, future):
+        # Runs on the pool's management thread: hand the move over to a timer
+        try:
+            choice = future.result()
+        except Exception as e:
+            print(f"[BOT] {bot.name} failed to decide ({kind}): {e}")
+            choice = None
+        if choice is None:
+            bot.moves.discard(move)
+            return
+        timer = threading.Timer(self.delay, self._play, args=(bot, move, kind, choice, phase))
+        timer.daemon = True
+        timer.start()
+
+    def _play(self, bot, move, kind, choice, phase):
+        try:
+            bot.act(kind, choice, phase)
+        finally:
+            bot.moves.discard(move)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+# Seating
+
+def bot_name():
+    while True:
+        name = f"{state.BOT_NAME_PREFIX}{next(_bot_numbers)}"
+        if not rooms.username_taken(name):
+            return name
+
+
+def seat_bot(bot, room):
+    rooms.assign(bot, room)
+    room.attach_client(bot, bot.name)
+
+
+def fill_room(count):
+    """Seat bots in the current room until it has `count` players. Returns their names."""
+    room = current_room()
+    added = []
+    while len(state.clients) < count:
+        bot = BotSeat(bot_name())
+        seat_bot(bot, room)
+        added.append(bot.name)
+    return added
+
+
+def take_over(conn):
+    """
+    Hand the seat of a player leaving mid-game to a bot, which plays on under
+    the same name. Returns the bot, or None if the seat was not taken over.
+    """
+    info = state.players.get(conn)
+    if not state.bots or state.game_state in ("waiting", "end") or not info or not info["alive"]:
+        return None
+    bot = BotSeat(info["name"])
+    bot.stands_in = True
+    state.clients.append(bot)
+    rooms.assign(bot, rooms.room_of(conn))
+    rebind_seat(bot, conn)
+    state.usernames[bot] = bot.name
+    state.conns_by_name[bot.name] = bot
+    broadcast(None, encode_message("MSG", f"{bot.name} left, a bot plays their seat."))
+    print(f"[BOT] Took over the seat of {bot.name}")
+    resend_seat(bot, info)
+    return bot
+
+
+def hand_back(conn, name):
+    """
+    Give a player who comes back the seat a bot took over when they left:
+    the connection replaces the bot in its room. Returns False if no bot
+    stands in for `name`.
+    """
+    held = [room for room in list(rooms.rooms.values()) if room.username_exists(name)]
+    if not held:
+        return False
+    room = rooms.wake(held[0])
+    bot = room.get_conn_by_username(name)
+    if not getattr(bot, "stands_in", False):
+        return False
+    source = rooms.room_of(conn)
+    with in_room(source):
+        source.detach_client(conn)
+    rooms.assign(conn, room)
+    with in_room(room):
+        info = rebind_seat(conn, bot)
+        # The bot leaves without a trace: the player never left the game
+        room.clients.remove(bot)
+        room.usernames.pop(bot, None)
+        room.channels.unsubscribe_all(bot)
+        room.clients.append(conn)
+        room.set_username(conn, name, record=False)
+        rooms.forget_connection(bot)
+        rooms.send_roster(conn, room)
+        broadcast(conn, encode_message("MSG", f"{name} is back and takes their seat from the bot."))
+        print(f"[BOT] {name} took their seat back")
+        resend_seat(conn, info)
+    return True
+
+
+def dismiss():
+    """Take every bot out of the current room."""
+    for conn in list(state.clients):
+        if getattr(conn, "bot", False):
+            state.remove_client(conn)
+            rooms.forget_connection(conn)
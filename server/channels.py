@@ -0,0 +1,80 @@
+"""Topic channels used for team-scoped delivery.
+
+Membership is kept up to date when players join, get their role and die,
+so publishing to a channel only touches its members instead of the whole room.
+"""
+
+import threading
+
+PUBLIC = "public"
+WOLVES = "wolves"
+DEAD = "dead"
+
+
+def dm(username):
+    """Name of the private channel of a single player."""
+    return f"dm:{username}"
+
+
+def neighborhood_channel(index):
+    """Name of the chat channel of a large-room neighborhood."""
+    return f"hood:{index}"
+
+
+class ChannelRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+        # Reverse index so a disconnect only touches the channels the connection is in
+        self.memberships = {}
+
+    def subscribe(self, channel, conn):
+        """Add a connection to a channel."""
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(conn)
+            self.memberships.setdefault(conn, set()).add(channel)
+
+    def unsubscribe(self, channel, conn):
+        """Remove a connection from a channel."""
+        with self.lock:
+            members = self.channels.get(channel)
+            if members is not None:
+                members.discard(conn)
+                if not members:
+                    del self.channels[channel]
+            joined = self.memberships.get(conn)
+            if joined is not None:
+                joined.discard(channel)
+
+    def unsubscribe_all(self, conn):
+        """Remove a connection from every channel it belongs to."""
+        with self.lock:
+            for channel in self.memberships.pop(conn, ()):
+                members = self.channels.get(channel)
+                if members is not None:
+                    members.discard(conn)
+                    if not members:
+                        del self.channels[channel]
+
+    def close(self, channel):
+        """Remove every member of a channel."""
+        with self.lock:
+            for conn in self.channels.pop(channel, ()):
+                joined = self.memberships.get(conn)
+                if joined is not None:
+                    joined.discard(channel)
+
+    def names(self):
+        """Snapshot of the channels that have members."""
+        with self.lock:
+            return tuple(self.channels)
+
+    def members(self, channel):
+        """Snapshot of the connections subscribed to a channel."""
+        with self.lock:
+            return tuple(self.channels.get(channel, ()))
+
+    def is_member(self, channel, conn):
+        """Check whether a connection is subscribed to a channel."""
+        with self.lock:
+            return conn in self.channels.get(channel, ())
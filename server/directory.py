@@ -0,0 +1,153 @@
+"""Lobby room directory.
+
+Clients list rooms with filters and pagination (ROOMS), or subscribe to the
+directory (ROOMS_WATCH) to get the matching rooms once and then only the
+rooms added, changed or removed since (ROOM_DELTA), batched per tick instead
+of polling the full list.
+"""
+
+import json
+import threading
+import time
+from common.protocol import encode_message
+from server import rooms
+from server.hibernation import HibernatedRoom
+from utils.network import send
+
+MAX_PAGE_SIZE = 100
+DEFAULT_PAGE_SIZE = 20
+
+
+def room_summary(room):
+    return {
+        "id": room.ROOM_ID,
+        "players": len(room.clients),
+        "capacity": room.capacity,
+        "phase": room.game_state,
+        "spectators": 0 if isinstance(room, HibernatedRoom) else room.spectators.count(),
+        "settings": {"night_mode": room.NIGHT_MODE},
+    }
+
+
+def int_field(query, name, default, low, high):
+    value = query.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return default
+    try:
+        return max(low, min(int(value), high))
+    except (ValueError, OverflowError):
+        return default
+
+
+def parse_filter(payload):
+    """
+    Room filter from a JSON payload: {"phase", "open", "prefix", "page", "page_size"}.
+    Fields of the wrong type fall back to their default.
+    """
+    try:
+        raw = json.loads(payload) if payload else {}
+    except ValueError:
+        raw = {}
+    if not isinstance(raw, dict):
+        raw = {}
+    query = {
+        "open": bool(raw.get("open")),
+        "page": int_field(raw, "page", 0, 0, 10 ** 6),
+        "page_size": int_field(raw, "page_size", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE),
+    }
+    for name in ("phase", "prefix"):
+        if isinstance(raw.get(name), str) and raw[name]:
+            query[name] = raw[name]
+    return query
+
+
+def matches(summary, query):
+    if query.get("phase") and summary["phase"] != query["phase"]:
+        return False
+    if query.get("open") and (summary["phase"] not in ("waiting", "end")
+                              or summary["players"] >= summary["capacity"]):
+        return False
+    if query.get("prefix") and not summary["id"].startswith(query["prefix"]):
+        return False
+    return True
+
+
+class RoomDirectory:
+    """
+    Room listings plus a tick thread pushing incremental deltas to watchers.
+    """
+
+    def __init__(self, tick=0.5):
+        self.tick = tick
+        self.lock = threading.Lock()
+        # conn -> filter of the rooms it watches
+        self.watchers = {}
+        # room id -> summary as of the last tick
+        self.listed = {}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def summaries(self):
+        return [room_summary(room) for room in list(rooms.rooms.values())]
+
+    def listing(self, query):
+        """One page of the rooms matching `query`, sorted by id."""
+        page = query.get("page", 0)
+        page_size = query.get("page_size", DEFAULT_PAGE_SIZE)
+        found = sorted((s for s in self.summaries() if matches(s, query)), key=lambda s: s["id"])
+        return {"rooms": found[page * page_size:(page + 1) * page_size],
+                "page": page, "page_size": page_size, "total": len(found)}
+
+    def watch(self, conn, query):
+        """Subscribe a client: it gets every matching room, then deltas."""
+        with self.lock:
+            self.watchers[conn] = query
+            if len(self.watchers) == 1:
+                self.listed = {s["id"]: s for s in self.summaries()}
+            current = [s for s in self.listed.values() if matches(s, query)]
+        send(conn, encode_message("ROOM_DELTA", json.dumps({"added": current, "updated": [], "removed": []})))
+
+    def unwatch(self, conn):
+        with self.lock:
+            self.watchers.pop(conn, None)
+
+    def _diff(self):
+        """Rooms whose summary changed since the last tick: {id: (old, new)}."""
+        current = {s["id"]: s for s in self.summaries()}
+        changed = {}
+        for room_id, summary in current.items():
+            old = self.listed.get(room_id)
+            if old != summary:
+                changed[room_id] = (old, summary)
+        for room_id, old in self.listed.items():
+            if room_id not in current:
+                changed[room_id] = (old, None)
+        self.listed = current
+        return changed
+
+    def _publish(self):
+        with self.lock:
+            if not self.watchers:
+                return
+            changed = self._diff()
+            if not changed:
+                return
+            watchers = list(self.watchers.items())
+        for conn, query in watchers:
+            delta = {"added": [], "updated": [], "removed": []}
+            for room_id, (old, new) in changed.items():
+                was = old is not None and matches(old, query)
+                now = new is not None and matches(new, query)
+                if now and not was:
+                    delta["added"].append(new)
+                elif now:
+                    delta["updated"].append(new)
+                elif was:
+                    delta["removed"].append(room_id)
+            if delta["added"] or delta["updated"] or delta["removed"]:
+                send(conn, encode_message("ROOM_DELTA", json.dumps(delta)))
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            self._publish()
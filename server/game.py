@@ -1,11 +1,64 @@
 """Game logic and state management for the Werewolf network game."""
 
-import random
+import json
 import time
 from collections import Counter
 from common.protocol import encode_message
-from server.state import state
-from utils.network import broadcast
+from server import journal
+from server.state import state, room_timer, current_room
+from server import rooms, bots
+from server.channels import WOLVES, DEAD, neighborhood_channel
+from utils.network import broadcast, send, publish
+
+
+# Absolute minimum: 1 werewolf, 1 seer and 3 villagers
+MIN_PLAYERS = 5
+
+
+def start_game():
+    """Deal the roles of a new game and start the first night."""
+    state.start_rng()
+    state.start_game_log()
+    assign_roles()
+    if state.matchmaker:
+        # Seated players are no longer waiting for a match
+        for conn in list(state.players):
+            state.matchmaker.dequeue(conn)
+    change_state("night")
+
+
+def reset_game():
+    """
+    Reset the room in place for a new game. Connections, outboxes and public
+    channels are kept, every client gets a fresh player list.
+    """
+    bots.dismiss()
+    state.reset_room()
+    change_state("waiting")
+    for conn in list(state.clients):
+        rooms.send_roster(conn, current_room())
+
+
+def rematch(deal=False):
+    """Reset the room and, with `deal`, start the next game right away."""
+    reset_game()
+    if not deal:
+        return
+    if state.bots and len(state.clients) < MIN_PLAYERS:
+        fill_with_bots()
+    if len(state.clients) < MIN_PLAYERS:
+        broadcast(None, encode_message("STATE", f"At least {MIN_PLAYERS} players are required to start the game"))
+        return
+    start_game()
+
+
+def fill_with_bots():
+    """Seat bots in a room too small to start a game."""
+    added = bots.fill_room(MIN_PLAYERS)
+    for name in added:
+        broadcast(None, encode_message("JOIN", name))
+    if added:
+        broadcast(None, encode_message("MSG", f"{len(added)} bot(s) joined to make up the numbers."))
 
 
 def assign_roles():
@@ -55,19 +108,26 @@ def assign_roles():
     # Fill with villagers
     roles += ["villager"] * max(0, num_players - len(roles))
     
-    # Shuffle roles for random distribution
-    random.shuffle(roles)
+    # Shuffle roles with the game's seeded RNG so the deal can be replayed
+    state.rng.shuffle(roles)
     
     # Distribute roles and notify players
+    state.large_room = False
+    state.neighborhood_of = {}
     for conn, role in zip(state.clients, roles):
         state.players[conn] = {
             "name": state.usernames[conn],
             "role": role,
             "alive": True
         }
+        state.record(journal.ROLE, state.usernames[conn], role)
+        if role == "werewolf":
+            state.channels.subscribe(WOLVES, conn)
         msg = encode_message("ROLE", role) + "\n"
-        conn.sendall(msg.encode())
+        send(conn, msg)
         time.sleep(0.1)
+    # The setup checkpoint of the replay holds the roles just dealt
+    state.start_replay()
       # Log role distribution stats
     role_counts = {}
     for conn in state.players:
@@ -103,6 +163,12 @@ def assign_roles():
     distribution_msg = ", ".join(distribution_list)
     
     broadcast(None, encode_message("ROLE_DISTRIBUTION", distribution_msg))
+
+    if num_players >= state.LARGE_ROOM_MIN_PLAYERS:
+        from server.large_room import assign_neighborhoods
+        seating = list(state.clients)
+        state.rng.shuffle(seating)
+        assign_neighborhoods(seating)
     
     print(f"[GAME] Role distribution for {num_players} players: {role_counts}")
 
@@ -112,18 +178,27 @@ def change_state(new_state):
     Change the game state and notify all clients.
     Resets votes and broadcasts the new state.
     """
-    state.game_state = new_state
+    state.set_game_state(new_state)
+    # Tallies scheduled during the last phase must not go out in this one
+    state.cancel_tallies()
     state.votes.clear()
     broadcast(None, encode_message("STATE", new_state))
+    if new_state == "day" and state.large_room:
+        from server.large_room import start_nomination
+        start_nomination()
     if new_state == "night":
         # Notify normal players to wait during the night
         for conn, p in state.players.items():
             if p["alive"] and p["role"] not in ["seer", "werewolf", "witch", "hunter"]:
                 msg = encode_message("MSG", "Night falls... you fall asleep while others act in the shadows.") + "\n"
                 try:
-                    conn.sendall(msg.encode())
+                    send(conn, msg)
                 except:
                     pass
+        if state.NIGHT_MODE == "concurrent":
+            start_concurrent_night()
+            return
+
         # At the start of night, trigger only the seer
         # Other actions occur sequentially after each role finishes
         time.sleep(3)
@@ -138,6 +213,8 @@ def change_state(new_state):
                 seer_exists = True
                 break
                 
+        with state.night_lock:
+            state.reset_night({"seer"} if seer_exists else set())
         if seer_exists:
             trigger_seer_phase()
         else:
@@ -154,15 +231,32 @@ def trigger_seer_phase():
     for conn, p in state.players.items():
         if p["role"] == "seer" and p["alive"]:
             msg = encode_message("SEER_ACTION", "") + "\n"
-            conn.sendall(msg.encode())
+            send(conn, msg)
 
 
 def handle_seer_choice(conn, target_name):
+    # Only the living seer inspects, once per night
+    seer = state.players.get(conn)
+    if not seer or seer["role"] != "seer" or not seer["alive"] or state.game_state != "night":
+        return
+    with state.night_lock:
+        if state.night_pending is None or "seer" not in state.night_pending:
+            return
+        if not any(p["name"] == target_name for p in state.players.values()):
+            return
+        if state.NIGHT_MODE != "concurrent":
+            state.night_pending.discard("seer")
     for p in state.players.values():
         if p["name"] == target_name:
             result = f"{target_name}:{p['role']}"
-            conn.sendall(encode_message("SEER_RESULT", result).encode())
+            send(conn, encode_message("SEER_RESULT", result))
             print(f"[GAME] Seer {state.usernames[conn]} examined {target_name} (role: {p['role']})")
+            state.record(journal.ACTION, state.usernames[conn], "seer", target_name)
+
+            if state.NIGHT_MODE == "concurrent":
+                # The wolves are already acting, just mark the seer as done
+                complete_night_action("seer")
+                break
             
             # Now that the seer finished, trigger the werewolf action
             time.sleep(2)  # Small delay so the client has time to process the response
@@ -171,16 +265,76 @@ def handle_seer_choice(conn, target_name):
             break
 
 
-def trigger_witch_phase():
+def trigger_witch_phase(victim=""):
     for conn, info in state.players.items():
         if info["role"] == "witch" and info["alive"]:
             try:
-                msg = encode_message("WITCH_ACTION", "") + "\n"
-                conn.sendall(msg.encode())
+                msg = encode_message("WITCH_ACTION", victim) + "\n"
+                send(conn, msg)
             except:
                 pass
 
 
+def vote_tally_snapshot(scope=None):
+    """
+    Build the VOTE_TALLY payload: votes per target and who has already voted.
+    `scope` restricts it to the voters of one neighborhood in large rooms.
+    None outside the day: there is no vote to show.
+    """
+    if state.game_state != "day":
+        return None
+    votes = list(state.votes.items())
+    if scope is not None:
+        votes = [(c, target) for c, target in votes if state.neighborhood_of.get(c) == scope]
+    counts = Counter(target for _, target in votes)
+    voted = sorted(state.usernames[c] for c, _ in votes if c in state.usernames)
+    return json.dumps({"counts": dict(counts), "voted": voted}, sort_keys=True)
+
+
+def schedule_vote_tally(scope=None):
+    """
+    Push a VOTE_TALLY snapshot to the room (or one neighborhood) within
+    VOTE_TALLY_INTERVAL seconds.
+    Votes cast before the snapshot goes out are folded into the same frame.
+    """
+    with state.tally_lock:
+        if scope in state.tally_timers:
+            return
+        timer = room_timer(state.VOTE_TALLY_INTERVAL, flush_vote_tally, args=(scope,))
+        timer.daemon = True
+        state.tally_timers[scope] = timer
+        timer.start()
+
+
+def flush_vote_tally(scope=None):
+    """
+    Send the current vote tally if it changed since the last snapshot.
+    """
+    with state.tally_lock:
+        timer = state.tally_timers.pop(scope, None)
+        if timer is not None:
+            timer.cancel()
+        snapshot = vote_tally_snapshot(scope)
+        if snapshot is None or snapshot == state.last_tallies.get(scope):
+            return
+        state.last_tallies[scope] = snapshot
+    if scope is None:
+        broadcast(None, encode_message("VOTE_TALLY", snapshot))
+    else:
+        publish(neighborhood_channel(scope), encode_message("VOTE_TALLY", snapshot))
+
+
+def most_voted(names):
+    """
+    Return the name with the most votes.
+    Ties are broken with the game's seeded RNG so replays pick the same player.
+    """
+    counts = Counter(names)
+    top = max(counts.values())
+    tied = sorted(name for name, count in counts.items() if count == top)
+    return tied[0] if len(tied) == 1 else state.rng.choice(tied)
+
+
 def tally_and_eliminate():
     """
     Tally votes and eliminate the player with the most votes.
@@ -188,16 +342,22 @@ def tally_and_eliminate():
     if not state.votes:
         return
 
-    voted_names = list(state.votes.values())
-    target, _ = Counter(voted_names).most_common(1)[0]
+    eliminate(most_voted(state.votes.values()))
+
 
+def eliminate(target):
+    """
+    Eliminate the named player, check for the end of the game and move on
+    to the next phase.
+    """
     for conn, info in state.players.items():
         if info["name"] == target and info["alive"]:
             kill_player(conn)
             break
 
     check_end_game()
-    change_state("night" if state.game_state == "day" else "day")
+    if state.game_state != "end":
+        change_state("night" if state.game_state == "day" else "day")
 
 
 def kill_player(conn):
@@ -206,13 +366,16 @@ def kill_player(conn):
     """
     info = state.players[conn]
     info["alive"] = False
+    state.record(journal.KILL, info["name"], state.game_state)
+    state.channels.unsubscribe(WOLVES, conn)
+    state.channels.subscribe(DEAD, conn)
     broadcast(None, encode_message("KILL", info["name"]) + "\n")
 
     if state.game_state == "night":
         death_msg = encode_message("STATE", "You have been killed by wolves during the night") + "\n"
     else:
         death_msg = encode_message("STATE", "You have been eliminated by the village") + "\n"
-    conn.sendall(death_msg.encode())
+    send(conn, death_msg)
 
     if info["role"] == "hunter":
         handle_hunter_death(conn)
@@ -222,7 +385,28 @@ def handle_hunter_death(conn):
     """
     Allows the hunter to shoot someone upon death.
     """
-    conn.sendall(encode_message("HUNTER_SHOOT", "") + "\n")
+    state.hunter_shots.add(conn)
+    send(conn, encode_message("HUNTER_SHOOT", ""))
+
+
+def after_hunter_shot():
+    """
+    A hunter shot can end the game, or kill the last player the phase was
+    waiting for: move on as if they had acted.
+    """
+    check_end_game()
+    if state.game_state == "day" and not state.large_room:
+        alive_voters = [c for c, p in state.players.items() if p["alive"]]
+        if state.votes and all(c in state.votes for c in alive_voters):
+            tally_and_eliminate()
+    elif state.game_state == "night" and state.NIGHT_MODE == "concurrent":
+        living = {p["role"] for p in state.players.values() if p["alive"]}
+        wolves = [c for c, p in state.players.items() if p["alive"] and p["role"] == "werewolf"]
+        if wolves and all(w in state.votes for w in wolves):
+            lock_werewolf_target()
+        for role in ("seer", "witch"):
+            if role not in living:
+                complete_night_action(role)
 
 
 def check_end_game():
@@ -239,6 +423,8 @@ def check_end_game():
 
     if not werewolves:
         state.set_game_state("end")
+        state.record(journal.END, "villagers")
+        state.save_game_result("villagers")
         broadcast(None, encode_message("STATE", "villagers_win") + "\n")
         
         # Detailed message listing the werewolves in the game
@@ -249,6 +435,8 @@ def check_end_game():
         
     elif len(werewolves) >= len(villagers):
         state.set_game_state("end")
+        state.record(journal.END, "werewolves")
+        state.save_game_result("werewolves")
         broadcast(None, encode_message("STATE", "werewolves_win") + "\n")
         
         # Detailed message for the winning werewolves
@@ -258,9 +446,10 @@ def check_end_game():
         broadcast(None, encode_message("MSG", win_msg) + "\n")
 
 
-def werewolf_night_phase():
+def werewolf_night_phase(delay=1):
     """
     Let werewolves communicate and vote during the night phase.
+    `delay` is the pause between the instructions and the action popup.
     """
     werewolves = [conn for conn, p in state.players.items() if p["role"] == "werewolf" and p["alive"]]
     
@@ -275,12 +464,12 @@ def werewolf_night_phase():
         conn = werewolves[0]
         msg = encode_message("STATE", "You are the only werewolf. Choose a victim with /nvote <name>") + "\n"
         try:
-            conn.sendall(msg.encode())
+            send(conn, msg)
             # Short pause to ensure messages are sent in order
-            time.sleep(1)
+            time.sleep(delay)
             # Send a specific message to trigger the popup
             msg_action = encode_message("WEREWOLF_ACTION", "") + "\n"
-            conn.sendall(msg_action.encode())
+            send(conn, msg_action)
             print(f"[GAME] Sent werewolf action to {state.usernames.get(conn, 'unknown')}")
         except Exception as e:
             print(f"[ERROR] Failed to send werewolf action: {e}")
@@ -288,24 +477,123 @@ def werewolf_night_phase():
         msg = encode_message("STATE", "Werewolves, chat with /nmsg and vote with /nvote <name>") + "\n"
         for conn in werewolves:
             try:
-                conn.sendall(msg.encode())
+                send(conn, msg)
                 # Short pause to ensure messages are sent in order
-                time.sleep(1)
+                time.sleep(delay)
                 # Send a specific message to trigger the popup
                 msg_action = encode_message("WEREWOLF_ACTION", "") + "\n"
-                conn.sendall(msg_action.encode())
+                send(conn, msg_action)
                 print(f"[GAME] Sent werewolf action to {state.usernames.get(conn, 'unknown')}")
             except Exception as e:
                 print(f"[ERROR] Failed to send werewolf action to {state.usernames.get(conn, 'unknown')}: {e}")
 
 
+def start_concurrent_night():
+    """
+    Prompt the seer and the werewolves at the same time.
+    The witch is prompted as soon as the werewolf target is locked and the
+    night is resolved once every expected action has been received.
+    """
+    living_roles = {p["role"] for p in state.players.values() if p["alive"]}
+    pending = set()
+    if "seer" in living_roles:
+        pending.add("seer")
+    if "werewolf" in living_roles:
+        pending.add("wolves")
+    if "witch" in living_roles:
+        pending.add("witch")
+
+    with state.night_lock:
+        state.reset_night(pending)
+
+    print(f"[GAME] Starting concurrent night, waiting for: {sorted(pending)}")
+    if not pending:
+        resolve_night()
+        return
+    if "seer" in pending:
+        trigger_seer_phase()
+    werewolf_night_phase(delay=0)
+
+
+def lock_werewolf_target():
+    """
+    Lock the werewolves' victim once they have all voted and prompt the witch.
+    """
+    with state.night_lock:
+        if state.night_pending is None or "wolves" not in state.night_pending:
+            return
+        target = None
+        if state.votes:
+            target = most_voted(state.votes.values())
+        state.night_victim = state.get_conn_by_username(target) if target else None
+        state.record(journal.ACTION, "wolves", "target", target or "")
+        print(f"[GAME] Werewolf target locked: {target}")
+
+    if "witch" in state.night_pending:
+        trigger_witch_phase(target or "")
+    complete_night_action("wolves")
+
+
+def handle_witch_choice(conn, payload):
+    """
+    Record the witch's decision for the current concurrent night.
+    """
+    with state.night_lock:
+        if state.night_pending is None or "witch" not in state.night_pending:
+            return
+        if "wolves" in state.night_pending:
+            send(conn, encode_message("STATE", "Wait until the werewolves have chosen their victim."))
+            return
+        state.record(journal.ACTION, state.get_username(conn), payload)
+        if payload == "witch_save":
+            state.night_saved = True
+            print(f"[WITCH] {state.get_username(conn)} saved the victim")
+        elif payload.startswith("witch_kill:"):
+            target_conn = state.get_conn_by_username(payload.split(":", 1)[1])
+            if target_conn and state.players[target_conn]["alive"]:
+                state.night_poisoned = target_conn
+                print(f"[WITCH] {state.get_username(conn)} poisoned {state.get_username(target_conn)}")
+        else:
+            print(f"[WITCH] {state.get_username(conn)} did nothing")
+    complete_night_action("witch")
+
+
+def complete_night_action(action):
+    """
+    Mark a night action as done and resolve the night when none is left.
+    """
+    with state.night_lock:
+        if state.night_pending is None:
+            return
+        state.night_pending.discard(action)
+        if state.night_pending:
+            return
+        # Only the thread completing the last action resolves the night
+        state.night_pending = None
+    resolve_night()
+
+
+def resolve_night():
+    """
+    Apply the outcome of a concurrent night and move on to the day.
+    """
+    victims = []
+    if state.night_victim and not state.night_saved:
+        victims.append(state.night_victim)
+    if state.night_poisoned and state.night_poisoned not in victims:
+        victims.append(state.night_poisoned)
+
+    for conn in victims:
+        if conn in state.players and state.players[conn]["alive"]:
+            kill_player(conn)
+
+    check_end_game()
+    if state.game_state != "end":
+        change_state("day")
+
+
 def broadcast_werewolves(sender_conn, message):
     """
     Send a message to all living werewolves except the sender.
     """
-    for conn, p in state.players.items():
-        if p["alive"] and p["role"] == "werewolf" and conn != sender_conn:
-            try:
-                conn.sendall((message if message.endswith("\n") else message + "\n").encode())
-            except:
-                pass
+    publish(WOLVES, message, exclude=sender_conn)
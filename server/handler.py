@@ -1,34 +1,61 @@
 """Handles incoming client messages and game state transitions for the Werewolf game server."""
 
+import json
 import time
-from common.protocol import encode_message, decode_message
-from server.state import state
-from utils.network import broadcast
+from common.protocol import encode_message, decode_message, FrameReader, FrameTooLarge
+from server import journal
+from server.state import state, main_room, bind_room
+from server import rooms, bots
+from server.channels import PUBLIC, WOLVES, DEAD, dm, neighborhood_channel
+from server.large_room import handle_large_room_vote
+from server.matchmaking import ROOM_SIZES, ANY_SIZE
+from server.directory import parse_filter
+from server.outbox import CHAT
+from server.snapshot import DetachedSeat, detached_seat, reattach_player
+from utils.network import broadcast, send, publish
 from server.game import (
-    assign_roles,
-    change_state,
+    MIN_PLAYERS,
+    fill_with_bots,
+    start_game,
+    reset_game,
+    rematch,
     tally_and_eliminate,
     handle_seer_choice,
     kill_player,
-    broadcast_werewolves
+    after_hunter_shot,
+    lock_werewolf_target,
+    handle_witch_choice,
+    schedule_vote_tally,
+    flush_vote_tally
 )
 
 
 def handle_msg(conn, addr, payload):
+    sender = state.get_username(conn)
+
     if state.game_state != "waiting" and not state.players.get(conn, {}).get("alive", True):
-        conn.sendall((encode_message("STATE", "You are dead and cannot talk.") + "\n").encode())
+        # Dead players can only talk among themselves
+        print(f"[DEAD] [{sender}] {payload}")
+        publish(DEAD, encode_message("MSG", f"[DEAD] [{sender}] {payload}"), exclude=conn, lane=CHAT)
         return
 
-    sender = state.get_username(conn)
     role = state.players.get(conn, {}).get("role")
 
-    if state.game_state == "night" and role != "werewolf":
-        conn.sendall((encode_message("STATE", "You can't talk at night") + "\n").encode())
+    if state.game_state == "night":
+        if role != "werewolf":
+            send(conn, encode_message("STATE", "You can't talk at night"))
+            return
+        # Werewolves talking at night stay within their pack
+        handle_night_msg(conn, payload)
         return
 
     print(f"[{sender}] {payload}")
     forward = encode_message("MSG", f"[{sender}] {payload}")
-    broadcast(conn, forward)
+    if state.large_room and conn in state.neighborhood_of:
+        # Large rooms chat within their neighborhood only
+        publish(neighborhood_channel(state.neighborhood_of[conn]), forward, exclude=conn, lane=CHAT)
+        return
+    publish(PUBLIC, forward, exclude=conn, lane=CHAT)
 
 
 def handle_vote(conn, addr, payload):
@@ -36,28 +63,36 @@ def handle_vote(conn, addr, payload):
     role = state.players.get(conn, {}).get("role")
 
     if not state.players.get(conn, {}).get("alive", True):
-        conn.sendall((encode_message("STATE", "You are dead and cannot vote.") + "\n").encode())
+        send(conn, encode_message("STATE", "You are dead and cannot vote."))
         return
 
     if state.game_state == "night" and role != "werewolf":
-        conn.sendall((encode_message("STATE", "Only werewolves can vote at night") + "\n").encode())
+        send(conn, encode_message("STATE", "Only werewolves can vote at night"))
         return
 
     target_conn = state.get_conn_by_username(payload)
     if not target_conn:
-        conn.sendall((encode_message("STATE", f"Player {payload} does not exist.") + "\n").encode())
+        send(conn, encode_message("STATE", f"Player {payload} does not exist."))
         return
     if not state.players.get(target_conn, {}).get("alive", False):
-        conn.sendall((encode_message("STATE", f"{payload} is dead. Choose a living player.") + "\n").encode())
+        send(conn, encode_message("STATE", f"{payload} is dead. Choose a living player."))
         return
 
     print(f"[VOTE] {sender} voted for {payload}")
+    if state.large_room and state.game_state == "day":
+        handle_large_room_vote(conn, payload)
+        return
     state.add_vote(conn, payload)
-    forward = encode_message("VOTE", f"{sender} voted for {payload}")
-    broadcast(conn, forward)
 
     alive_voters = [c for c, p in state.players.items() if p["alive"]]
-    if all(c in state.votes for c in alive_voters):
+    everyone_voted = all(c in state.votes for c in alive_voters)
+    if state.game_state == "day":
+        if everyone_voted:
+            # Everyone sees the final tally before the result
+            flush_vote_tally()
+        else:
+            schedule_vote_tally()
+    if everyone_voted:
         tally_and_eliminate()
 
 
@@ -65,7 +100,7 @@ def handle_role(conn, addr, payload):
     sender = state.get_username(conn)
     print(f"[ROLE] Assigned role {payload} to {sender}")
     forward = encode_message("ROLE", f"{sender} is a {payload}") + "\n"
-    conn.sendall(forward.encode())
+    send(conn, forward)
 
 
 def handle_state(conn, addr, payload):
@@ -74,20 +109,50 @@ def handle_state(conn, addr, payload):
     broadcast(None, forward)
 
 
-def handle_client(conn, addr):
-    print(f"[+] New connection from {addr}")
-    state.add_client(conn)
+def handle_client(conn, addr, reader=None):
+    """
+    Read and dispatch the messages of one client.
+    `reader` is only given for connections inherited from a previous server process.
+    """
+    if reader is None:
+        print(f"[+] New connection from {addr}")
+        state.add_client(conn)
+        reader = FrameReader(conn, state.MAX_FRAME_SIZE)
+    state.readers[conn] = reader
     try:
         while True:
-            data = conn.recv(1024)
-            if not data:
+            message = reader.read_frame()
+            if message is None:
                 break
-            message = data.decode().strip()
+            # The connection may have been moved to another room since the last
+            # frame, or its room hibernated
+            bind_room(rooms.active_room_of(conn))
+            message = message.strip()
+            if not message:
+                continue
             print(f"[{addr}] {message}")
             msg_type, payload = decode_message(message)
 
+            if state.spectators.is_spectator(conn):
+                # Spectators only watch
+                continue
+
+            if msg_type != "SPECTATE" and conn not in main_room.player_slots:
+                # First frame of a player: count it against the player budget
+                reason = main_room.claim_slot(conn)
+                if reason:
+                    send(conn, encode_message("STATE", reason))
+                    return
+
+            if not state.allow_message(conn, msg_type):
+                send(conn, encode_message("STATE", "You are sending messages too fast, slow down."))
+                continue
+
             if msg_type == "JOIN":
-                if not handle_join(conn, addr, payload):
+                if not handle_join(conn, addr, payload, reader):
+                    return
+            elif msg_type == "SPECTATE":
+                if not handle_spectate(conn, addr, payload):
                     return
             elif msg_type == "MSG":
                 handle_msg(conn, addr, payload)
@@ -100,65 +165,283 @@ def handle_client(conn, addr):
             elif msg_type == "START":
                 handle_start(conn)
             elif msg_type == "RESTART":
-                state.clear_votes()
-                change_state("waiting")
+                state.record(journal.RESTART, state.get_username(conn) or "")
+                reset_game()
+            elif msg_type == "REMATCH":
+                handle_rematch(conn, payload)
             elif msg_type == "NIGHT_MSG":
-                sender = state.get_username(conn)
-                print(f"[NIGHT_MSG] {sender}: {payload}")
-                forward = encode_message("NIGHT_MSG", f"{sender} {payload}")
-                broadcast_werewolves(conn, forward)
+                handle_night_msg(conn, payload)
+            elif msg_type == "WHISPER":
+                handle_whisper(conn, payload)
             elif msg_type == "NIGHT_VOTE":
                 handle_night_vote(conn, payload)
             elif msg_type == "SEER_ACTION":
                 handle_seer_action(conn, payload)
             elif msg_type == "HUNTER_SHOOT":
                 handle_hunter_shoot(conn, payload)
-
+            elif msg_type == "LEADERBOARD":
+                handle_leaderboard(conn, payload)
+            elif msg_type == "QUEUE":
+                handle_queue(conn, payload)
+            elif msg_type == "ROOMS":
+                handle_rooms(conn, payload)
+            elif msg_type == "ROOMS_WATCH":
+                handle_rooms_watch(conn, payload)
+            elif msg_type == "CREATE_ROOM":
+                handle_create_room(conn, payload)
+            elif msg_type == "JOIN_ROOM":
+                handle_join_room(conn, payload)
+            elif msg_type == "TOURNAMENT":
+                handle_tournament(conn, payload)
+
+    except FrameTooLarge as e:
+        print(f"[!] Frame of {e} bytes from {addr} exceeds {state.MAX_FRAME_SIZE}, disconnecting")
+        try:
+            conn.sendall((encode_message("STATE", "Message too large, disconnected.") + "\n").encode())
+        except OSError:
+            pass
     except ConnectionResetError:
         print(f"[!] Connection lost with {addr}")
     finally:
+        bind_room(rooms.active_room_of(conn))
+        if state.matchmaker:
+            state.matchmaker.dequeue(conn)
+        if state.directory:
+            state.directory.unwatch(conn)
         conn.close()
+        # A player leaving mid-game is replaced so the game can go on
+        bots.take_over(conn)
         state.remove_client(conn)
+        state.spectators.remove(conn)
+        rooms.forget_connection(conn)
         print(f"[-] Disconnected {addr}")
 
 
 def handle_start(conn):
-    MIN_PLAYERS = 5  # Absolute minimum: 1 werewolf, 1 seer and 3 villagers
     RECOMMENDED_PLAYERS = 6  # Recommended: also includes the witch
     if state.game_state != "waiting":
-        conn.sendall((encode_message("STATE", "Game already started") + "\n").encode())
+        send(conn, encode_message("STATE", "Game already started"))
         return
-    elif len(state.clients) < MIN_PLAYERS:
-        conn.sendall((encode_message("STATE", f"At least {MIN_PLAYERS} players are required to start the game") + "\n").encode())
+    if state.bots and len(state.clients) < MIN_PLAYERS:
+        fill_with_bots()
+    if len(state.clients) < MIN_PLAYERS:
+        send(conn, encode_message("STATE", f"At least {MIN_PLAYERS} players are required to start the game"))
         return
     elif len(state.clients) < RECOMMENDED_PLAYERS:
         # We can start but warn that more players make a better game
-        conn.sendall((encode_message("MSG", f"Note: {RECOMMENDED_PLAYERS}+ players are recommended for a balanced game with all roles") + "\n").encode())
+        send(conn, encode_message("MSG", f"Note: {RECOMMENDED_PLAYERS}+ players are recommended for a balanced game with all roles"))
         # Continue starting
 
-    assign_roles()
-    change_state("night")
+    start_game()
+
+
+def handle_rematch(conn, payload):
+    """
+    Start over with the same players once a game has ended, without anyone
+    reconnecting. Payload "deal" (or REMATCH_AUTO_DEAL) starts the next game right away.
+    """
+    if state.game_state not in ("end", "waiting"):
+        send(conn, encode_message("STATE", "The game is still running, use restart to abandon it."))
+        return
+    state.record(journal.RESTART, state.get_username(conn) or "")
+    rematch(deal=payload == "deal" or state.REMATCH_AUTO_DEAL)
 
 
 def handle_night_msg(conn, payload):
     if state.game_state != "waiting" and not state.players.get(conn, {}).get("alive", True):
-        conn.sendall((encode_message("STATE", "You are dead and cannot talk.") + "\n").encode())
+        send(conn, encode_message("STATE", "You are dead and cannot talk."))
         return
 
     sender = state.get_username(conn)
-    if not (state.players[conn]["alive"] and state.players[conn]["role"] == "werewolf"):
+    if not state.channels.is_member(WOLVES, conn):
         return
+    print(f"[NIGHT_MSG] {sender}: {payload}")
     forward = encode_message("NIGHT_MSG", f"[{sender}] {payload}")
-    for c, p in state.players.items():
-        if p["alive"] and p["role"] == "werewolf":
-            c.sendall((forward + "\n").encode())
+    publish(WOLVES, forward, lane=CHAT)
+
+
+def handle_leaderboard(conn, payload):
+    """
+    Send the top rated players and the requester's own rating.
+    Payload: optional number of entries (default 10).
+    """
+    if not state.ratings:
+        send(conn, encode_message("STATE", "Ratings are disabled on this server."))
+        return
+    try:
+        count = max(1, min(int(payload or 10), state.LEADERBOARD_SIZE))
+    except ValueError:
+        count = 10
+    rating, games = state.ratings.rating(state.get_username(conn))
+    send(conn, encode_message("LEADERBOARD", json.dumps({
+        "top": state.ratings.leaderboard(count),
+        "you": [round(rating, 1), games],
+    })))
+
+
+def handle_rooms(conn, payload):
+    """
+    Send one page of the room directory.
+    Payload: JSON filter {"phase", "open", "prefix", "page", "page_size"}, all optional.
+    """
+    if not state.directory:
+        send(conn, encode_message("STATE", "The room directory is disabled on this server."))
+        return
+    send(conn, encode_message("ROOMS", json.dumps(state.directory.listing(parse_filter(payload)))))
+
+
+def handle_rooms_watch(conn, payload):
+    """
+    Subscribe to room directory deltas ("off" to stop).
+    Payload: the same JSON filter as ROOMS, pagination excepted.
+    """
+    if not state.directory:
+        return
+    if payload == "off":
+        state.directory.unwatch(conn)
+    else:
+        state.directory.watch(conn, parse_filter(payload))
+
+
+def handle_create_room(conn, payload):
+    """
+    Open a new room and move the player into it.
+    Payload: optional capacity (defaults to ROOM_CAPACITY).
+    """
+    if not state.get_username(conn) or rooms.playing_a_game(conn):
+        send(conn, encode_message("STATE", "You cannot create a room right now."))
+        return
+    try:
+        capacity = int(payload) if payload else state.ROOM_CAPACITY
+    except ValueError:
+        capacity = 0
+    if not 5 <= capacity <= state.MAX_CONNECTIONS:
+        send(conn, encode_message("STATE", f"Capacity must be between 5 and {state.MAX_CONNECTIONS}."))
+        return
+    if state.matchmaker:
+        state.matchmaker.dequeue(conn)
+    rooms.move_connection(conn, rooms.create_room("room", capacity))
+
+
+def handle_join_room(conn, payload):
+    """Move the player to the room with id `payload` ("main" for the lobby)."""
+    room = rooms.get_room(payload)
+    if room is None:
+        send(conn, encode_message("STATE", f"Room {payload} does not exist."))
+        return
+    if room is rooms.room_of(conn):
+        return
+    if not state.get_username(conn) or rooms.playing_a_game(conn):
+        send(conn, encode_message("STATE", "Finish your current game before changing rooms."))
+        return
+    if room is not main_room and (room.game_state not in ("waiting", "end") or len(room.clients) >= room.capacity):
+        send(conn, encode_message("STATE", f"Room {payload} is not open."))
+        return
+    if state.matchmaker:
+        state.matchmaker.dequeue(conn)
+    rooms.move_connection(conn, room)
+
+
+def handle_tournament(conn, payload):
+    """
+    Payload "register" or "leave" during registration, empty for the standings.
+    """
+    tournament = state.tournament
+    if not tournament:
+        send(conn, encode_message("STATE", "There is no tournament on this server."))
+        return
+    name = state.get_username(conn)
+    if payload == "register":
+        if not name:
+            send(conn, encode_message("STATE", "Join with a username before registering."))
+            return
+        reason = tournament.register(conn, name)
+        send(conn, encode_message("STATE", reason or f"Registered for tournament {tournament.id}."))
+    elif payload == "leave":
+        if tournament.unregister(name):
+            send(conn, encode_message("STATE", f"You left tournament {tournament.id}."))
+    else:
+        tournament.announce([conn])
+
+
+def handle_queue(conn, payload):
+    """
+    Join the matchmaking queue.
+    Payload: a room size (6, 8, 10 or 12), empty for any size, or "cancel".
+    """
+    if not state.matchmaker:
+        send(conn, encode_message("STATE", "Matchmaking is disabled on this server."))
+        return
+    if payload == "cancel":
+        if state.matchmaker.dequeue(conn):
+            send(conn, encode_message("STATE", "You left the matchmaking queue."))
+        return
+    name = state.get_username(conn)
+    if not name:
+        send(conn, encode_message("STATE", "Join with a username before queuing."))
+        return
+    if rooms.playing_a_game(conn):
+        send(conn, encode_message("STATE", "Finish your current game before queuing."))
+        return
+    try:
+        size = int(payload) if payload else ANY_SIZE
+    except ValueError:
+        size = -1
+    if size != ANY_SIZE and size not in ROOM_SIZES:
+        send(conn, encode_message("STATE", f"Room size must be one of {', '.join(map(str, ROOM_SIZES))}."))
+        return
+    rating = state.ratings.rating(name)[0] if state.ratings else state.RATING_DEFAULT
+    ticket = state.matchmaker.enqueue(conn, name, rating, size)
+    if state.matchmaker.tickets.get(conn) is ticket:
+        wanted = f"a {size}-player room" if size else "a room of any size"
+        send(conn, encode_message("STATE", f"Queued for {wanted} ({state.matchmaker.queued()} players waiting)."))
+
+
+def handle_whisper(conn, payload):
+    """
+    Deliver a private message to a single player.
+    Payload format: "<target>|<message>".
+    """
+    sender = state.get_username(conn)
+    target_name, _, message = payload.partition("|")
+    if not sender or not message:
+        send(conn, encode_message("STATE", "Usage: /whisper <player> <message>"))
+        return
+
+    target_conn = state.get_conn_by_username(target_name)
+    if not target_conn:
+        send(conn, encode_message("STATE", f"Player {target_name} does not exist."))
+        return
+    if target_conn == conn:
+        send(conn, encode_message("STATE", "You cannot whisper to yourself."))
+        return
+
+    if state.game_state not in ("waiting", "end"):
+        sender_alive = state.players.get(conn, {}).get("alive", True)
+        target_alive = state.players.get(target_conn, {}).get("alive", True)
+        if sender_alive != target_alive:
+            send(conn, encode_message("STATE", "The living and the dead cannot whisper to each other."))
+            return
+        if state.game_state == "night" and sender_alive and not (
+                state.channels.is_member(WOLVES, conn) and state.channels.is_member(WOLVES, target_conn)):
+            send(conn, encode_message("STATE", "You can't whisper at night"))
+            return
+
+    print(f"[WHISPER] {sender} -> {target_name}")
+    publish(dm(target_name), encode_message("WHISPER", f"{sender}|{message}"), lane=CHAT)
 
 
 def handle_night_vote(conn, payload):
     # Special handling for witch actions
     if payload.startswith("witch_"):
-        if not (state.players[conn]["alive"] and state.players[conn]["role"] == "sorcière"):
+        if not (state.players[conn]["alive"] and state.players[conn]["role"] == "witch"):
             return
+
+        if state.NIGHT_MODE == "concurrent":
+            handle_witch_choice(conn, payload)
+            return
+
+        state.record(journal.ACTION, state.get_username(conn), payload)
             
         if payload == "witch_save":
             # The witch saves the chosen victim
@@ -200,15 +483,15 @@ def handle_night_vote(conn, payload):
               # Normal processing for werewolves
     target_conn = state.get_conn_by_username(payload)
     if not target_conn:
-        conn.sendall((encode_message("STATE", f"Player {payload} does not exist.") + "\n").encode())
+        send(conn, encode_message("STATE", f"Player {payload} does not exist."))
         return
     if not state.players.get(target_conn, {}).get("alive", False):
-        conn.sendall((encode_message("STATE", f"{payload} is dead. Choose a living player.") + "\n").encode())
+        send(conn, encode_message("STATE", f"{payload} is dead. Choose a living player."))
         return
     if not (state.players[conn]["alive"] and state.players[conn]["role"] == "werewolf"):
         return
     if payload == state.get_username(conn):
-        conn.sendall((encode_message("STATE", "You cannot vote for yourself.") + "\n").encode())
+        send(conn, encode_message("STATE", "You cannot vote for yourself."))
         return
     
     state.add_vote(conn, payload)
@@ -217,14 +500,14 @@ def handle_night_vote(conn, payload):
     if all(w in state.votes for w in werewolves):
         # All werewolves have voted, check for a witch in the game
         print("[GAME] All werewolves have voted, checking for witch...")
+
+        if state.NIGHT_MODE == "concurrent":
+            lock_werewolf_target()
+            return
         
         # Check if there is a living witch in the game
-        witch_exists = False
-        for conn, p in state.players.items():
-            if p["role"] == "sorcière" and p["alive"]:
-                witch_exists = True
-                break
-                
+        witch_exists = any(p["role"] == "witch" and p["alive"] for p in state.players.values())
+
         if witch_exists:
             # A living witch exists, trigger her phase
             print("[GAME] Living witch found, starting witch phase")
@@ -243,20 +526,29 @@ def handle_seer_action(conn, payload):
 
 
 def handle_hunter_shoot(conn, payload):
+    # Only a hunter who just died gets to shoot, once
+    if conn not in state.hunter_shots:
+        return
     target_conn = state.get_conn_by_username(payload)
     if target_conn and state.players[target_conn]["alive"]:
+        state.hunter_shots.discard(conn)
+        state.record(journal.ACTION, state.get_username(conn), "hunter_shoot", payload)
         kill_player(target_conn)
+        after_hunter_shot()
 
 
-def handle_join(conn, addr, payload):
+def handle_join(conn, addr, payload, reader):
     while True:
-        if state.username_exists(payload):
-            conn.sendall((encode_message("STATE", "This username is already taken. Enter a new one:") + "\n").encode())
+        if bots.hand_back(conn, payload):
+            # A bot kept their seat warm while they were away
+            return True
+        if rooms.username_taken(payload):
+            send(conn, encode_message("STATE", "This username is already taken. Enter a new one:"))
             try:
-                data = conn.recv(1024)
-                if not data:
+                data = reader.read_frame()
+                if data is None:
                     return False
-                msg_type, payload = decode_message(data.decode().strip())
+                msg_type, payload = decode_message(data.strip())
                 if msg_type != "JOIN":
                     continue
             except:
@@ -267,11 +559,39 @@ def handle_join(conn, addr, payload):
             
             # Send the list of already connected players to the new client
             existing_players = [state.get_username(c) for c in state.clients if c != conn and state.get_username(c)]
+            # Players restored after a restart who haven't reconnected yet
+            existing_players += [p["name"] for c, p in state.players.items()
+                                 if isinstance(c, DetachedSeat) and p["name"] != payload]
             for player in existing_players:
                 join_msg = encode_message("JOIN", player) + "\n"
-                conn.sendall(join_msg.encode())
+                send(conn, join_msg)
             
             # Broadcast to other clients that a new player has joined
             join_broadcast = encode_message("JOIN", payload)
             broadcast(conn, join_broadcast)
+
+            seat = detached_seat(payload)
+            if seat:
+                reattach_player(conn, seat)
             return True
+
+
+def handle_spectate(conn, addr, payload):
+    """
+    Turn a fresh connection into a spectator: it leaves the player list and
+    only receives the public event stream from the spectator tier.
+    """
+    if state.get_username(conn):
+        send(conn, encode_message("STATE", "Players cannot become spectators."))
+        return True
+    reason = main_room.claim_slot(conn, spectator=True)
+    if reason:
+        send(conn, encode_message("STATE", reason))
+        return False
+
+    state.remove_client(conn)
+    print(f"[{addr}] spectating as {payload or 'anonymous'}")
+    greeting = [encode_message("STATE", "You are spectating this game.")]
+    greeting += [encode_message("JOIN", name) for name in list(state.usernames.values())]
+    state.spectators.add(conn, "".join(greeting).encode())
+    return True
@@ -0,0 +1,94 @@
+"""Idle room hibernation.
+
+A room nobody has sent anything to for HIBERNATE_AFTER seconds is written to
+HIBERNATE_DIR in the snapshot format of server.snapshot (plus the replay
+being recorded, if any), and its GameState and spectator thread are
+released. A HibernatedRoom keeps only what is needed to list the room and to
+route its connections: the next frame from one of them loads the room back
+(see server.rooms), with every player back in their seat.
+"""
+
+import os
+import time
+from server.state import GameState, main_room, in_room
+from server.snapshot import capture_snapshot, write_snapshot, load_snapshot, apply_snapshot, \
+    detached_seat, rebind_seat
+
+
+class HibernatedRoom:
+    """What stays in memory of a hibernated room."""
+
+    def __init__(self, room, path):
+        self.ROOM_ID = room.ROOM_ID
+        self.NIGHT_MODE = room.NIGHT_MODE
+        self.path = path
+        self.capacity = room.capacity
+        self.game_state = room.game_state
+        # Connections still in the room -> their username (None before JOIN)
+        self.members = {conn: room.usernames.get(conn) for conn in room.clients}
+
+    @property
+    def clients(self):
+        return list(self.members)
+
+    def get_username(self, conn):
+        return self.members.get(conn)
+
+    def username_exists(self, username):
+        return username in self.members.values()
+
+    def __repr__(self):
+        return f"<HibernatedRoom {self.ROOM_ID}>"
+
+
+def hibernation_path(room):
+    return os.path.join(room.HIBERNATE_DIR, f"{room.ROOM_ID}.room")
+
+
+def idle(room, now=None):
+    """
+    Whether `room` can be hibernated: nobody sent anything to it for
+    HIBERNATE_AFTER seconds, and nothing is scheduled, running or streaming
+    in it (room timers, bot moves, frames being handled, spectators).
+    Rooms run by someone else (a tournament) stay in memory.
+    """
+    now = time.monotonic() if now is None else now
+    return (room is not main_room
+            and now - room.last_active >= room.HIBERNATE_AFTER
+            and not room.spectators.count()
+            and not room.pending_timers()
+            and not any(getattr(conn, "moves", None) for conn in room.clients)
+            and not any(room.readers[conn].busy for conn in room.clients if conn in room.readers)
+            and room.on_game_end is None and room.on_close is None)
+
+
+def freeze(room):
+    """Write `room` to disk, release its threads and return what stands for it."""
+    path = hibernation_path(room)
+    with in_room(room):
+        data = capture_snapshot()
+    if room.replay and not room.replay.finished:
+        data["replay"] = room.replay.dump()
+    write_snapshot(data, path)
+    room.spectators.close()
+    return HibernatedRoom(room, path)
+
+
+def thaw(hibernated):
+    """Load a hibernated room back and seat its connections again."""
+    data = load_snapshot(hibernated.path)
+    room = GameState(hibernated.ROOM_ID, template=main_room)
+    room.capacity = hibernated.capacity
+    with in_room(room):
+        apply_snapshot(data)
+        for conn, name in hibernated.members.items():
+            room.clients.append(conn)
+            if name:
+                room.set_username(conn, name, record=False)
+                seat = detached_seat(name)
+                if seat:
+                    rebind_seat(conn, seat)
+    if data.get("replay"):
+        room.restore_replay(data["replay"])
+    os.remove(hibernated.path)
+    return room
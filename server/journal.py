@@ -0,0 +1,188 @@
+"""Append-only, event-sourced game journal.
+
+Every state-changing action is appended as a compact binary record:
+
+    header  <I I Q B d   payload length, CRC32 of the payload, sequence number,
+                         event type, UNIX timestamp
+    payload UTF-8 fields separated by the unit separator (0x1f)
+
+Records are queued by the game threads and written by a background thread
+that fsyncs once per batch (group commit), so the game loop never waits on
+the disk. A torn record at the end of the file (crash mid-write) is ignored
+by the reader. Once a snapshot covers a sequence number, the records up to
+it are dropped from the file (see Journal.compact).
+"""
+
+import os
+import struct
+import threading
+import time
+import zlib
+
+HEADER = struct.Struct("<IIQBd")
+FIELD_SEPARATOR = "\x1f"
+
+# Event types
+JOIN = 1
+LEAVE = 2
+SEED = 3
+ROLE = 4
+PHASE = 5
+VOTE = 6
+ACTION = 7
+KILL = 8
+END = 9
+RESTART = 10
+
+EVENT_NAMES = {
+    JOIN: "JOIN",
+    LEAVE: "LEAVE",
+    SEED: "SEED",
+    ROLE: "ROLE",
+    PHASE: "PHASE",
+    VOTE: "VOTE",
+    ACTION: "ACTION",
+    KILL: "KILL",
+    END: "END",
+    RESTART: "RESTART",
+}
+
+
+def encode_record(seq, event, fields, timestamp=None):
+    """Encode one journal record to bytes."""
+    payload = FIELD_SEPARATOR.join(str(f) for f in fields).encode()
+    timestamp = time.time() if timestamp is None else timestamp
+    return HEADER.pack(len(payload), zlib.crc32(payload), seq, event, timestamp) + payload
+
+
+def read_journal(path, after_seq=0):
+    """
+    Yield (seq, event, timestamp, fields) for every valid record of a journal
+    file with a sequence number greater than `after_seq`. The file is read
+    one record at a time.
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            length, crc, seq, event, timestamp = HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                # Torn or corrupted tail, everything after it is unusable
+                break
+            if seq > after_seq:
+                fields = payload.decode().split(FIELD_SEPARATOR) if payload else []
+                yield seq, event, timestamp, fields
+
+
+def last_sequence(path):
+    """Return the sequence number of the last valid record, 0 if none."""
+    seq = 0
+    if os.path.exists(path):
+        for seq, _, _, _ in read_journal(path):
+            pass
+    return seq
+
+
+class Journal:
+    """
+    Journal file written by a background group-commit thread.
+    """
+
+    def __init__(self, path, commit_interval=0.05):
+        self.path = path
+        self.commit_interval = commit_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.seq = last_sequence(path)
+        self.written_seq = self.seq
+        self.pending = []
+        # Sequence number covered by the last snapshot, until the file is compacted
+        self.compact_upto = None
+        self.closed = False
+        self.cond = threading.Condition()
+        self.file = open(path, "ab")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def append(self, event, *fields):
+        """Queue a record. Returns its sequence number immediately."""
+        with self.cond:
+            if self.closed:
+                return None
+            self.seq += 1
+            self.pending.append(encode_record(self.seq, event, fields))
+            self.cond.notify()
+            return self.seq
+
+    def flush(self, timeout=5.0):
+        """Block until every record queued so far is on disk."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            target = self.seq
+            while self.written_seq < target and time.monotonic() < deadline:
+                self.cond.wait(0.05)
+
+    def compact(self, seq):
+        """Drop the records up to `seq`, now covered by a snapshot, from the file."""
+        with self.cond:
+            if not self.closed:
+                self.compact_upto = seq
+                self.cond.notify()
+
+    def close(self):
+        """Write out the remaining records and stop the writer thread."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _compact(self, upto):
+        """Rewrite the file without the records up to `upto`. Runs on the writer thread."""
+        self.file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as out:
+            # The last covered record stays, so the sequence goes on after a restart
+            covered = None
+            for seq, event, timestamp, fields in read_journal(self.path):
+                if seq <= upto:
+                    covered = encode_record(seq, event, fields, timestamp)
+                    continue
+                if covered:
+                    out.write(covered)
+                    covered = None
+                out.write(encode_record(seq, event, fields, timestamp))
+            if covered:
+                out.write(covered)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.path)
+        self.file = open(self.path, "ab")
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed and self.compact_upto is None:
+                    self.cond.wait()
+                closing = self.closed
+            if not closing and self.pending:
+                # Group commit: let more records pile up behind the first one
+                time.sleep(self.commit_interval)
+            with self.cond:
+                batch, self.pending = self.pending, []
+                upto = self.seq
+                compact_upto, self.compact_upto = self.compact_upto, None
+            if batch:
+                self.file.write(b"".join(batch))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            if compact_upto is not None:
+                self._compact(compact_upto)
+            with self.cond:
+                self.written_seq = upto
+                self.cond.notify_all()
+                if self.closed and not self.pending:
+                    self.file.close()
+                    return
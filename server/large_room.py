@@ -0,0 +1,99 @@
+"""Large-room mode for games with dozens or hundreds of players.
+
+The village is split into neighborhoods of about NEIGHBORHOOD_SIZE players.
+During the day each neighborhood chats on its own channel and nominates one
+suspect; once every neighborhood has nominated, the whole village votes
+between the nominees. Chat fan-out and tally traffic stay bounded by the
+neighborhood size instead of the room size.
+"""
+
+from common.protocol import encode_message
+from server.state import state
+from server.channels import neighborhood_channel
+from server.game import flush_vote_tally, schedule_vote_tally, tally_and_eliminate, eliminate, most_voted
+from utils.network import broadcast, send, publish
+
+
+def assign_neighborhoods(conns):
+    """
+    Split the players into neighborhoods and subscribe them to their channel.
+    `conns` is expected in random order so neighborhoods mix roles.
+    """
+    count = max(1, -(-len(conns) // state.NEIGHBORHOOD_SIZE))
+    state.neighborhood_of = {}
+    for i, conn in enumerate(conns):
+        index = i % count
+        state.neighborhood_of[conn] = index
+        state.channels.subscribe(neighborhood_channel(index), conn)
+        send(conn, encode_message("STATE", f"You live in neighborhood {index + 1} of {count}."))
+    state.large_room = True
+    print(f"[GAME] Large room: {len(conns)} players in {count} neighborhoods")
+
+
+def living_neighborhoods():
+    """Indexes of the neighborhoods that still have living players."""
+    return {state.neighborhood_of[c] for c, p in state.players.items()
+            if p["alive"] and c in state.neighborhood_of}
+
+
+def start_nomination():
+    """Open the first stage of the day vote."""
+    state.vote_stage = "nominate"
+    state.nominees = {}
+    for index in living_neighborhoods():
+        publish(neighborhood_channel(index), encode_message(
+            "STATE", "Nominate a suspect with /vote <name>, your neighborhood's top pick goes to the final vote."))
+
+
+def handle_large_room_vote(conn, target):
+    """
+    Record a day vote in a large room.
+    Nominations are counted per neighborhood, then the final vote is room-wide.
+    """
+    if state.vote_stage == "final":
+        if target not in state.nominees.values():
+            send(conn, encode_message("STATE", f"Choose one of the nominees: {', '.join(sorted(set(state.nominees.values())))}"))
+            return
+        state.add_vote(conn, target)
+        alive_voters = state.get_all_alive_players()
+        if all(c in state.votes for c in alive_voters):
+            flush_vote_tally()
+            state.vote_stage = None
+            tally_and_eliminate()
+        else:
+            schedule_vote_tally()
+        return
+
+    index = state.neighborhood_of.get(conn)
+    if index is None or index in state.nominees:
+        send(conn, encode_message("STATE", "Your neighborhood has already nominated a suspect."))
+        return
+    state.add_vote(conn, target)
+
+    neighbors = [c for c in state.get_all_alive_players() if state.neighborhood_of.get(c) == index]
+    if not all(c in state.votes for c in neighbors):
+        schedule_vote_tally(index)
+        return
+
+    flush_vote_tally(index)
+    nominee = most_voted(state.votes[c] for c in neighbors)
+    state.nominees[index] = nominee
+    print(f"[GAME] Neighborhood {index + 1} nominated {nominee}")
+    publish(neighborhood_channel(index), encode_message("STATE", f"Your neighborhood nominated {nominee}."))
+
+    if living_neighborhoods() <= set(state.nominees):
+        start_final_vote()
+
+
+def start_final_vote():
+    """Second stage: the whole village votes between the nominees."""
+    candidates = sorted(set(state.nominees.values()))
+    state.votes.clear()
+    state.last_tallies.clear()
+    if len(candidates) == 1:
+        # Every neighborhood agreed, no need for a final round
+        state.vote_stage = None
+        eliminate(candidates[0])
+        return
+    state.vote_stage = "final"
+    broadcast(None, encode_message("STATE", f"Final vote between: {', '.join(candidates)}"))
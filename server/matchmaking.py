@@ -0,0 +1,169 @@
+"""Matchmaking queue that forms rooms by size and rating.
+
+Players queue for a room size (6, 8, 10 or 12, the tables of assign_roles) or
+for any size. Tickets are bucketed by (size, rating band) in FIFO order, so
+a match is found by looking at a couple of buckets whatever the length of
+the queue. A ticket waiting longer than `widen_after` seconds may also match
+players of the neighboring band; a sweep thread retries those.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from common.protocol import encode_message
+from server import rooms
+from server.game import start_game
+from server.state import run_in_room
+from utils.network import send
+
+ROOM_SIZES = (6, 8, 10, 12)
+# Size of the tickets of players happy with any room size
+ANY_SIZE = 0
+
+
+class Ticket:
+    __slots__ = ("conn", "name", "rating", "size", "band", "queued")
+
+    def __init__(self, conn, name, rating, size, band, queued=None):
+        self.conn = conn
+        self.name = name
+        self.rating = rating
+        self.size = size
+        self.band = band
+        self.queued = time.monotonic() if queued is None else queued
+
+
+class Matchmaker:
+    """
+    Bucketed queue of waiting players. Full rooms are created and started
+    as soon as a bucket (or two neighboring ones) can fill them.
+    """
+
+    def __init__(self, band_width=200.0, widen_after=30.0, sweep_interval=2.0):
+        self.band_width = band_width
+        self.widen_after = widen_after
+        self.sweep_interval = sweep_interval
+        self.lock = threading.Lock()
+        # (size, band) -> OrderedDict conn -> Ticket, oldest first
+        self.buckets = {}
+        self.tickets = {}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def band_of(self, rating):
+        return int(rating // self.band_width)
+
+    def enqueue(self, conn, name, rating, size=ANY_SIZE, queued=None):
+        """
+        Queue a player, replacing their previous ticket. Returns the ticket.
+        `queued` puts a ticket back in line with its original enqueue time.
+        """
+        with self.lock:
+            self._remove(conn)
+            ticket = Ticket(conn, name, rating, size, self.band_of(rating), queued)
+            bucket = self.buckets.setdefault((size, ticket.band), OrderedDict())
+            bucket[conn] = ticket
+            if queued is not None:
+                # Back to its place in line: after the tickets queued before it
+                for other in [t for t in bucket.values() if t.queued > queued and t is not ticket]:
+                    bucket.move_to_end(other.conn)
+            self.tickets[conn] = ticket
+            sizes = (size,) if size else ROOM_SIZES[::-1]
+            match = None
+            for room_size in sizes:
+                match = self._take(room_size, (ticket.band,))
+                if match:
+                    break
+        if match:
+            self.form_room(match)
+        return ticket
+
+    def dequeue(self, conn):
+        """Leave the queue. Returns False if the player was not queued."""
+        with self.lock:
+            return self._remove(conn)
+
+    def queued(self):
+        return len(self.tickets)
+
+    def _remove(self, conn):
+        ticket = self.tickets.pop(conn, None)
+        if ticket is None:
+            return False
+        key = (ticket.size, ticket.band)
+        bucket = self.buckets[key]
+        del bucket[conn]
+        if not bucket:
+            del self.buckets[key]
+        return True
+
+    def _take(self, size, bands):
+        """Pop `size` tickets for a room from the given bands, or None if there aren't enough."""
+        keys = [(size, band) for band in bands] + [(ANY_SIZE, band) for band in bands]
+        if sum(len(self.buckets.get(key, ())) for key in keys) < size:
+            return None
+        # Oldest first, players who asked for this size before flexible ones
+        picked = []
+        for key in keys:
+            bucket = self.buckets.get(key)
+            while bucket and len(picked) < size:
+                _, ticket = bucket.popitem(last=False)
+                del self.tickets[ticket.conn]
+                picked.append(ticket)
+            if key in self.buckets and not self.buckets[key]:
+                del self.buckets[key]
+        return picked
+
+    def _oldest(self, band):
+        oldest = None
+        for size in (ANY_SIZE,) + ROOM_SIZES:
+            bucket = self.buckets.get((size, band))
+            if bucket:
+                ticket = next(iter(bucket.values()))
+                if oldest is None or ticket.queued < oldest:
+                    oldest = ticket.queued
+        return oldest
+
+    def sweep(self):
+        """Match long-waiting players with the neighboring rating band."""
+        matches = []
+        stale = time.monotonic() - self.widen_after
+        with self.lock:
+            bands = sorted({band for _, band in self.buckets})
+            for band in bands:
+                if band + 1 not in bands:
+                    continue
+                oldest = [self._oldest(b) for b in (band, band + 1)]
+                if not any(t is not None and t <= stale for t in oldest):
+                    continue
+                for size in ROOM_SIZES[::-1]:
+                    match = self._take(size, (band, band + 1))
+                    while match:
+                        matches.append(match)
+                        match = self._take(size, (band, band + 1))
+        for match in matches:
+            self.form_room(match)
+
+    def form_room(self, tickets):
+        """Move the matched players to a new room and start their game."""
+        # Players may have left, or been dealt into a game, between the match and now
+        size = len(tickets)
+        tickets = [t for t in tickets if rooms.room_of(t.conn).get_username(t.conn) == t.name
+                   and not rooms.playing_a_game(t.conn)]
+        if len(tickets) < size:
+            # Only full rooms are formed: the others wait for the next match
+            for ticket in tickets:
+                self.enqueue(ticket.conn, ticket.name, ticket.rating, ticket.size, ticket.queued)
+            return
+        room = rooms.create_room("match", capacity=len(tickets))
+        for ticket in tickets:
+            rooms.move_connection(ticket.conn, room)
+            send(ticket.conn, encode_message("STATE", f"Match found: {len(tickets)}-player room {room.ROOM_ID}."))
+        print(f"[MATCH] Started {room.ROOM_ID} with {len(tickets)} players")
+        # Dealing the roles takes a while, don't hold up the queue
+        run_in_room(room, start_game)
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep()
@@ -0,0 +1,132 @@
+"""Per-connection outbound queues with priority lanes.
+
+Game-critical frames (roles, state changes, kills, role prompts, game
+announcements) go to the control lane and are always written before anything
+waiting in the chat lane, so a witch prompt never sits behind a burst of chat
+lines. Only chat relayed from players is sent through the chat lane: the lane
+follows where a frame comes from, not its type, since the game also announces
+things with MSG frames.
+
+Frames queued during one tick are coalesced into a single scatter-gather
+write, so a phase change that emits several frames costs one syscall.
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+
+CONTROL = 0
+# Player chat: low priority, dropped first
+CHAT = 1
+
+# Most buffers handed to a single sendmsg call (stays under IOV_MAX)
+MAX_BATCH = 512
+
+
+class Outbox:
+    """
+    Queues frames for one connection and writes them from a dedicated thread.
+    The chat lane is bounded: when it is full the oldest chat frame is dropped.
+    The control lane is bounded too: game frames can't be dropped, so a client
+    that falls that far behind is disconnected.
+    """
+
+    def __init__(self, conn, chat_limit=256, tick=0.005, control_limit=4096):
+        self.conn = conn
+        self.chat_limit = chat_limit
+        self.control_limit = control_limit
+        self.tick = tick
+        self.lanes = (deque(), deque())
+        self.dropped = 0
+        self.writing = False
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, data, lane=CONTROL):
+        """Queue already encoded bytes on the given lane."""
+        with self.cond:
+            if self.closed:
+                return
+            queue = self.lanes[lane]
+            overflow = lane == CONTROL and len(queue) >= self.control_limit
+            if overflow:
+                self.closed = True
+            else:
+                if lane == CHAT and len(queue) >= self.chat_limit:
+                    queue.popleft()
+                    self.dropped += 1
+                queue.append(data)
+            self.cond.notify()
+        if overflow:
+            self.disconnect()
+
+    def disconnect(self):
+        """Drop a client that stopped reading: its handler sees the socket closed and cleans up."""
+        print(f"[OUTBOX] {self.control_limit} game frames waiting, disconnecting {self.conn}")
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def wait_drained(self, timeout):
+        """Wait until every queued frame has been written, up to `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.cond:
+                if self.closed or not (self.writing or self.lanes[CONTROL] or self.lanes[CHAT]):
+                    return
+            time.sleep(0.01)
+
+    def close(self):
+        """Stop the writer thread. Frames still queued are discarded."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def _wait(self):
+        with self.cond:
+            while not self.closed and not (self.lanes[CONTROL] or self.lanes[CHAT]):
+                self.cond.wait()
+            return not self.closed
+
+    def _take_batch(self):
+        """Pop everything queued, control lane first, up to MAX_BATCH frames."""
+        batch = []
+        with self.cond:
+            self.writing = True
+            for queue in self.lanes:
+                while queue and len(batch) < MAX_BATCH:
+                    batch.append(queue.popleft())
+        return batch
+
+    def _write(self, batch):
+        if not hasattr(self.conn, "sendmsg"):
+            self.conn.sendall(b"".join(batch))
+            return
+        # sendmsg may write only part of the batch, resume where it stopped
+        while batch:
+            sent = self.conn.sendmsg(batch)
+            while batch and sent >= len(batch[0]):
+                sent -= len(batch[0])
+                batch.pop(0)
+            if sent:
+                batch[0] = batch[0][sent:]
+
+    def _run(self):
+        while self._wait():
+            # Let the rest of the current game transition queue its frames
+            if self.tick:
+                time.sleep(self.tick)
+            batch = self._take_batch()
+            try:
+                if batch:
+                    self._write(batch)
+            except OSError:
+                # The reader side notices the broken socket and cleans up
+                self.close()
+                return
+            finally:
+                self.writing = False
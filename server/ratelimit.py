@@ -0,0 +1,43 @@
+"""Per-connection token buckets used to throttle chat and vote spam."""
+
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens are added per second up to `capacity`.
+    Each allowed message consumes one token. Refilling is computed lazily so
+    a check is O(1) and needs no background timer.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "last")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    def consume(self, amount=1):
+        """Take `amount` tokens if available. Return False when throttled."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+
+class RateLimiter:
+    """
+    Holds one bucket per budget ("chat", "vote", "night_chat", ...) for a connection.
+    """
+
+    def __init__(self, limits):
+        self.buckets = {name: TokenBucket(rate, capacity) for name, (rate, capacity) in limits.items()}
+
+    def allow(self, budget):
+        """Return True if a message counted against `budget` may go through."""
+        bucket = self.buckets.get(budget)
+        return bucket is None or bucket.consume()
@@ -0,0 +1,123 @@
+"""Team-based Elo ratings.
+
+When a game ends, both teams get a rating: the role-weighted average of their
+members' ratings. Each player then moves by K * (result - expected), scaled by
+their role's weight within the team. Updates run on a worker thread against
+an in-memory cache. Changed ratings are flushed to the stats database every
+flush interval, and the leaderboard is rebuilt at the same time, so lookups
+and leaderboard reads never sort or touch the disk.
+"""
+
+import heapq
+import threading
+import time
+from server.stats import team_of
+
+# How much a role weighs on its team's result
+ROLE_WEIGHTS = {
+    "werewolf": 1.0,
+    "villager": 1.0,
+    "seer": 1.3,
+    "witch": 1.2,
+    "hunter": 1.1,
+}
+
+UPSERT_RATING = "INSERT OR REPLACE INTO ratings VALUES (?, ?, ?)"
+
+
+def expected_score(rating, opponent):
+    return 1.0 / (1.0 + 10 ** ((opponent - rating) / 400.0))
+
+
+def team_rating(members):
+    """Role-weighted average rating of [(name, role, rating)]."""
+    total = sum(ROLE_WEIGHTS.get(role, 1.0) for _, role, _ in members)
+    return sum(ROLE_WEIGHTS.get(role, 1.0) * rating for _, role, rating in members) / total
+
+
+class RatingEngine:
+    """
+    In-memory rating cache updated off the game loop and flushed periodically.
+    """
+
+    def __init__(self, store, k=32.0, default=1500.0, flush_interval=30.0, leaderboard_size=100):
+        self.store = store
+        self.k = k
+        self.default = default
+        self.flush_interval = flush_interval
+        self.leaderboard_size = leaderboard_size
+        # name -> (rating, games)
+        self.ratings = {name: (rating, games) for name, rating, games in
+                        store.query("SELECT name, rating, games FROM ratings")}
+        self.top = self._build_leaderboard()
+        self.dirty = set()
+        self.pending = []
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def rating(self, name):
+        """(rating, games played) of a player."""
+        return self.ratings.get(name, (self.default, 0))
+
+    def leaderboard(self, n=10):
+        """Top `n` [(name, rating, games)] as of the last flush."""
+        return self.top[:n]
+
+    def submit_game(self, players, winner):
+        """Queue a finished game. `players` are {"name", "role"} dicts."""
+        with self.cond:
+            if self.closed:
+                return
+            self.pending.append(([(p["name"], p["role"]) for p in players], winner))
+            self.cond.notify()
+
+    def close(self):
+        """Apply the queued games, flush every changed rating and stop the worker."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _update(self, players, winner):
+        teams = {}
+        for name, role in players:
+            teams.setdefault(team_of(role), []).append((name, role, self.rating(name)[0]))
+        if len(teams) != 2:
+            return
+        strength = {team: team_rating(members) for team, members in teams.items()}
+        for team, members in teams.items():
+            opponent = next(other for other in strength if other != team)
+            delta = self.k * ((1.0 if team == winner else 0.0) - expected_score(strength[team], strength[opponent]))
+            mean_weight = sum(ROLE_WEIGHTS.get(role, 1.0) for _, role, _ in members) / len(members)
+            for name, role, rating in members:
+                games = self.rating(name)[1]
+                self.ratings[name] = (rating + delta * ROLE_WEIGHTS.get(role, 1.0) / mean_weight, games + 1)
+                self.dirty.add(name)
+
+    def _build_leaderboard(self):
+        best = heapq.nlargest(self.leaderboard_size, self.ratings.items(), key=lambda item: item[1][0])
+        return [(name, round(rating, 1), games) for name, (rating, games) in best]
+
+    def _flush(self):
+        dirty, self.dirty = self.dirty, set()
+        if dirty:
+            self.store.submit(UPSERT_RATING, [(name, *self.ratings[name]) for name in dirty])
+            self.top = self._build_leaderboard()
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed and time.monotonic() < next_flush:
+                    self.cond.wait(max(0.0, next_flush - time.monotonic()))
+                games, self.pending = self.pending, []
+                closing = self.closed
+            for players, winner in games:
+                self._update(players, winner)
+            if closing or time.monotonic() >= next_flush:
+                self._flush()
+                next_flush = time.monotonic() + self.flush_interval
+            if closing:
+                return
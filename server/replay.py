@@ -0,0 +1,111 @@
+"""Records a game as a replay file (see common/replay.py for the format).
+
+The recorder sees every public frame the room broadcasts plus the secret
+events from the journal (dealt roles, night actions, werewolf and dead chat),
+flagged as SECRET, and takes a checkpoint of the players at each phase change,
+where the frames of the phase that ended are spooled to disk.
+"""
+
+import os
+import threading
+import time
+from common import replay
+from server import journal
+
+
+class ReplayRecorder:
+    """
+    Records the frames of one game. Only the current phase is kept in
+    memory: its frames are spooled to disk at each phase boundary.
+    `saved` goes on with a recording saved by dump().
+    """
+
+    def __init__(self, path, players_snapshot, finish_delay=1.0, saved=None):
+        self.path = path
+        self.players_snapshot = players_snapshot
+        self.finish_delay = finish_delay
+        self.lock = threading.Lock()
+        # Frames of the current phase
+        self.events = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if saved is None:
+            self.start = time.time()
+            self.day = 0
+            self.spool = replay.ReplaySpool(path, self.start)
+            self.spool.add_phase(replay.SETUP, 0, self.checkpoint("setup"))
+        else:
+            self.start = saved["start"]
+            self.day = saved["day"]
+            self.spool = replay.ReplaySpool(path, self.start, saved["phases"], saved["events"], saved["strings"])
+        # The game ended: the file is written once the final broadcasts are in
+        self.ending = False
+        self.finished = False
+
+    def dump(self):
+        """Spool what is still in memory and return what is needed to go on with the recording."""
+        with self.lock:
+            self.spool.add_events(self.events)
+            self.events = []
+            return {"path": self.path, "start": self.start, "day": self.day, **self.spool.state()}
+
+    def checkpoint(self, phase):
+        return {"phase": phase, "day": self.day, "players": self.players_snapshot()}
+
+    def frame(self, message, flags=0):
+        """Record one frame sent during the game."""
+        with self.lock:
+            if not self.finished:
+                self.events.append((time.time() - self.start, message.rstrip("\n"), flags))
+
+    def secret(self, text):
+        self.frame(f"SECRET|{text}", replay.SECRET)
+
+    def on_event(self, event, fields):
+        """Turn a journaled event into replay frames and phase boundaries."""
+        if self.ending:
+            # Only the final broadcasts still belong to this game
+            return
+        if event == journal.ROLE:
+            self.secret(f"{fields[0]} is a {fields[1]}")
+        elif event == journal.ACTION:
+            actor, action = fields[0], fields[1]
+            if action == "seer":
+                self.secret(f"Seer {actor} inspected {fields[2]}")
+            elif action == "target":
+                self.secret(f"The werewolves chose {fields[2] or 'nobody'}")
+            elif action == "hunter_shoot":
+                self.secret(f"Hunter {actor} shot {fields[2]}")
+            elif action == "witch_save":
+                self.secret(f"Witch {actor} saved the victim")
+            elif action.startswith("witch_kill:"):
+                self.secret(f"Witch {actor} poisoned {action.split(':', 1)[1]}")
+            elif action == "witch_none":
+                self.secret(f"Witch {actor} did nothing")
+        elif event == journal.PHASE and fields[0] in replay.PHASE_KINDS:
+            with self.lock:
+                if self.finished:
+                    return
+                if fields[0] == "night":
+                    self.day += 1
+                self.spool.add_events(self.events)
+                self.events = []
+                self.spool.add_phase(replay.PHASE_KINDS[fields[0]], self.day, self.checkpoint(fields[0]))
+        elif event in (journal.END, journal.RESTART):
+            # Keep the final broadcasts that follow the end of the game
+            self.ending = True
+            timer = threading.Timer(self.finish_delay, self.finish)
+            timer.daemon = True
+            timer.start()
+
+    def finish(self):
+        """Write the replay file. Runs off the game loop."""
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            self.spool.add_events(self.events)
+            self.events = []
+        self.spool.finish()
+        print(f"[REPLAY] Saved {self.spool.event_count} events to {self.path}")
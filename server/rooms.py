@@ -0,0 +1,208 @@
+"""Rooms hosted by this server process.
+
+Connections land in the main room. Other rooms (matchmaking, ...) are created
+at runtime, each with a GameState of its own. `state` refers to the room bound
+to the current thread (see server.state): a handler thread binds to its
+connection's room before dispatching each frame.
+
+Only the main room survives a crash: it alone is journaled, and snapshots
+and --restore cover it alone. Other room ids differ from one server process
+to the next, so a new room never picks up the hibernation file of an old one.
+
+Idle rooms are hibernated (see server.hibernation): `rooms` and `conn_rooms`
+then hold a HibernatedRoom, which `wake` swaps back for a live GameState.
+"""
+
+import itertools
+import threading
+import time
+import uuid
+from common.protocol import encode_message
+from server.state import GameState, main_room, in_room
+from server import hibernation
+from server.hibernation import HibernatedRoom
+from utils.network import send, broadcast
+
+rooms = {main_room.ROOM_ID: main_room}
+# Connections outside the main room -> their room
+conn_rooms = {}
+rooms_lock = threading.Lock()
+_room_numbers = itertools.count(1)
+# Tells the rooms of this process apart from those of earlier runs
+_run_tag = uuid.uuid4().hex[:6]
+
+
+def room_of(conn):
+    """The room of `conn`, which may be hibernated."""
+    return conn_rooms.get(conn, main_room)
+
+
+def active_room_of(conn):
+    """The live room of `conn`, woken up if needed, marked as active."""
+    while True:
+        room = wake(room_of(conn))
+        room.last_active = time.monotonic()
+        # Hibernation only takes rooms idle before this stamp: if the room is
+        # still there now, it stays up while the frame is handled
+        if room_of(conn) is room:
+            return room
+
+
+def get_room(room_id):
+    return rooms.get(room_id)
+
+
+def create_room(prefix="room", capacity=None):
+    """Create an empty room with the settings of the main room."""
+    with rooms_lock:
+        room_id = f"{prefix}-{_run_tag}-{next(_room_numbers)}"
+        room = GameState(room_id, template=main_room)
+        if capacity:
+            room.capacity = capacity
+        rooms[room_id] = room
+    print(f"[ROOMS] Created room {room_id}")
+    return room
+
+
+def close_room(room):
+    """Drop an empty room."""
+    if room is main_room:
+        return
+    with rooms_lock:
+        if rooms.get(room.ROOM_ID) is not room:
+            return
+        del rooms[room.ROOM_ID]
+        # Bots left behind
+        for conn in room.clients:
+            conn_rooms.pop(conn, None)
+    with room.tally_lock:
+        for timer in room.tally_timers.values():
+            timer.cancel()
+        room.tally_timers.clear()
+    room.close_journal()
+    room.spectators.close()
+    if room.replay and not room.replay.finished:
+        # Keep what was recorded of the interrupted game, and free its spool files
+        room.replay.finish()
+    print(f"[ROOMS] Closed room {room.ROOM_ID}")
+    if room.on_close:
+        room.on_close(room)
+
+
+def close_if_empty(room):
+    if room is not main_room and not room.humans() and not room.spectators.count():
+        close_room(room)
+
+
+def assign(conn, room):
+    """Route the frames of `conn` to `room`."""
+    with rooms_lock:
+        if room is main_room:
+            conn_rooms.pop(conn, None)
+        else:
+            conn_rooms[conn] = room
+
+
+def move_connection(conn, room):
+    """
+    Move a player to another room. The connection keeps its outbox, rate
+    limiter and reader, only its room membership changes.
+    """
+    source = wake(room_of(conn))
+    room = wake(room)
+    if source is room:
+        return
+    with in_room(source):
+        username = source.detach_client(conn)
+    assign(conn, room)
+    with in_room(room):
+        room.attach_client(conn, username)
+        send_roster(conn, room)
+        broadcast(conn, encode_message("JOIN", username))
+    close_if_empty(source)
+
+
+def hibernate(room):
+    """Swap an idle room for its on-disk form. Returns the HibernatedRoom, or None."""
+    with rooms_lock:
+        if rooms.get(room.ROOM_ID) is not room or not hibernation.idle(room):
+            return None
+        hibernated = hibernation.freeze(room)
+        rooms[room.ROOM_ID] = hibernated
+        for conn in hibernated.members:
+            conn_rooms[conn] = hibernated
+    print(f"[ROOMS] Hibernated room {room.ROOM_ID} ({len(hibernated.members)} connections)")
+    return hibernated
+
+
+def wake(room):
+    """Return the live GameState of `room`, loading it back if it hibernates."""
+    if not isinstance(room, HibernatedRoom):
+        return room
+    with rooms_lock:
+        current = rooms.get(room.ROOM_ID)
+        if isinstance(current, HibernatedRoom):
+            live = hibernation.thaw(current)
+            rooms[live.ROOM_ID] = live
+            print(f"[ROOMS] Woke room {live.ROOM_ID} up")
+        else:
+            # Woken up by another thread meanwhile, or closed since
+            live = current or main_room
+        # Route the connections still pointing at a stale HibernatedRoom to the
+        # live room, so room_of() agrees with what we return
+        stale = (room, current)
+        members = list(room.members) + (list(current.members) if isinstance(current, HibernatedRoom) else [])
+        for conn in members:
+            if any(conn_rooms.get(conn) is old for old in stale):
+                if live is main_room:
+                    conn_rooms.pop(conn, None)
+                else:
+                    conn_rooms[conn] = live
+    return live
+
+
+def hibernate_idle():
+    """Hibernate every idle room. Returns how many were."""
+    idle = [room for room in list(rooms.values()) if isinstance(room, GameState) and hibernation.idle(room)]
+    return sum(1 for room in idle if hibernate(room))
+
+
+def start_hibernation(interval):
+    """Look for idle rooms every `interval` seconds on a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                hibernate_idle()
+            except OSError as e:
+                print(f"[ROOMS] Failed to hibernate a room: {e}")
+    threading.Thread(target=run, daemon=True).start()
+
+
+def playing_a_game(conn):
+    """True while the player is alive in a game that hasn't ended, in whatever room."""
+    room = room_of(conn)
+    if room.game_state in ("waiting", "end"):
+        return False
+    # A hibernated room only remembers its phase
+    return isinstance(room, HibernatedRoom) or room.players.get(conn, {}).get("alive", False)
+
+
+def send_roster(conn, room):
+    """Have the client start a fresh player list for `room`."""
+    send(conn, encode_message("ROOM", room.ROOM_ID))
+    for other in list(room.clients):
+        if other is not conn and room.get_username(other):
+            send(conn, encode_message("JOIN", room.get_username(other)))
+
+
+def forget_connection(conn):
+    """Called once a disconnected client has been removed from its room."""
+    with rooms_lock:
+        room = conn_rooms.pop(conn, None)
+    if room is not None:
+        close_if_empty(room)
+
+
+def username_taken(username):
+    return any(room.username_exists(username) for room in list(rooms.values()))
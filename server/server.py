@@ -3,21 +3,52 @@
 import os
 import sys
 import socket
+import argparse
 import threading
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
 
-from server.state import state
+from common.protocol import encode_message
+from server.state import state, main_room
 from server.handler import handle_client
+from server.ratelimit import TokenBucket
+from server.snapshot import SnapshotWriter, restore_room
+from server.matchmaking import Matchmaker
+from server.directory import RoomDirectory
+from server.tournament import Tournament
+from server.bots import BotBrains
+from server import upgrade, rooms
 
 
-def start_server():
+def reject_connection(conn, reason):
     """
-    Start the server and listen for incoming connections.
-    Accepts connections and spawns a new thread for each client.
+    Tell a client why it was refused and close the socket right away.
     """
+    print(f"[SERVER] Rejected connection: {reason}")
+    try:
+        conn.settimeout(0.5)
+        conn.sendall((encode_message("STATE", reason) + "\n").encode())
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+def serve_client(conn, addr, reader=None):
+    """
+    Run the client handler and free its admission slot when it is done.
+    """
+    try:
+        handle_client(conn, addr, reader)
+    finally:
+        # Admission is counted server-wide, on the main room
+        main_room.release_connection(addr[0], conn)
+
+
+def create_listener():
+    """Create the listening TCP socket."""
     # Create a TCP socket
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     # Allow address reuse to avoid "address already in use" errors
@@ -25,15 +56,70 @@ def start_server():
     # Bind the socket to the host and port specified in state
     server.bind((state.HOST, state.PORT))
     # Start listening for incoming connections
-    server.listen()
+    server.listen(state.LISTEN_BACKLOG)
+    return server
+
+
+def start_server(restore=False, takeover=False, tournament=None):
+    """
+    Start the server and listen for incoming connections.
+    Accepts connections and spawns a new thread for each client.
+    With `restore`, the room is rebuilt from its latest snapshot and journal first.
+    With `takeover`, the listening socket, the connections and the room are
+    taken over from the server currently running.
+    `tournament` (rounds, games per table, table size, registration seconds)
+    opens a tournament that starts on its own once registration closes.
+    """
+    inherited = []
+    if takeover:
+        server, inherited = upgrade.take_over()
+    else:
+        if restore:
+            restore_room()
+        server = create_listener()
     print(f"[SERVER] Listening on {state.HOST}:{state.PORT}")
+    state.open_journal()
+    state.open_stats()
+    if state.MATCHMAKING:
+        state.matchmaker = Matchmaker(state.MATCH_BAND_WIDTH, state.MATCH_WIDEN_AFTER,
+                                      state.MATCH_SWEEP_INTERVAL)
+    state.directory = RoomDirectory(state.DIRECTORY_TICK)
+    if state.BOTS:
+        state.bots = BotBrains(state.BOT_WORKERS, state.BOT_ACTION_DELAY)
+    if state.HIBERNATE_AFTER:
+        rooms.start_hibernation(state.HIBERNATE_SWEEP_INTERVAL)
+    if tournament:
+        rounds, games, table_size, registration = tournament
+        state.tournament = Tournament("cup", rounds, games, table_size,
+                                      state.TOURNAMENT_GAME_BREAK, state.TOURNAMENT_ROUND_BREAK)
+        threading.Timer(registration, state.tournament.start).start()
+        print(f"[TOURNAMENT] Registration open for {registration:.0f} seconds")
+    snapshots = SnapshotWriter(state.SNAPSHOT_INTERVAL)
+    for conn, addr, reader in inherited:
+        threading.Thread(target=serve_client, args=(conn, addr, reader), daemon=True).start()
+    if upgrade.supported():
+        upgrade.UpgradeListener(server)
+    # Smooths out reconnect storms before they turn into thousands of threads
+    accept_bucket = TokenBucket(*state.ACCEPT_RATE)
 
     try:
         while True:
+            # Poll so a frozen server stops accepting during a hand-over
+            if not upgrade.wait_readable(server, 0.5) or state.frozen:
+                continue
             # Accept a new client connection
             conn, addr = server.accept()
+            if not accept_bucket.consume():
+                reject_connection(conn, "Server is busy, try again in a few seconds.")
+                continue
+            reason = state.admit_connection(addr[0])
+            if reason:
+                reject_connection(conn, reason)
+                continue
+            # Frames are already coalesced by the outbox, don't let Nagle delay them
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             # Spawn a new thread to handle the client
-            thread = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
+            thread = threading.Thread(target=serve_client, args=(conn, addr), daemon=True)
             thread.start()
     except KeyboardInterrupt:
         # Handle graceful shutdown on keyboard interrupt
@@ -44,7 +130,27 @@ def start_server():
             conn.close()
         # Close the server socket
         server.close()
+        # Take a last snapshot and make sure every journaled event reaches the disk
+        snapshots.stop()
+        if state.replay and not state.replay.finished:
+            state.replay.finish()
+        state.close_journal()
+        state.close_stats()
+        if state.bots:
+            state.bots.close()
 
 
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Werewolf game server")
+    parser.add_argument("--restore", action="store_true",
+                        help="restore the room from its latest snapshot and journal")
+    parser.add_argument("--takeover", action="store_true",
+                        help="take over the listening socket and connections of the running server")
+    parser.add_argument("--tournament", nargs=4, type=float, metavar=("ROUNDS", "GAMES", "TABLE_SIZE", "REGISTRATION"),
+                        help="run a tournament: rounds, games per table, table size and seconds of registration")
+    args = parser.parse_args()
+    tournament = None
+    if args.tournament:
+        rounds, games, table_size, registration = args.tournament
+        tournament = (int(rounds), int(games), int(table_size), registration)
+    start_server(restore=args.restore, takeover=args.takeover, tournament=tournament)
\ No newline at end of file
@@ -0,0 +1,320 @@
+"""Crash recovery: periodic GameState snapshots plus journal tail replay.
+
+A snapshot is a compact JSON copy of the room (players, roles, votes, phase
+and pending night prompts) tagged with the journal sequence number it covers.
+Capturing only copies plain values, the serialization and the fsync happen
+on the snapshot thread. On restart the latest snapshot is loaded and the
+journal records written after it are replayed on top.
+
+Connections do not survive a restart, so restored players are held by
+DetachedSeat placeholders until they reconnect with the same username.
+
+Only the main room is snapshotted and restored. Rooms created at runtime
+(matchmaking, CREATE_ROOM, tournaments) are lost with the process, their
+players would have to be moved back to them on reconnect.
+"""
+
+import json
+import os
+import threading
+import time
+import random
+from common.protocol import encode_message
+from server import journal
+from server.state import state
+from server.channels import PUBLIC, WOLVES, DEAD, dm, neighborhood_channel
+from utils.network import send
+
+
+class DetachedSeat:
+    """Stands in for the connection of a restored player until they reconnect."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def sendall(self, data):
+        # Nobody is listening, the player gets a fresh state on reconnect
+        pass
+
+    def __repr__(self):
+        return f"<DetachedSeat {self.name}>"
+
+
+def snapshot_path():
+    return os.path.join(state.JOURNAL_DIR, f"{state.ROOM_ID}.snapshot")
+
+
+def journal_path():
+    return os.path.join(state.JOURNAL_DIR, f"{state.ROOM_ID}.journal")
+
+
+def capture_snapshot():
+    """Copy the room into plain values. Cheap: O(players), no I/O."""
+    # Read the sequence number first: anything journaled while we copy is replayed again
+    seq = state.journal.seq if state.journal else 0
+    players = list(state.players.items())
+
+    def name_of(conn):
+        if conn in state.players:
+            return state.players[conn]["name"]
+        return state.usernames.get(conn)
+
+    pending = state.night_pending
+    return {
+        "room": state.ROOM_ID,
+        "seq": seq,
+        "time": time.time(),
+        "phase": state.game_state,
+        "players": [
+            {"name": p["name"], "role": p["role"], "alive": p["alive"],
+             "hood": state.neighborhood_of.get(c)}
+            for c, p in players
+        ],
+        "votes": {name_of(c): target for c, target in list(state.votes.items()) if name_of(c)},
+        "night": {
+            "pending": sorted(pending) if pending is not None else None,
+            "victim": name_of(state.night_victim) if state.night_victim else None,
+            "saved": state.night_saved,
+            "poisoned": name_of(state.night_poisoned) if state.night_poisoned else None,
+        },
+        "large_room": state.large_room,
+        "vote_stage": state.vote_stage,
+        "nominees": {str(k): v for k, v in state.nominees.items()},
+        "seed": state.seed,
+        "rng": state.rng.getstate(),
+        "game_started": state.game_started,
+        "day": state.day,
+        "vote_log": state.vote_log,
+        "hunter_shots": sorted(name_of(c) for c in list(state.hunter_shots)),
+    }
+
+
+def write_snapshot(data, path=None):
+    """Atomically replace the snapshot file with `data`."""
+    path = path or snapshot_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_snapshot(path=None):
+    """Return the latest snapshot, or None if there is none."""
+    path = path or snapshot_path()
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class SnapshotWriter:
+    """Background thread writing a snapshot of the main room whenever its journal moved on."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last_seq = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def snapshot_now(self):
+        seq = state.journal.seq if state.journal else 0
+        if seq == self.last_seq:
+            return
+        data = capture_snapshot()
+        write_snapshot(data)
+        self.last_seq = seq
+        if state.journal:
+            # The journal only needs what the snapshot doesn't cover
+            state.journal.compact(data["seq"])
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.snapshot_now()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.snapshot_now()
+            except OSError as e:
+                print(f"[SNAPSHOT] Failed to write snapshot: {e}")
+
+
+# Restore
+
+def seat_for(name):
+    """Return the seat holding `name`, creating a detached one if needed."""
+    for conn, p in state.players.items():
+        if p["name"] == name:
+            return conn
+    return DetachedSeat(name)
+
+
+def apply_snapshot(data):
+    """Rebuild the room from a snapshot, with detached seats for every player."""
+    state.game_state = data["phase"]
+    state.players = {}
+    state.neighborhood_of = {}
+    for p in data["players"]:
+        seat = DetachedSeat(p["name"])
+        state.players[seat] = {"name": p["name"], "role": p["role"], "alive": p["alive"]}
+        if p.get("hood") is not None:
+            state.neighborhood_of[seat] = p["hood"]
+    state.votes = {seat_for(voter): target for voter, target in data["votes"].items()}
+    night = data["night"]
+    state.night_pending = set(night["pending"]) if night["pending"] is not None else None
+    state.night_victim = seat_for(night["victim"]) if night["victim"] else None
+    state.night_saved = night["saved"]
+    state.night_poisoned = seat_for(night["poisoned"]) if night["poisoned"] else None
+    state.large_room = data["large_room"]
+    state.vote_stage = data["vote_stage"]
+    state.nominees = {int(k): v for k, v in data["nominees"].items()}
+    state.seed = data.get("seed")
+    if data.get("rng"):
+        version, internal, gauss = data["rng"]
+        state.rng.setstate((version, tuple(internal), gauss))
+    state.game_started = data.get("game_started", 0.0)
+    state.day = data.get("day", 0)
+    state.vote_log = [tuple(vote) for vote in data.get("vote_log", [])]
+    state.hunter_shots = {seat_for(name) for name in data.get("hunter_shots", [])}
+
+
+def apply_event(event, fields, timestamp=0.0):
+    """Replay one journal record on the room without notifying anyone."""
+    if event == journal.ROLE:
+        name, role = fields
+        state.players[seat_for(name)] = {"name": name, "role": role, "alive": True}
+    elif event == journal.PHASE:
+        state.game_state = fields[0]
+        if fields[0] == "night":
+            state.day += 1
+        if fields[0] in ("waiting", "day", "night"):
+            state.votes.clear()
+        if fields[0] == "night":
+            living = {p["role"] for p in state.players.values() if p["alive"]}
+            pending = {"seer"} & living | ({"wolves"} if "werewolf" in living else set()) | {"witch"} & living
+            state.reset_night(pending)
+    elif event == journal.VOTE:
+        phase, voter, target = fields
+        state.votes[seat_for(voter)] = target
+        state.vote_log.append((state.day, phase, voter, target))
+    elif event == journal.SEED:
+        state.seed = int(fields[0])
+        state.rng = random.Random(state.seed)
+        state.game_started = timestamp
+        state.day = 0
+        state.vote_log = []
+    elif event == journal.ACTION:
+        action = fields[1]
+        if state.night_pending is not None:
+            if action == "target":
+                state.night_victim = seat_for(fields[2]) if fields[2] else None
+                state.night_pending.discard("wolves")
+            elif action == "seer":
+                state.night_pending.discard("seer")
+            elif action.startswith("witch_"):
+                state.night_pending.discard("witch")
+                if action == "witch_save":
+                    state.night_saved = True
+                elif action.startswith("witch_kill:"):
+                    state.night_poisoned = seat_for(action.split(":", 1)[1])
+    elif event == journal.KILL:
+        seat = seat_for(fields[0])
+        if seat in state.players:
+            state.players[seat]["alive"] = False
+    elif event == journal.END:
+        state.game_state = "end"
+    elif event == journal.RESTART:
+        state.reset_room()
+
+
+def restore_room():
+    """
+    Load the latest snapshot and replay the journal tail written after it.
+    Returns the number of replayed records, or None when there was nothing to restore.
+    """
+    data = load_snapshot()
+    path = journal_path()
+    if data is None and not os.path.exists(path):
+        return None
+    after = 0
+    if data is not None:
+        apply_snapshot(data)
+        after = data["seq"]
+    replayed = 0
+    if os.path.exists(path):
+        for _, event, timestamp, fields in journal.read_journal(path, after_seq=after):
+            apply_event(event, fields, timestamp)
+            replayed += 1
+    print(f"[SNAPSHOT] Restored room {state.ROOM_ID} ({len(state.players)} players, "
+          f"phase {state.game_state}) from seq {after} + {replayed} journal records")
+    return replayed
+
+
+def detached_seat(name):
+    """Return the detached seat waiting for `name`, if any."""
+    for conn in state.players:
+        if isinstance(conn, DetachedSeat) and conn.name == name:
+            return conn
+    return None
+
+
+def rebind_seat(conn, seat):
+    """Move a restored seat (role, votes, channels) onto a live connection."""
+    info = state.players.pop(seat)
+    state.players[conn] = info
+    for mapping in (state.votes, state.neighborhood_of):
+        if seat in mapping:
+            mapping[conn] = mapping.pop(seat)
+    if state.night_victim is seat:
+        state.night_victim = conn
+    if state.night_poisoned is seat:
+        state.night_poisoned = conn
+    if seat in state.hunter_shots:
+        state.hunter_shots.discard(seat)
+        state.hunter_shots.add(conn)
+
+    state.channels.subscribe(PUBLIC, conn)
+    state.channels.subscribe(dm(info["name"]), conn)
+    if not info["alive"]:
+        state.channels.subscribe(DEAD, conn)
+    elif info["role"] == "werewolf":
+        state.channels.subscribe(WOLVES, conn)
+    if conn in state.neighborhood_of:
+        state.channels.subscribe(neighborhood_channel(state.neighborhood_of[conn]), conn)
+    return info
+
+
+def reattach_player(conn, seat):
+    """
+    Give a reconnecting player back their restored seat, then resend their
+    role, the current phase and any prompt still waiting for them.
+    """
+    info = rebind_seat(conn, seat)
+    resend_seat(conn, info)
+    print(f"[SNAPSHOT] {info['name']} reclaimed their seat")
+
+
+def resend_seat(conn, info):
+    """Send the role, the phase, the dead and any prompt still waiting for a seat."""
+    send(conn, encode_message("ROLE", info["role"]))
+    send(conn, encode_message("STATE", state.game_state))
+    for p in state.players.values():
+        if not p["alive"]:
+            send(conn, encode_message("KILL", p["name"]))
+
+    if conn in state.hunter_shots:
+        send(conn, encode_message("HUNTER_SHOOT", ""))
+    pending = state.night_pending or set()
+    if state.game_state == "night" and info["alive"]:
+        if info["role"] == "seer" and "seer" in pending:
+            send(conn, encode_message("SEER_ACTION", ""))
+        elif info["role"] == "werewolf" and "wolves" in pending and conn not in state.votes:
+            send(conn, encode_message("WEREWOLF_ACTION", ""))
+        elif info["role"] == "witch" and "witch" in pending and "wolves" not in pending:
+            victim = state.players.get(state.night_victim, {}).get("name", "")
+            send(conn, encode_message("WITCH_ACTION", victim))
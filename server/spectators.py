@@ -0,0 +1,131 @@
+"""Spectator fan-out tier.
+
+Spectators are not players: they never show up in `state.clients` and only
+receive public events. Each event is encoded once; events due in the same
+tick are joined into a single buffer that every spectator's queue references,
+so hundreds of watchers cost one encode and one buffer per tick. The stream
+can be delayed, and slow watchers are dropped instead of holding memory.
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+
+# Non-blocking send flag, 0 where the platform doesn't have it
+SEND_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class Spectator:
+    __slots__ = ("conn", "chunks", "pending")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.chunks = deque()
+        self.pending = 0
+
+
+class SpectatorHub:
+    def __init__(self, delay=0.0, tick=0.2, buffer_limit=256 * 1024, include_chat=True):
+        self.delay = delay
+        self.tick = tick
+        self.buffer_limit = buffer_limit
+        self.include_chat = include_chat
+        self.cond = threading.Condition()
+        self.spectators = {}
+        self.events = deque()
+        self.thread = None
+        self.closed = False
+
+    def add(self, conn, greeting=b""):
+        """Register a spectator connection, optionally queuing a greeting for it only."""
+        spectator = Spectator(conn)
+        if greeting:
+            spectator.chunks.append(memoryview(greeting))
+            spectator.pending = len(greeting)
+        with self.cond:
+            self.spectators[conn] = spectator
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def remove(self, conn):
+        """Forget a spectator connection."""
+        with self.cond:
+            self.spectators.pop(conn, None)
+
+    def close(self):
+        """Stop the flush thread, the room is going away."""
+        with self.cond:
+            self.closed = True
+            self.spectators.clear()
+            self.cond.notify()
+
+    def is_spectator(self, conn):
+        return conn in self.spectators
+
+    def count(self):
+        return len(self.spectators)
+
+    def publish(self, message):
+        """Queue a public event for every spectator."""
+        if not self.spectators:
+            return
+        if not self.include_chat and message.startswith("MSG|"):
+            return
+        data = (message.rstrip("\n") + "\n").encode()
+        with self.cond:
+            self.events.append((time.monotonic() + self.delay, data))
+            self.cond.notify()
+
+    def _take_due(self):
+        now = time.monotonic()
+        due = []
+        while self.events and self.events[0][0] <= now:
+            due.append(self.events.popleft()[1])
+        return due
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            with self.cond:
+                while not self.spectators:
+                    self.events.clear()
+                    if self.closed:
+                        return
+                    self.cond.wait()
+                due = self._take_due()
+                spectators = list(self.spectators.values())
+            if due:
+                # One shared buffer for this tick, referenced by every spectator
+                batch = memoryview(b"".join(due))
+                for spectator in spectators:
+                    spectator.chunks.append(batch)
+                    spectator.pending += len(batch)
+            for spectator in spectators:
+                if spectator.chunks:
+                    self._flush(spectator)
+
+    def _flush(self, spectator):
+        try:
+            while spectator.chunks:
+                chunk = spectator.chunks[0]
+                sent = spectator.conn.send(chunk, SEND_FLAGS)
+                spectator.pending -= sent
+                if sent < len(chunk):
+                    spectator.chunks[0] = chunk[sent:]
+                    break
+                spectator.chunks.popleft()
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.remove(spectator.conn)
+            return
+        if spectator.pending > self.buffer_limit:
+            print("[SPECTATOR] Dropping a spectator that cannot keep up")
+            self.remove(spectator.conn)
+            try:
+                spectator.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
@@ -1,36 +1,404 @@
 """This module defines the GameState class, which manages the state of the game server,
 including connected clients, usernames, player roles, votes, and the overall game status."""
 
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from common.replay import SECRET as REPLAY_SECRET
+from server.replay import ReplayRecorder
+from server.stats import StatsStore
+from server.ratings import RatingEngine
+from server import journal
+from server.ratelimit import RateLimiter
+from server.outbox import Outbox
+from server.channels import ChannelRegistry, PUBLIC, dm
+from server.spectators import SpectatorHub
+
 class GameState:
-    def __init__(self):
+    def __init__(self, room_id="main", template=None):
         # self.HOST = '198.168.100.9'
         self.HOST = '0.0.0.0'
         self.PORT = 3001
+        # "sequential" runs seer -> wolves -> witch one after the other,
+        # "concurrent" prompts the seer and the wolves at the same time
+        self.NIGHT_MODE = "concurrent"
+        # Frames longer than this (in bytes) get the client disconnected
+        self.MAX_FRAME_SIZE = 4096
+        # Admission control for start_server
+        self.LISTEN_BACKLOG = 128
+        # Players and spectators are admitted on separate budgets: a connection
+        # gets a slot of either kind with its first frame (see claim_slot)
+        self.MAX_CONNECTIONS = 200
+        self.MAX_CONNECTIONS_PER_IP = 10
+        # (accepted connections per second, burst size)
+        self.ACCEPT_RATE = (20.0, 50)
+        # Chat frames kept per connection before the oldest ones are dropped
+        self.CHAT_LANE_LIMIT = 256
+        # Game frames waiting for a connection before it is disconnected
+        self.CONTROL_LANE_LIMIT = 4096
+        # Seconds an outbox waits to coalesce frames into one write
+        self.WRITE_COALESCE_TICK = 0.005
+        # Minimum seconds between two VOTE_TALLY snapshots
+        self.VOTE_TALLY_INTERVAL = 0.25
+        # Spectator tier: server-wide spectator budget, stream delay, coalescing
+        # tick (seconds), per-watcher backlog in bytes before being dropped,
+        # and whether chat is relayed
+        self.MAX_SPECTATORS = 500
+        self.SPECTATOR_DELAY = 0.0
+        self.SPECTATOR_TICK = 0.2
+        self.SPECTATOR_BUFFER_LIMIT = 256 * 1024
+        self.SPECTATOR_CHAT = True
+        # Rooms with at least this many players are split into neighborhoods
+        # that chat among themselves and nominate suspects for a final vote
+        self.LARGE_ROOM_MIN_PLAYERS = 30
+        self.NEIGHBORHOOD_SIZE = 10
+        # Event journal of the main room, replayed on top of its snapshot after a crash
+        self.ROOM_ID = room_id
+        self.JOURNAL_DIR = "journals"
+        self.JOURNAL_COMMIT_INTERVAL = 0.05
+        # Seconds between two snapshots of the room (only if something changed)
+        self.SNAPSHOT_INTERVAL = 10.0
+        # Finished games are saved here as replay files (None disables replays)
+        self.REPLAY_DIR = "replays"
+        # Finished games and per-player results (None disables stats)
+        self.STATS_DB = "stats.db"
+        self.STATS_BATCH_INTERVAL = 1.0
+        # Team Elo ratings, kept in memory and flushed to the stats database
+        self.RATINGS = True
+        self.RATING_K = 32.0
+        self.RATING_DEFAULT = 1500.0
+        self.RATING_FLUSH_INTERVAL = 30.0
+        self.LEADERBOARD_SIZE = 100
+        # Matchmaking: rating band width, seconds before a ticket may match the
+        # neighboring band, and how often those are retried
+        self.MATCHMAKING = True
+        self.MATCH_BAND_WIDTH = 200.0
+        self.MATCH_WIDEN_AFTER = 30.0
+        self.MATCH_SWEEP_INTERVAL = 2.0
+        # Seats of a room created by a player, and seconds between two
+        # room directory deltas
+        self.ROOM_CAPACITY = 12
+        self.DIRECTORY_TICK = 0.5
+        # Deal the next game as soon as a rematch is asked for
+        self.REMATCH_AUTO_DEAL = False
+        # Tournament pauses: seconds between two games of a table, and between rounds
+        self.TOURNAMENT_GAME_BREAK = 10.0
+        self.TOURNAMENT_ROUND_BREAK = 30.0
+        # Rooms nobody sent anything to for this many seconds are saved to
+        # HIBERNATE_DIR and dropped from memory until their next message (None disables)
+        self.HIBERNATE_AFTER = 300.0
+        self.HIBERNATE_DIR = "hibernated"
+        self.HIBERNATE_SWEEP_INTERVAL = 30.0
+        # Server-side bots filling short rooms and disconnected seats: decision
+        # worker processes, seconds before a bot acts, and bot name prefix
+        self.BOTS = True
+        self.BOT_WORKERS = 2
+        self.BOT_ACTION_DELAY = 1.5
+        self.BOT_NAME_PREFIX = "Bot"
+        # Unix socket used to hand the server over to a new process (None: temp dir default)
+        self.UPGRADE_SOCKET = None
+        # Seconds given to in-flight handlers to finish before a hand-over is abandoned
+        self.UPGRADE_GRACE = 2.0
+        # Message type -> rate limit budget
+        self.RATE_LIMITED_TYPES = {
+            "MSG": "chat",
+            "VOTE": "vote",
+            "NIGHT_VOTE": "vote",
+            "NIGHT_MSG": "night_chat",
+            "WHISPER": "whisper",
+        }
+        # Budget -> (tokens per second, burst size)
+        self.RATE_LIMITS = {
+            "chat": (1.0, 5),
+            "vote": (0.5, 3),
+            "night_chat": (1.0, 5),
+            "whisper": (0.5, 3),
+        }
+        self.journal = None
+        # Per-game RNG, seeded at START so a game can be re-simulated from its inputs
+        self.seed = None
+        self.rng = random.Random()
+        self.replay = None
+        self.stats = None
+        self.ratings = None
+        self.matchmaker = None
+        self.directory = None
+        self.tournament = None
+        self.bots = None
+        # Callbacks of whoever runs the room: on_game_end(room, winner), on_close(room)
+        self.on_game_end = None
+        self.on_close = None
+        # Last time a client frame was dispatched in the room
+        self.last_active = time.monotonic()
+        # Per-game record kept for stats
+        self.game_started = 0.0
+        self.day = 0
+        self.vote_log = []
+        # Set while the server hands its connections over to a new process
+        self.frozen = False
+        # Timers and threads started for the room (room_timer, run_in_room)
+        self.timers = set()
+        self.readers = {}
         self.clients = []
         self.usernames = {}
+        # Reverse index of usernames for O(1) lookups
+        self.conns_by_name = {}
         self.game_state = "waiting"
         self.players = {}
         self.votes = {}
+        self.rate_limiters = {}
+        self.outboxes = {}
+        self.channels = ChannelRegistry()
+        # Vote tally coalescing
+        self.tally_lock = threading.Lock()
+        # Keyed by scope: None for the whole room, or a neighborhood index
+        self.tally_timers = {}
+        self.last_tallies = {}
+        # Large-room mode
+        self.large_room = False
+        self.neighborhood_of = {}
+        self.vote_stage = None
+        self.nominees = {}
+        self.admission_lock = threading.Lock()
+        self.open_connections = 0
+        self.connections_per_ip = {}
+        # Admitted connections by budget, once they sent their first frame
+        self.player_slots = set()
+        self.spectator_slots = set()
+        # Concurrent night bookkeeping
+        self.night_lock = threading.RLock()
+        self.night_pending = None
+        self.night_victim = None
+        self.night_saved = False
+        self.night_poisoned = None
+        # Dead hunters whose last shot is still expected
+        self.hunter_shots = set()
+        if template is not None:
+            # Rooms created at runtime run with the settings of the main room
+            for name, value in vars(template).items():
+                if name.isupper() and name != "ROOM_ID":
+                    setattr(self, name, value)
+            # Per-connection state and process-wide services follow a connection
+            # from room to room
+            self.rate_limiters = template.rate_limiters
+            self.outboxes = template.outboxes
+            self.readers = template.readers
+            self.stats = template.stats
+            self.ratings = template.ratings
+            self.matchmaker = template.matchmaker
+            self.directory = template.directory
+            self.tournament = template.tournament
+            self.bots = template.bots
+        self.capacity = self.MAX_CONNECTIONS if template is None else self.ROOM_CAPACITY
+        self.spectators = SpectatorHub(self.SPECTATOR_DELAY, self.SPECTATOR_TICK,
+                                       self.SPECTATOR_BUFFER_LIMIT, self.SPECTATOR_CHAT)
+
+    # Journal
+
+    def open_journal(self):
+        """Start appending this room's events to its journal file."""
+        path = os.path.join(self.JOURNAL_DIR, f"{self.ROOM_ID}.journal")
+        self.journal = journal.Journal(path, self.JOURNAL_COMMIT_INTERVAL)
+        print(f"[SERVER] Journaling to {path}")
+
+    def close_journal(self):
+        """Flush and close the journal."""
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def record(self, event, *fields):
+        """Append a state-changing event to the journal and the replay being recorded."""
+        if self.journal:
+            self.journal.append(event, *fields)
+        if self.replay:
+            self.replay.on_event(event, fields)
+
+    def open_stats(self):
+        """Open the stats database and start its writer thread."""
+        if self.STATS_DB:
+            self.stats = StatsStore(self.STATS_DB, self.STATS_BATCH_INTERVAL)
+            if self.RATINGS:
+                self.ratings = RatingEngine(self.stats, self.RATING_K, self.RATING_DEFAULT,
+                                            self.RATING_FLUSH_INTERVAL, self.LEADERBOARD_SIZE)
+
+    def close_stats(self):
+        """Write out queued stats and ratings and close the database."""
+        if self.ratings:
+            # Its last flush goes through the stats writer, close it first
+            self.ratings.close()
+            self.ratings = None
+        if self.stats:
+            self.stats.close()
+            self.stats = None
+
+    def start_game_log(self):
+        """Reset the day counter and vote log of a new game."""
+        self.game_started = time.time()
+        self.day = 0
+        self.vote_log = []
+
+    def save_game_result(self, winner):
+        """Queue the finished game for the stats database and the rating engine."""
+        # Bots have no identity from one game to the next, keep them out of stats and ratings
+        players = self.players_snapshot(humans_only=True)
+        if self.stats:
+            humans = {p["name"] for p in players}
+            votes = [vote for vote in self.vote_log if vote[2] in humans]
+            self.stats.submit_game(self.ROOM_ID, self.seed, self.game_started, winner,
+                                   players, votes, self.day)
+        if self.ratings:
+            self.ratings.submit_game(players, winner)
+        if self.on_game_end:
+            self.on_game_end(self, winner)
+
+    def start_replay(self):
+        """Start recording the game that was just dealt, beginning with its roles."""
+        if not self.REPLAY_DIR:
+            return
+        path = os.path.join(self.REPLAY_DIR, f"{self.ROOM_ID}-{int(time.time())}-{self.seed}.replay")
+        self.replay = ReplayRecorder(path, self.players_snapshot)
+        for p in self.players_snapshot():
+            self.replay.on_event(journal.ROLE, (p["name"], p["role"]))
+
+    def restore_replay(self, data):
+        """Go on with a recording saved by ReplayRecorder.dump()."""
+        self.replay = ReplayRecorder(data["path"], self.players_snapshot, saved=data)
+
+    def replay_frame(self, message, secret=False):
+        """Add a frame sent to the room to the replay being recorded."""
+        if self.replay:
+            self.replay.frame(message, REPLAY_SECRET if secret else 0)
+
+    def players_snapshot(self, humans_only=False):
+        """Plain copy of the players, used for replay checkpoints."""
+        return [{"name": p["name"], "role": p["role"], "alive": p["alive"]}
+                for conn, p in list(self.players.items())
+                if not (humans_only and getattr(conn, "bot", False))]
+
+    def start_rng(self, seed=None):
+        """Seed the RNG of a new game and journal the seed."""
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.record(journal.SEED, self.seed)
 
     # Connection management methods
 
     def add_client(self, conn):
         """Add a new client connection to the list of active clients."""
         self.clients.append(conn)
+        self.rate_limiters[conn] = RateLimiter(self.RATE_LIMITS)
+        self.outboxes[conn] = Outbox(conn, self.CHAT_LANE_LIMIT, self.WRITE_COALESCE_TICK, self.CONTROL_LANE_LIMIT)
 
     def remove_client(self, conn):
         """Remove a client connection and clean up associated user and player data."""
+        self.detach_client(conn)
+        self.rate_limiters.pop(conn, None)
+        self.readers.pop(conn, None)
+        outbox = self.outboxes.pop(conn, None)
+        if outbox:
+            outbox.close()
+
+    def detach_client(self, conn):
+        """
+        Take a connection out of this room, keeping its outbox, rate limiter and
+        reader so it can join another room. Returns its username.
+        """
         if conn in self.clients:
             self.clients.remove(conn)
-        self.usernames.pop(conn, None)
+        username = self.usernames.pop(conn, None)
+        if username is not None:
+            self.record(journal.LEAVE, username)
+        if self.conns_by_name.get(username) is conn:
+            del self.conns_by_name[username]
         self.players.pop(conn, None)
+        self.neighborhood_of.pop(conn, None)
         self.votes.pop(conn, None)
+        self.channels.unsubscribe_all(conn)
+        return username
+
+    def humans(self):
+        """Connections of real players, leaving out server-side bots."""
+        return [conn for conn in self.clients if not getattr(conn, "bot", False)]
+
+    def pending_timers(self):
+        """Timers of the room still scheduled or running, and threads still running."""
+        pending = []
+        for timer in list(self.timers):
+            if timer.is_alive():
+                pending.append(timer)
+            elif getattr(timer, "finished", None) is not None and timer.finished.is_set():
+                # Cancelled before it fired
+                self.timers.discard(timer)
+        return pending
+
+    def attach_client(self, conn, username):
+        """Seat a connection coming from another room."""
+        self.clients.append(conn)
+        self.set_username(conn, username)
+
+    def admit_connection(self, ip):
+        """
+        Reserve a connection slot for `ip`, before knowing whether it will
+        play or watch. Return None when admitted, otherwise the reason for the rejection.
+        """
+        with self.admission_lock:
+            if self.open_connections >= self.MAX_CONNECTIONS + self.MAX_SPECTATORS:
+                return "Server is full, try again later."
+            if self.connections_per_ip.get(ip, 0) >= self.MAX_CONNECTIONS_PER_IP:
+                return "Too many connections from your address."
+            self.open_connections += 1
+            self.connections_per_ip[ip] = self.connections_per_ip.get(ip, 0) + 1
+            return None
+
+    def claim_slot(self, conn, spectator=False):
+        """
+        Count an admitted connection against the player or the spectator budget,
+        moving it from the other one if needed. Return None, or the reason for the rejection.
+        """
+        slots, others, limit = (self.spectator_slots, self.player_slots, self.MAX_SPECTATORS) if spectator \
+            else (self.player_slots, self.spectator_slots, self.MAX_CONNECTIONS)
+        with self.admission_lock:
+            if conn in slots:
+                return None
+            if len(slots) >= limit:
+                return "Too many spectators, try again later." if spectator else "Server is full, try again later."
+            others.discard(conn)
+            slots.add(conn)
+            return None
+
+    def release_connection(self, ip, conn=None):
+        """Free the connection slot reserved by admit_connection."""
+        with self.admission_lock:
+            self.open_connections -= 1
+            self.player_slots.discard(conn)
+            self.spectator_slots.discard(conn)
+            count = self.connections_per_ip.get(ip, 0) - 1
+            if count > 0:
+                self.connections_per_ip[ip] = count
+            else:
+                self.connections_per_ip.pop(ip, None)
+
+    def allow_message(self, conn, msg_type):
+        """Check the connection's rate limit for this message type."""
+        budget = self.RATE_LIMITED_TYPES.get(msg_type)
+        if budget is None:
+            return True
+        limiter = self.rate_limiters.get(conn)
+        return limiter is None or limiter.allow(budget)
 
     # User management methods
 
-    def set_username(self, conn, username):
+    def set_username(self, conn, username, record=True):
         """Associate a username with a client connection."""
         self.usernames[conn] = username
+        self.conns_by_name[username] = conn
+        if record:
+            self.record(journal.JOIN, username)
+        self.channels.subscribe(PUBLIC, conn)
+        self.channels.subscribe(dm(username), conn)
 
     def get_username(self, conn):
         """Retrieve the username associated with a client connection."""
@@ -38,14 +406,11 @@ class GameState:
 
     def username_exists(self, username):
         """Check if a username is already taken."""
-        return username in self.usernames.values()
+        return username in self.conns_by_name
     
     def get_conn_by_username(self, username):
         """Get the client connection object associated with a username."""
-        for conn, name in self.usernames.items():
-            if name == username:
-                return conn
-        return None
+        return self.conns_by_name.get(username)
 
     # Player role and status management
 
@@ -57,6 +422,7 @@ class GameState:
                 "role": role,
                 "alive": True
             }
+            self.record(journal.ROLE, self.usernames[conn], role)
 
     def get_all_alive_players(self):
         """Return a list of client connections for all players currently alive."""
@@ -67,6 +433,9 @@ class GameState:
     def set_game_state(self, new_state):
         """Update the overall game state."""
         self.game_state = new_state
+        if new_state == "night":
+            self.day += 1
+        self.record(journal.PHASE, new_state)
 
     # Voting management
 
@@ -77,5 +446,118 @@ class GameState:
     def add_vote(self, conn, target):
         """Record a vote from a player towards a target."""
         self.votes[conn] = target
+        self.vote_log.append((self.day, self.game_state, self.usernames.get(conn, ""), target))
+        self.record(journal.VOTE, self.game_state, self.usernames.get(conn, ""), target)
+
+    def cancel_tallies(self):
+        """Drop the pending VOTE_TALLY snapshots and forget the last ones sent."""
+        with self.tally_lock:
+            for timer in self.tally_timers.values():
+                timer.cancel()
+            self.tally_timers.clear()
+            self.last_tallies.clear()
+
+    # Rematch
+
+    def reset_room(self):
+        """
+        Clear the last game in place (roles, votes, tallies, night and large-room
+        state) while keeping the connections, their outboxes and public channels.
+        """
+        self.players.clear()
+        self.votes.clear()
+        self.cancel_tallies()
+        self.large_room = False
+        self.neighborhood_of.clear()
+        self.vote_stage = None
+        self.nominees.clear()
+        self.hunter_shots.clear()
+        with self.night_lock:
+            self.night_pending = None
+            self.night_victim = None
+            self.night_saved = False
+            self.night_poisoned = None
+        # Werewolf, dead and neighborhood chats belong to the last game
+        for channel in self.channels.names():
+            if channel != PUBLIC and not channel.startswith(dm("")):
+                self.channels.close(channel)
+        self.day = 0
+        self.vote_log = []
+
+    # Night actions
+
+    def reset_night(self, pending):
+        """Start tracking a new night with the set of actions still expected."""
+        self.night_pending = set(pending)
+        self.night_victim = None
+        self.night_saved = False
+        self.night_poisoned = None
+
+_bound = threading.local()
+
+
+def current_room():
+    """The GameState of the room the current thread works for (the main room by default)."""
+    return getattr(_bound, "room", None) or main_room
+
+
+def bind_room(room):
+    """Make `state` refer to `room` in the current thread."""
+    _bound.room = room
+
+
+@contextmanager
+def in_room(room):
+    """Temporarily run the current thread for another room."""
+    previous = getattr(_bound, "room", None)
+    _bound.room = room
+    try:
+        yield room
+    finally:
+        _bound.room = previous
+
+
+def room_timer(interval, function, args=()):
+    """threading.Timer whose function runs for the room of the thread that created it."""
+    room = current_room()
+
+    def run():
+        bind_room(room)
+        try:
+            function(*args)
+        finally:
+            room.timers.discard(timer)
+    timer = threading.Timer(interval, run)
+    room.timers.add(timer)
+    return timer
+
+
+def run_in_room(room, function, *args):
+    """Run `function` for `room` on a new daemon thread."""
+    def run():
+        bind_room(room)
+        try:
+            function(*args)
+        finally:
+            room.timers.discard(thread)
+    thread = threading.Thread(target=run, daemon=True)
+    room.timers.add(thread)
+    thread.start()
+    return thread
+
+
+class RoomState:
+    """
+    Stands for the GameState of the current thread's room, so the game code
+    uses a single `state` object whatever room it is running for.
+    """
+
+    def __getattr__(self, name):
+        return getattr(current_room(), name)
+
+    def __setattr__(self, name, value):
+        setattr(current_room(), name, value)
+
 
-state = GameState()
\ No newline at end of file
+main_room = GameState()
+state = RoomState()
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""Player statistics stored in SQLite.
+
+Finished games, per-player outcomes (role, team, survived, won) and every
+vote cast are queued by the game threads and inserted by a background thread
+that groups rows per statement and writes each batch in one transaction with
+executemany, so the game loop never waits on the disk. The database runs in
+WAL mode so stats queries don't block the writer.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    seed INTEGER,
+    started REAL,
+    ended REAL NOT NULL,
+    winner TEXT NOT NULL,
+    players INTEGER NOT NULL,
+    days INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS game_players (
+    game_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    role TEXT NOT NULL,
+    team TEXT NOT NULL,
+    survived INTEGER NOT NULL,
+    won INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS votes (
+    game_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    voter TEXT NOT NULL,
+    target TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    name TEXT PRIMARY KEY,
+    rating REAL NOT NULL,
+    games INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS game_players_by_name ON game_players (name);
+CREATE INDEX IF NOT EXISTS game_players_by_role ON game_players (role);
+"""
+
+INSERT_GAME = "INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_PLAYER = "INSERT INTO game_players VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_VOTE = "INSERT INTO votes VALUES (?, ?, ?, ?, ?)"
+
+
+def team_of(role):
+    return "werewolves" if role == "werewolf" else "villagers"
+
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    # WAL is still crash-safe with NORMAL, a power loss only drops the last batches
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class StatsStore:
+    """
+    SQLite stats database written by a background batching thread.
+    """
+
+    def __init__(self, path, batch_interval=1.0):
+        self.path = path
+        self.batch_interval = batch_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = connect(path)
+        db.executescript(SCHEMA)
+        self.next_game_id = (db.execute("SELECT MAX(id) FROM games").fetchone()[0] or 0) + 1
+        db.close()
+        self.pending = []
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, statement, rows):
+        """Queue rows for `statement`. Returns immediately."""
+        with self.cond:
+            if self.closed:
+                return
+            self.pending.append((statement, rows))
+            self.cond.notify()
+
+    def submit_game(self, room, seed, started, winner, players, votes, days):
+        """
+        Queue a finished game. `players` are {"name", "role", "alive"} dicts,
+        `votes` are (day, phase, voter, target) tuples. Returns the game id.
+        """
+        with self.cond:
+            game_id = self.next_game_id
+            self.next_game_id += 1
+        self.submit(INSERT_GAME, [(game_id, room, seed, started, time.time(), winner, len(players), days)])
+        self.submit(INSERT_PLAYER, [(game_id, p["name"], p["role"], team_of(p["role"]),
+                                     int(p["alive"]), int(team_of(p["role"]) == winner))
+                                    for p in players])
+        if votes:
+            self.submit(INSERT_VOTE, [(game_id, *vote) for vote in votes])
+        return game_id
+
+    def close(self):
+        """Write out the remaining rows and stop the writer thread."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _run(self):
+        db = connect(self.path)
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                closing = self.closed
+            if not closing:
+                # Let more rows pile up so one transaction covers them all
+                time.sleep(self.batch_interval)
+            with self.cond:
+                batch, self.pending = self.pending, []
+            if batch:
+                grouped = {}
+                for statement, rows in batch:
+                    grouped.setdefault(statement, []).extend(rows)
+                try:
+                    with db:
+                        for statement, rows in grouped.items():
+                            db.executemany(statement, rows)
+                except sqlite3.Error as e:
+                    print(f"[STATS] Failed to write {len(batch)} batches: {e}")
+            with self.cond:
+                if self.closed and not self.pending:
+                    db.close()
+                    return
+
+    # Queries, on their own connection (WAL lets them run beside the writer)
+
+    def query(self, sql, params=()):
+        db = connect(self.path)
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def win_rates_by_role(self):
+        """{role: (games played, games won, win rate)}"""
+        rows = self.query("SELECT role, COUNT(*), SUM(won) FROM game_players GROUP BY role")
+        return {role: (played, won, won / played) for role, played, won in rows}
+
+    def player_stats(self, name):
+        """{role: (games played, games won)} for one player."""
+        rows = self.query("SELECT role, COUNT(*), SUM(won) FROM game_players WHERE name = ? GROUP BY role",
+                          (name,))
+        return {role: (played, won) for role, played, won in rows}
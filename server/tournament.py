@@ -0,0 +1,221 @@
+"""Tournament mode.
+
+Registered players are seated at tables (one room each) and play a fixed
+number of games per table; the next game is dealt with an in-place rematch.
+Standings are updated as each game ends. Once every table of a round is
+done, players are reseated by standings for the next round, strongest
+players together, so a whole event runs without anyone reconnecting.
+Players not connected when a round starts forfeit the rest of the event,
+and the rooms of the previous round are closed.
+"""
+
+import json
+import random
+import threading
+from collections import OrderedDict
+from common.protocol import encode_message
+from server import rooms
+from server.game import MIN_PLAYERS, start_game, rematch
+from server.state import main_room, run_in_room, room_timer
+from utils.network import send, broadcast
+
+# Points for a win, and for being alive when the game ends
+WIN_POINTS = 2
+SURVIVAL_POINTS = 1
+
+
+def split_tables(names, table_size):
+    """Split players into tables of nearly equal size, none under MIN_PLAYERS."""
+    count = -(-len(names) // table_size)
+    while count > 1 and len(names) // count < MIN_PLAYERS:
+        count -= 1
+    return [names[len(names) * i // count:len(names) * (i + 1) // count] for i in range(count)]
+
+
+class Tournament:
+    def __init__(self, tournament_id, rounds, games_per_table, table_size,
+                 game_break=10.0, round_break=30.0, seed=None):
+        self.id = tournament_id
+        self.rounds = rounds
+        self.games_per_table = games_per_table
+        self.table_size = table_size
+        self.game_break = game_break
+        self.round_break = round_break
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.lock = threading.RLock()
+        self.status = "registering"
+        self.round = 0
+        # name -> connection, in registration order
+        self.registered = OrderedDict()
+        # name -> {"points", "games", "wins"}
+        self.standings = {}
+        # room id -> {"room", "players", "games", "done"} for the current round
+        self.tables = {}
+        # Players who were not connected when a round started, out of the event
+        self.forfeited = []
+
+    # Registration
+
+    def register(self, conn, name):
+        with self.lock:
+            if self.status != "registering":
+                return "Registration is closed."
+            self.registered[name] = conn
+            self.standings.setdefault(name, {"points": 0, "games": 0, "wins": 0})
+            return None
+
+    def unregister(self, name):
+        with self.lock:
+            if self.status != "registering" or self.registered.pop(name, None) is None:
+                return False
+            del self.standings[name]
+            return True
+
+    def connected(self, name):
+        conn = self.registered.get(name)
+        return conn is not None and rooms.room_of(conn).get_username(conn) == name
+
+    # Standings
+
+    def ranking(self):
+        """[(name, points, wins, games)] best first."""
+        order = sorted(self.standings.items(), key=lambda item: (-item[1]["points"], -item[1]["wins"], item[0]))
+        return [(name, s["points"], s["wins"], s["games"]) for name, s in order]
+
+    def summary(self, top=10):
+        return {"id": self.id, "status": self.status, "round": self.round, "rounds": self.rounds,
+                "players": len(self.registered), "standings": self.ranking()[:top],
+                "forfeited": list(self.forfeited)}
+
+    def announce(self, conns, top=10):
+        message = encode_message("TOURNAMENT", json.dumps(self.summary(top)))
+        for conn in conns:
+            send(conn, message)
+
+    # Rounds
+
+    def start(self):
+        with self.lock:
+            if self.status != "registering":
+                return
+            names = [name for name in self.registered if self.connected(name)]
+            if len(names) < MIN_PLAYERS:
+                self.status = "cancelled"
+                print(f"[TOURNAMENT] {self.id} cancelled: only {len(names)} players")
+                self.announce([self.registered[name] for name in names])
+                return
+            self.status = "running"
+            print(f"[TOURNAMENT] {self.id} starting with {len(names)} players (seed {self.seed})")
+        self.start_round()
+
+    def forfeit_absent(self):
+        """Take the players who are not connected out of the event. Returns the others."""
+        for name in [name for name in self.registered if not self.connected(name)]:
+            del self.registered[name]
+            self.forfeited.append(name)
+            print(f"[TOURNAMENT] {self.id}: {name} is not connected, forfeited")
+        return list(self.registered)
+
+    def close_tables(self, tables):
+        """Close the rooms of finished tables, once their players have moved on."""
+        for table in tables:
+            room = table["room"]
+            room.on_game_end = None
+            room.on_close = None
+            # Anyone still there (players who are out of the event) goes back to the lobby
+            for conn in list(room.humans()):
+                rooms.move_connection(conn, main_room)
+            rooms.close_room(room)
+
+    def start_round(self):
+        with self.lock:
+            self.round += 1
+            names = self.forfeit_absent()
+            if self.round == 1:
+                self.rng.shuffle(names)
+            else:
+                # Reseat by standings so players meet others of their level
+                rank = {name: i for i, (name, *_) in enumerate(self.ranking())}
+                names.sort(key=rank.get)
+            if len(names) < MIN_PLAYERS:
+                self.finish()
+                return
+            previous, self.tables = list(self.tables.values()), {}
+            seating = split_tables(names, self.table_size)
+            for number, table in enumerate(seating, 1):
+                room = rooms.create_room(f"{self.id}-r{self.round}t{number}", capacity=len(table))
+                room.on_game_end = self.game_finished
+                room.on_close = self.table_closed
+                self.tables[room.ROOM_ID] = {"room": room, "players": table, "games": 0, "done": False}
+                for name in table:
+                    rooms.move_connection(self.registered[name], room)
+            print(f"[TOURNAMENT] {self.id} round {self.round}: {len(names)} players at {len(seating)} tables")
+        self.close_tables(previous)
+        for table in list(self.tables.values()):
+            self.announce(list(table["room"].clients))
+            run_in_room(table["room"], start_game)
+
+    def game_finished(self, room, winner):
+        """Called by the room when a game ends, from the room's thread."""
+        with self.lock:
+            table = self.tables.get(room.ROOM_ID)
+            if table is None or table["done"]:
+                return
+            for p in room.players.values():
+                score = self.standings.get(p["name"])
+                if score is None:
+                    continue
+                won = (p["role"] == "werewolf") == (winner == "werewolves")
+                score["games"] += 1
+                score["wins"] += int(won)
+                score["points"] += WIN_POINTS * int(won) + SURVIVAL_POINTS * int(p["alive"])
+            table["games"] += 1
+            more = table["games"] < self.games_per_table
+        if more:
+            room_timer(self.game_break, self.next_game, args=(room,)).start()
+        else:
+            self.table_done(room)
+
+    def next_game(self, room):
+        """Deal the next game of a table (runs for the table's room)."""
+        if len(room.clients) < MIN_PLAYERS:
+            broadcast(None, encode_message("STATE", "Not enough players left at this table."))
+            self.table_done(room)
+            return
+        self.announce(list(room.clients))
+        rematch(deal=True)
+
+    def table_closed(self, room):
+        self.table_done(room)
+
+    def table_done(self, room):
+        with self.lock:
+            table = self.tables.get(room.ROOM_ID)
+            if table is None or table["done"]:
+                return
+            table["done"] = True
+            round_over = all(t["done"] for t in self.tables.values())
+        self.announce(list(room.clients))
+        if round_over:
+            timer = threading.Timer(self.round_break, self.next_round)
+            timer.daemon = True
+            timer.start()
+
+    def next_round(self):
+        if self.round >= self.rounds:
+            self.finish()
+        else:
+            self.start_round()
+
+    def finish(self):
+        with self.lock:
+            self.status = "finished"
+            previous, self.tables = list(self.tables.values()), {}
+            players = [self.registered[name] for name in self.registered if self.connected(name)]
+            winner = self.ranking()[0][0] if self.standings else None
+        print(f"[TOURNAMENT] {self.id} finished, winner: {winner}")
+        self.announce(players, top=len(self.standings))
+        for conn in players:
+            rooms.move_connection(conn, main_room)
+        self.close_tables(previous)
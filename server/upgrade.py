@@ -0,0 +1,211 @@
+"""Zero-downtime upgrades by handing the server over to a new process.
+
+The running server listens on a Unix control socket. A freshly started
+server (`server.py --takeover`) connects to it and asks for a hand-over:
+
+1. the old process parks the reader of every connection (see
+   FrameReader.park): once the frames being handled are done, nothing more
+   is read from the sockets. Pending writes are then drained;
+2. it sends the listening socket and every client socket with
+   `socket.send_fds`, followed by a JSON description of the room (same
+   format as a snapshot, plus the replay being recorded) and of each
+   connection (username, spectator flag, unread bytes of its receive buffer);
+3. once the new process acknowledges, the old one closes its journal and
+   exits, and the new process starts serving the inherited connections.
+
+Clients keep their TCP connection and notice nothing. Timers live in the
+old process: a hand-over is refused while the room has one pending (vote
+tally, next game of a tournament...), and resumed later by starting a new
+server again.
+"""
+
+import json
+import os
+import select
+import socket
+import struct
+import tempfile
+import threading
+import time
+from common.protocol import FrameReader
+from server.state import state
+from server import rooms
+from server.snapshot import capture_snapshot, apply_snapshot, detached_seat, rebind_seat
+
+HEADER = struct.Struct("<Q")
+TAKEOVER = b"TAKEOVER\n"
+ACK = b"OK"
+
+
+def supported():
+    """File descriptor passing needs Unix sockets and Python 3.9+."""
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+def upgrade_socket_path():
+    return state.UPGRADE_SOCKET or os.path.join(tempfile.gettempdir(), f"werewolf-{state.PORT}.sock")
+
+
+def recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("control socket closed during hand-over")
+        data += chunk
+    return bytes(data)
+
+
+class UpgradeListener:
+    """Old side: waits for a new process and hands everything over to it."""
+
+    def __init__(self, server):
+        self.server = server
+        self.path = upgrade_socket_path()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"[UPGRADE] Waiting for a new server on {self.path}")
+
+    def _run(self):
+        while True:
+            ctrl, _ = self.sock.accept()
+            try:
+                if ctrl.recv(len(TAKEOVER)) == TAKEOVER:
+                    self.hand_over(ctrl)
+            except OSError as e:
+                print(f"[UPGRADE] Hand-over failed, resuming: {e}")
+                self.resume()
+            finally:
+                ctrl.close()
+
+    def freeze(self):
+        """Stop reading from every connection. Returns False if a handler did not finish in time."""
+        state.frozen = True
+        deadline = time.monotonic() + state.UPGRADE_GRACE
+        for reader in list(state.readers.values()):
+            if not reader.park(max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def resume(self):
+        for reader in list(state.readers.values()):
+            reader.unpark()
+        state.frozen = False
+
+    def hand_over(self, ctrl):
+        if len(rooms.rooms) > 1:
+            # The hand-over carries a single room snapshot
+            print("[UPGRADE] Refusing hand-over while several rooms are open")
+            return
+        if len(state.humans()) < len(state.clients):
+            # Bots live in this process and can't be handed over
+            print("[UPGRADE] Refusing hand-over while bots are seated")
+            return
+        print("[UPGRADE] New server connected, freezing connections")
+        if not self.freeze():
+            print("[UPGRADE] Refusing hand-over: a handler is still busy")
+            self.resume()
+            return
+        if state.pending_timers():
+            # Checked once the handlers are parked: none of them can start a timer now
+            print("[UPGRADE] Refusing hand-over while room timers are pending")
+            self.resume()
+            return
+        for outbox in list(state.outboxes.values()):
+            outbox.wait_drained(1.0)
+
+        conns = list(state.clients) + list(state.spectators.spectators)
+        entries = []
+        for conn in conns:
+            reader = state.readers.get(conn)
+            try:
+                addr = list(conn.getpeername())
+            except OSError:
+                continue
+            entries.append({
+                "conn": conn,
+                "addr": addr,
+                "username": state.get_username(conn),
+                "spectator": state.spectators.is_spectator(conn),
+                "buffer": bytes(reader.buffer).decode("latin-1") if reader else "",
+            })
+        fds = [self.server.fileno()] + [e.pop("conn").fileno() for e in entries]
+        room = capture_snapshot()
+        if state.replay and not state.replay.finished:
+            if state.replay.ending:
+                state.replay.finish()
+            else:
+                room["replay"] = state.replay.dump()
+        data = json.dumps({"room": room, "clients": entries}).encode()
+
+        socket.send_fds(ctrl, [HEADER.pack(len(data))], fds)
+        ctrl.sendall(data)
+        if ctrl.recv(len(ACK)) != ACK:
+            raise ConnectionError("new server did not acknowledge the hand-over")
+
+        print(f"[UPGRADE] Handed over {len(entries)} connections, exiting")
+        state.close_journal()
+        state.close_stats()
+        if state.bots:
+            state.bots.close()
+        # Skip the normal shutdown: it would close sockets the new process now owns
+        os._exit(0)
+
+
+def take_over(path=None):
+    """
+    New side: receive the listening socket, the client connections and the
+    room from the running server. Returns (listener, [(conn, addr, reader), ...]).
+    """
+    path = path or upgrade_socket_path()
+    ctrl = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    ctrl.connect(path)
+    ctrl.sendall(TAKEOVER)
+    header, fds, _, _ = socket.recv_fds(ctrl, HEADER.size, state.MAX_CONNECTIONS + state.MAX_SPECTATORS + 1)
+    (length,) = HEADER.unpack(header + recv_exactly(ctrl, HEADER.size - len(header)))
+    info = json.loads(recv_exactly(ctrl, length))
+    ctrl.sendall(ACK)
+    # Don't touch the sockets until the old process is gone
+    while ctrl.recv(1024):
+        pass
+    ctrl.close()
+
+    listener = socket.socket(fileno=fds[0])
+    listener.setblocking(True)
+    apply_snapshot(info["room"])
+    if info["room"].get("replay"):
+        state.restore_replay(info["room"]["replay"])
+
+    inherited = []
+    for entry, fd in zip(info["clients"], fds[1:]):
+        conn = socket.socket(fileno=fd)
+        conn.setblocking(True)
+        addr = tuple(entry["addr"])
+        state.admit_connection(addr[0])
+        state.claim_slot(conn, entry["spectator"])
+        if entry["spectator"]:
+            state.spectators.add(conn)
+        else:
+            state.add_client(conn)
+            name = entry["username"]
+            if name:
+                state.set_username(conn, name, record=False)
+                seat = detached_seat(name)
+                if seat:
+                    rebind_seat(conn, seat)
+        reader = FrameReader(conn, state.MAX_FRAME_SIZE)
+        reader.buffer = bytearray(entry["buffer"].encode("latin-1"))
+        inherited.append((conn, addr, reader))
+    print(f"[UPGRADE] Took over {len(inherited)} connections, room in phase {state.game_state}")
+    return listener, inherited
+
+
+def wait_readable(sock, timeout):
+    """select() on the listening socket without changing its blocking mode."""
+    readable, _, _ = select.select([sock], [], [], timeout)
+    return bool(readable)
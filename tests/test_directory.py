@@ -0,0 +1,43 @@
+import json
+import pytest
+from server.directory import parse_filter, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+DEFAULTS = {"open": False, "page": 0, "page_size": DEFAULT_PAGE_SIZE}
+
+
+def json_payload(**fields):
+    return json.dumps(fields)
+
+
+@pytest.mark.parametrize("payload", ["", "not json", "[1, 2]", "42", "null", '"day"', "{"])
+def test_bad_payloads_give_the_defaults(payload):
+    assert parse_filter(payload) == DEFAULTS
+
+
+def test_fields():
+    query = parse_filter('{"phase": "day", "open": true, "prefix": "ro", "page": 3, "page_size": 50}')
+    assert query == {"open": True, "page": 3, "page_size": 50, "phase": "day", "prefix": "ro"}
+
+
+@pytest.mark.parametrize("page_size, expected", [
+    (0, 1), (-5, 1), (MAX_PAGE_SIZE + 1, MAX_PAGE_SIZE), (10 ** 30, MAX_PAGE_SIZE),
+    ("12", 12), (7.9, 7), ("12.5", DEFAULT_PAGE_SIZE), (True, DEFAULT_PAGE_SIZE),
+    (None, DEFAULT_PAGE_SIZE), ([3], DEFAULT_PAGE_SIZE), ({"n": 3}, DEFAULT_PAGE_SIZE),
+])
+def test_page_size_is_clamped(page_size, expected):
+    assert parse_filter(json_payload(page_size=page_size))["page_size"] == expected
+
+
+@pytest.mark.parametrize("page, expected", [(-1, 0), (10 ** 9, 10 ** 6), (False, 0), ("x", 0)])
+def test_page_is_clamped(page, expected):
+    assert parse_filter(json_payload(page=page))["page"] == expected
+
+
+def test_overflowing_numbers():
+    assert parse_filter('{"page": 1e999, "page_size": NaN}') == DEFAULTS
+
+
+@pytest.mark.parametrize("value", ["", 3, None, ["day"], True])
+def test_empty_or_non_string_filters_are_dropped(value):
+    query = parse_filter(json_payload(phase=value, prefix=value))
+    assert "phase" not in query and "prefix" not in query
@@ -0,0 +1,52 @@
+import time
+from server import journal
+from server.journal import Journal, encode_record, read_journal, last_sequence
+
+
+def write(path, records):
+    with open(path, "wb") as f:
+        for record in records:
+            f.write(record)
+
+
+def test_read_journal_yields_records_after_a_sequence(tmp_path):
+    path = tmp_path / "main.journal"
+    write(path, [encode_record(1, journal.SEED, [42], 10.0),
+                 encode_record(2, journal.ROLE, ["alice", "seer"], 11.0),
+                 encode_record(3, journal.PHASE, ["night"], 12.0)])
+    records = list(read_journal(path))
+    assert records == [(1, journal.SEED, 10.0, ["42"]),
+                       (2, journal.ROLE, 11.0, ["alice", "seer"]),
+                       (3, journal.PHASE, 12.0, ["night"])]
+    assert [seq for seq, *_ in read_journal(path, after_seq=2)] == [3]
+    assert last_sequence(path) == 3
+
+
+def test_read_journal_stops_at_a_torn_or_corrupted_record(tmp_path):
+    path = tmp_path / "main.journal"
+    good = encode_record(1, journal.PHASE, ["day"])
+    torn = encode_record(2, journal.PHASE, ["night"])[:-2]
+    write(path, [good, torn])
+    assert [seq for seq, *_ in read_journal(path)] == [1]
+
+    corrupted = bytearray(encode_record(2, journal.PHASE, ["night"]))
+    corrupted[-1] ^= 0xFF
+    write(path, [good, bytes(corrupted), encode_record(3, journal.PHASE, ["day"])])
+    assert [seq for seq, *_ in read_journal(path)] == [1]
+
+
+def test_compact_drops_covered_records_but_keeps_the_sequence(tmp_path):
+    path = str(tmp_path / "main.journal")
+    log = Journal(path, commit_interval=0.001)
+    for i in range(10):
+        log.append(journal.VOTE, "day", f"p{i}", "x")
+    log.flush()
+    log.compact(7)
+    deadline = time.monotonic() + 2
+    while [seq for seq, *_ in read_journal(path)][:1] != [7] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    log.append(journal.VOTE, "day", "late", "x")
+    log.close()
+    # The last covered record stays so a restart goes on from the right sequence number
+    assert [seq for seq, *_ in read_journal(path)] == [7, 8, 9, 10, 11]
+    assert Journal(path).seq == 11
@@ -0,0 +1,76 @@
+import pytest
+from server.matchmaking import Matchmaker, ANY_SIZE
+
+
+@pytest.fixture
+def matchmaker(monkeypatch):
+    mm = Matchmaker(band_width=200, widen_after=30, sweep_interval=3600)
+    mm.formed = []
+    monkeypatch.setattr(mm, "form_room", mm.formed.append)
+    return mm
+
+
+def names(tickets):
+    return [t.name for t in tickets]
+
+
+def test_not_enough_tickets(matchmaker):
+    for i in range(5):
+        matchmaker.enqueue(f"c{i}", f"p{i}", 1000, size=6)
+    assert matchmaker._take(6, (5,)) is None
+    assert matchmaker.queued() == 5
+    assert not matchmaker.formed
+
+
+def test_oldest_first_and_sized_before_any(matchmaker):
+    # Queue more than a room without matching, to see what _take picks
+    matchmaker._take = lambda size, bands: None
+    matchmaker.enqueue("a0", "any0", 1000, queued=1.0)
+    matchmaker.enqueue("a1", "any1", 1050, queued=2.0)
+    for i in (3, 1, 0, 2):
+        matchmaker.enqueue(f"c{i}", f"p{i}", 1100, size=6, queued=10.0 + i)
+    del matchmaker._take
+    taken = matchmaker._take(6, (5,))
+    assert names(taken) == ["p0", "p1", "p2", "p3", "any0", "any1"]
+    assert not matchmaker.buckets and not matchmaker.tickets
+
+
+def test_take_leaves_the_rest_queued(matchmaker):
+    matchmaker._take = lambda size, bands: None
+    for i in range(3):
+        matchmaker.enqueue(f"a{i}", f"any{i}", 1000, queued=float(i))
+    for i in range(6):
+        matchmaker.enqueue(f"c{i}", f"p{i}", 1000, size=6, queued=10.0 + i)
+    del matchmaker._take
+    taken = matchmaker._take(6, (5,))
+    assert names(taken) == [f"p{i}" for i in range(6)]
+    assert (6, 5) not in matchmaker.buckets
+    assert names(matchmaker.buckets[(ANY_SIZE, 5)].values()) == ["any0", "any1", "any2"]
+    assert matchmaker.queued() == 3
+
+
+def test_neighboring_bands(matchmaker):
+    for i in range(3):
+        matchmaker.enqueue(f"l{i}", f"low{i}", 950, size=6)
+        matchmaker.enqueue(f"h{i}", f"high{i}", 1050, size=6)
+    assert matchmaker._take(6, (5,)) is None
+    taken = matchmaker._take(6, (4, 5))
+    assert sorted(names(taken)) == sorted([f"low{i}" for i in range(3)] + [f"high{i}" for i in range(3)])
+    assert not matchmaker.buckets and not matchmaker.tickets
+
+
+def test_enqueue_forms_a_full_room(matchmaker):
+    for i in range(6):
+        matchmaker.enqueue(f"c{i}", f"p{i}", 1000, size=6)
+    assert [names(match) for match in matchmaker.formed] == [[f"p{i}" for i in range(6)]]
+    assert not matchmaker.queued()
+    assert not matchmaker.buckets
+
+
+def test_requeued_ticket_keeps_its_place(matchmaker):
+    matchmaker.enqueue("a", "first", 1000, size=8, queued=1.0)
+    matchmaker.enqueue("b", "second", 1000, size=8, queued=2.0)
+    matchmaker.enqueue("c", "third", 1000, size=8, queued=3.0)
+    matchmaker.dequeue("b")
+    matchmaker.enqueue("b", "second", 1000, size=8, queued=2.0)
+    assert names(matchmaker.buckets[(8, 5)].values()) == ["first", "second", "third"]
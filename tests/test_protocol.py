@@ -0,0 +1,93 @@
+import socket
+import threading
+import time
+import pytest
+from common.protocol import FrameReader, FrameTooLarge, encode_message, decode_message
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    yield a, b
+    a.close()
+    b.close()
+
+
+def test_frames_split_across_and_within_chunks(pair):
+    a, b = pair
+    reader = FrameReader(a, chunk_size=4, poll_interval=0.05)
+    b.sendall(b"JOIN|alice\nMSG|hi")
+    b.sendall(b" there\n")
+    assert reader.read_frame() == "JOIN|alice"
+    assert reader.read_frame() == "MSG|hi there"
+
+
+def test_closed_peer_returns_none(pair):
+    a, b = pair
+    reader = FrameReader(a, poll_interval=0.05)
+    b.sendall(b"VOTE|bob\n")
+    b.close()
+    assert reader.read_frame() == "VOTE|bob"
+    assert reader.read_frame() is None
+
+
+def test_oversize_frame_is_refused(pair):
+    a, b = pair
+    reader = FrameReader(a, max_frame_size=16, chunk_size=8, poll_interval=0.05)
+    b.sendall(b"MSG|" + b"x" * 40 + b"\n")
+    with pytest.raises(FrameTooLarge):
+        reader.read_frame()
+
+
+def test_stream_without_newline_is_refused(pair):
+    a, b = pair
+    reader = FrameReader(a, max_frame_size=16, chunk_size=8, poll_interval=0.05)
+    b.sendall(b"x" * 30)
+    with pytest.raises(FrameTooLarge):
+        reader.read_frame()
+
+
+def test_parked_reader_keeps_unread_data_in_the_socket(pair):
+    a, b = pair
+    reader = FrameReader(a, poll_interval=0.02)
+    frames = []
+
+    def loop():
+        while True:
+            frame = reader.read_frame()
+            if frame is None:
+                return
+            frames.append(frame)
+            # Handling the frame takes a while
+            time.sleep(0.1)
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    b.sendall(b"A|1\n")
+    time.sleep(0.05)
+    # Returns once A has been handled
+    assert reader.park(timeout=2.0)
+    assert frames == ["A|1"]
+    b.sendall(b"B|2\n")
+    time.sleep(0.1)
+    assert frames == ["A|1"]
+    assert bytes(reader.buffer) == b""
+    reader.unpark()
+    b.close()
+    thread.join(2.0)
+    assert frames == ["A|1", "B|2"]
+
+
+def test_park_times_out_while_a_frame_is_handled(pair):
+    a, b = pair
+    reader = FrameReader(a, poll_interval=0.02)
+    b.sendall(b"A|1\n")
+    assert reader.read_frame() == "A|1"
+    # Never handled: the caller doesn't come back to read_frame
+    assert not reader.park(timeout=0.05)
+
+
+def test_encode_decode_round_trip():
+    frame = encode_message("WHISPER", "bob|see you|later")
+    assert frame.endswith("\n")
+    assert decode_message(frame.strip()) == ("WHISPER", "bob|see you|later")
@@ -0,0 +1,48 @@
+from server import ratelimit
+from server.ratelimit import TokenBucket, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_a_burst_then_throttles(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    bucket = TokenBucket(rate=1.0, capacity=3)
+    assert [bucket.consume() for _ in range(4)] == [True, True, True, False]
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    for _ in range(3):
+        bucket.consume()
+    clock.now += 0.5
+    assert bucket.consume()
+    assert not bucket.consume()
+    clock.now += 60
+    assert [bucket.consume() for _ in range(4)] == [True, True, True, False]
+
+
+def test_bucket_consumes_several_tokens(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, "monotonic", Clock())
+    bucket = TokenBucket(rate=1.0, capacity=5)
+    assert bucket.consume(4)
+    assert not bucket.consume(2)
+    assert bucket.consume(1)
+
+
+def test_rate_limiter_budgets_are_independent(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, "monotonic", Clock())
+    limiter = RateLimiter({"chat": (1.0, 1), "vote": (1.0, 2)})
+    assert limiter.allow("chat")
+    assert not limiter.allow("chat")
+    assert limiter.allow("vote")
+    # Budgets without a bucket are not limited
+    assert all(limiter.allow("other") for _ in range(10))
@@ -0,0 +1,77 @@
+import pytest
+from server.ratings import RatingEngine, expected_score, UPSERT_RATING
+
+
+class Store:
+    """Stats store stand-in: ratings to load, and the writes submitted."""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.submitted = []
+
+    def query(self, sql):
+        return self.rows
+
+    def submit(self, sql, rows):
+        self.submitted.append((sql, rows))
+
+
+@pytest.fixture
+def engine():
+    engine = RatingEngine(Store(), k=32.0, default=1500.0, flush_interval=3600)
+    yield engine
+    engine.close()
+
+
+def test_expected_score():
+    assert expected_score(1500, 1500) == 0.5
+    assert expected_score(1900, 1500) == pytest.approx(10 / 11)
+    assert expected_score(1500, 1900) == pytest.approx(1 / 11)
+    assert expected_score(1600, 1400) + expected_score(1400, 1600) == pytest.approx(1.0)
+
+
+def test_even_game(engine):
+    engine._update([("w", "werewolf"), ("v", "villager")], "villagers")
+    assert engine.rating("v") == (1516.0, 1)
+    assert engine.rating("w") == (1484.0, 1)
+    assert engine.dirty == {"v", "w"}
+
+
+def test_role_weights_within_a_team(engine):
+    players = [("w1", "werewolf"), ("w2", "werewolf"), ("seer", "seer"), ("witch", "witch"),
+               ("hunter", "hunter"), ("v", "villager")]
+    engine._update(players, "villagers")
+    gains = {name: engine.rating(name)[0] - 1500.0 for name, _ in players}
+    # The team moves by K/2 on average, shared out by role weight
+    assert gains["seer"] == pytest.approx(16 * 1.3 / 1.15)
+    assert gains["witch"] == pytest.approx(16 * 1.2 / 1.15)
+    assert gains["hunter"] == pytest.approx(16 * 1.1 / 1.15)
+    assert gains["v"] == pytest.approx(16 * 1.0 / 1.15)
+    assert sum(gains[name] for name in ("seer", "witch", "hunter", "v")) == pytest.approx(4 * 16)
+    assert gains["w1"] == gains["w2"] == pytest.approx(-16)
+
+
+def test_underdogs_win_more():
+    store = Store([("strong", 1800.0, 40), ("weak", 1400.0, 3)])
+    engine = RatingEngine(store, k=32.0, flush_interval=3600)
+    try:
+        engine._update([("strong", "werewolf"), ("weak", "villager")], "villagers")
+        gain = engine.rating("weak")[0] - 1400.0
+        assert gain == pytest.approx(32 * (1 - expected_score(1400, 1800)))
+        assert engine.rating("strong") == (pytest.approx(1800.0 - gain), 41)
+        assert engine.rating("weak")[1] == 4
+    finally:
+        engine.close()
+
+
+def test_one_team_changes_nothing(engine):
+    engine._update([("a", "villager"), ("b", "seer")], "villagers")
+    assert engine.ratings == {} and not engine.dirty
+
+
+def test_close_applies_and_flushes(engine):
+    engine.submit_game([{"name": "w", "role": "werewolf"}, {"name": "v", "role": "villager"}], "werewolves")
+    engine.close()
+    [(sql, rows)] = engine.store.submitted
+    assert sql == UPSERT_RATING and sorted(rows) == [("v", 1484.0, 1), ("w", 1516.0, 1)]
+    assert engine.leaderboard() == [("w", 1516.0, 1), ("v", 1484.0, 1)]
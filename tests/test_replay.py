@@ -0,0 +1,68 @@
+from common import replay
+from common.replay import ReplayFile, ReplaySpool, write_replay, phase_position, SETUP, NIGHT, DAY, END
+
+
+def checkpoint(phase, day):
+    return {"phase": phase, "day": day, "players": [{"name": "alice", "role": "seer", "alive": True}]}
+
+
+PHASES = [(SETUP, 0, 0, checkpoint("setup", 0)),
+          (NIGHT, 1, 2, checkpoint("night", 1)),
+          (DAY, 1, 4, checkpoint("day", 1)),
+          (NIGHT, 2, 7, checkpoint("night", 2)),
+          (END, 2, 8, checkpoint("end", 2))]
+EVENTS = [(0.1 * i, f"MSG|event {i}", replay.SECRET if i % 3 == 0 else 0) for i in range(9)]
+
+
+def test_phase_positions():
+    assert phase_position(SETUP, 0) == 0
+    assert [phase_position(NIGHT, day) for day in (1, 2, 3)] == [1, 3, 5]
+    assert [phase_position(DAY, day) for day in (1, 2, 3)] == [2, 4, 6]
+
+
+def test_phase_index(tmp_path):
+    path = tmp_path / "game.replay"
+    write_replay(str(path), 1000.0, EVENTS, PHASES)
+    r = ReplayFile(path)
+    try:
+        assert r.start_time == 1000.0 and r.event_count == 9 and r.phase_count == 5
+        assert list(r.phases()) == [(SETUP, 0, 0, 2), (NIGHT, 1, 2, 2), (DAY, 1, 4, 3),
+                                    (NIGHT, 2, 7, 1), (END, 2, 8, 1)]
+        assert r.find_phase(NIGHT, 2) == 3
+        assert r.find_phase(DAY, 1) == 2
+        assert r.find_phase(DAY, 2) is None
+        assert r.find_phase(END) == 4
+        assert r.checkpoint(3) == checkpoint("night", 2)
+        assert [r.phase_of_event(i) for i in range(9)] == [0, 0, 1, 1, 2, 2, 2, 3, 4]
+        assert r.event(3) == (0.30000000000000004, "MSG", "event 3", replay.SECRET)
+        assert [payload for _, _, payload, _ in r.events(4, 7)] == ["event 4", "event 5", "event 6"]
+    finally:
+        r.close()
+
+
+def test_spool_goes_on_from_a_saved_state(tmp_path):
+    path = str(tmp_path / "game.replay")
+    spool = ReplaySpool(path, 1000.0)
+    spool.add_phase(SETUP, 0, checkpoint("setup", 0))
+    spool.add_events(EVENTS[:2])
+    spool.add_phase(NIGHT, 1, checkpoint("night", 1))
+    spool.add_events(EVENTS[2:3])
+    saved = spool.state()
+    # Written after the save, dropped when going on from it
+    spool.add_events(EVENTS[3:5])
+    spool.records.close()
+    spool.strings.close()
+
+    spool = ReplaySpool(path, 1000.0, saved["phases"], saved["events"], saved["strings"])
+    spool.add_events(EVENTS[3:4])
+    spool.add_phase(DAY, 1, checkpoint("day", 1))
+    spool.finish()
+
+    r = ReplayFile(path)
+    try:
+        assert list(r.phases()) == [(SETUP, 0, 0, 2), (NIGHT, 1, 2, 2), (DAY, 1, 4, 0)]
+        assert [payload for _, _, payload, _ in r.events()] == [f"event {i}" for i in range(4)]
+        assert r.checkpoint(2) == checkpoint("day", 1)
+    finally:
+        r.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["game.replay"]
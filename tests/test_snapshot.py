@@ -0,0 +1,63 @@
+import pytest
+from server import journal, snapshot
+from server.journal import encode_record
+from server.snapshot import apply_event, seat_for
+from server.state import GameState, in_room
+
+
+def write(path, records):
+    with open(path, "wb") as f:
+        for record in records:
+            f.write(record)
+
+
+@pytest.fixture
+def room():
+    room = GameState("test")
+    with in_room(room):
+        yield room
+    room.spectators.close()
+
+
+def test_apply_event_rebuilds_a_game(room):
+    apply_event(journal.SEED, ["7"], 123.0)
+    for name, role in [("alice", "werewolf"), ("bob", "seer"), ("carol", "witch"), ("dave", "villager")]:
+        apply_event(journal.ROLE, [name, role])
+    apply_event(journal.PHASE, ["night"])
+    assert room.seed == 7 and room.game_started == 123.0
+    assert room.day == 1 and room.game_state == "night"
+    assert room.night_pending == {"seer", "wolves", "witch"}
+
+    apply_event(journal.VOTE, ["night", "alice", "dave"])
+    apply_event(journal.ACTION, ["wolves", "target", "dave"])
+    apply_event(journal.ACTION, ["bob", "seer", "alice"])
+    assert room.night_pending == {"witch"}
+    assert room.night_victim is seat_for("dave")
+    apply_event(journal.ACTION, ["carol", "witch_save"])
+    assert room.night_saved and not room.night_pending
+
+    apply_event(journal.PHASE, ["day"])
+    assert room.game_state == "day" and not room.votes
+    apply_event(journal.VOTE, ["day", "bob", "alice"])
+    apply_event(journal.KILL, ["alice"])
+    assert not room.players[seat_for("alice")]["alive"]
+    assert room.vote_log == [(1, "night", "alice", "dave"), (1, "day", "bob", "alice")]
+
+    apply_event(journal.END, [])
+    assert room.game_state == "end"
+    apply_event(journal.RESTART, [])
+    assert not room.players
+
+
+def test_restore_room_replays_the_journal_tail(room, tmp_path):
+    room.JOURNAL_DIR = str(tmp_path)
+    data = {"phase": "night", "players": [{"name": "alice", "role": "werewolf", "alive": True},
+                                          {"name": "bob", "role": "villager", "alive": True}],
+            "votes": {}, "night": {"pending": ["wolves"], "victim": None, "saved": False, "poisoned": None},
+            "large_room": False, "vote_stage": None, "nominees": {}, "seq": 2}
+    snapshot.write_snapshot(data)
+    write(tmp_path / "test.journal", [encode_record(2, journal.PHASE, ["night"]),
+                                      encode_record(3, journal.KILL, ["bob"])])
+    assert snapshot.restore_room() == 1
+    assert room.game_state == "night"
+    assert not room.players[seat_for("bob")]["alive"]
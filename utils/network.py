@@ -1,19 +1,51 @@
-"""This module provides utility functions for broadcasting messages to clients."""
+"""This module provides utility functions for sending and broadcasting messages to clients."""
 
 from server.state import state
+from server.outbox import CONTROL
+from server.channels import PUBLIC, WOLVES, DEAD, dm
+
+
+def send(conn, message, lane=CONTROL):
+    """
+    Send a framed message to one client through its outbox.
+    Relayed player chat passes lane=CHAT, everything else is game-critical
+    and delivered before queued chat messages.
+    """
+    data = (message.rstrip("\n") + "\n").encode()
+    outbox = state.outboxes.get(conn)
+    try:
+        if outbox is None:
+            conn.sendall(data)
+        else:
+            outbox.put(data, lane)
+    except OSError:
+        # Ignore errors sending to disconnected clients
+        pass
+
 
 def broadcast(sender_conn, message):
     """
     Send a message to all clients except the sender.
     """
     # Iterate over all connected clients
-    for client in state.clients:
+    for client in list(state.clients):
         # Don't send to the sender
         if client != sender_conn:
-            try:
-                # Ensure the message ends with a newline before sending
-                formatted_message = message if message.endswith("\n") else message + "\n"
-                client.sendall(formatted_message.encode())
-            except:
-                # Ignore errors sending to disconnected clients
-                pass
\ No newline at end of file
+            send(client, message)
+    # Everything broadcast to the room is public, relay it to spectators
+    state.spectators.publish(message)
+    state.replay_frame(message)
+
+
+def publish(channel, message, exclude=None, lane=CONTROL):
+    """
+    Send a message to every member of a channel except `exclude`.
+    Costs O(members) whatever the size of the room.
+    """
+    for client in state.channels.members(channel):
+        if client != exclude:
+            send(client, message, lane)
+    if channel == PUBLIC:
+        state.spectators.publish(message)
+    state.replay_frame(message, secret=channel in (WOLVES, DEAD) or channel.startswith(dm("")))
+